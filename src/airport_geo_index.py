@@ -0,0 +1,250 @@
+import math
+import threading
+import time
+import numpy as np
+from background_index import BackgroundIndex
+
+# Every airport is read once to build the index
+AIRPORT_GEO_INDEX_QUERY = """
+    SELECT META(airport).id,
+        airport.airportname,
+        airport.city,
+        airport.country,
+        airport.faa,
+        airport.geo,
+        airport.icao,
+        airport.tz
+    FROM airport AS airport
+"""
+
+# Fields of an airport returned by lookups, like the airport list
+AIRPORT_FIELDS = ("airportname", "city", "country", "faa", "geo", "icao", "tz")
+
+# Mean radius of the Earth
+EARTH_RADIUS_KM = 6371.0
+
+# Size of the grid cells in degrees of latitude and longitude
+CELL_DEGREES = 2.0
+LAT_CELLS = int(180 / CELL_DEGREES)
+LON_CELLS = int(360 / CELL_DEGREES)
+
+# Radius of the first nearest-airport search, multiplied by 4 until enough
+# airports are found
+NEAREST_START_KM = 250.0
+
+
+def coordinates(doc: dict):
+    """(lat, lon) of an airport document in degrees, or None without valid geo"""
+    geo = doc.get("geo")
+    if not isinstance(geo, dict):
+        return None
+    lat, lon = geo.get("lat"), geo.get("lon")
+    if not all(
+        isinstance(value, (int, float)) and not isinstance(value, bool)
+        for value in (lat, lon)
+    ):
+        return None
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        return None
+    return float(lat), float(lon)
+
+
+def cell_row(lat):
+    return np.minimum(((lat + 90) // CELL_DEGREES).astype(np.int64), LAT_CELLS - 1)
+
+
+def cell_column(lon):
+    return ((lon + 180) // CELL_DEGREES).astype(np.int64) % LON_CELLS
+
+
+def haversine_km(lat, lon, lats, lons) -> np.ndarray:
+    """Great-circle distances from a point to arrays of points, all in radians"""
+    a = (
+        np.sin((lats - lat) / 2) ** 2
+        + math.cos(lat) * np.cos(lats) * np.sin((lons - lon) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+class GeoGrid(object):
+    """Airports bucketed in a latitude/longitude grid
+
+    The airports are sorted by cell number, row * LON_CELLS + column, so the
+    airports of a run of cells in one row are a contiguous slice found with a
+    binary search. A radius search reads the cells of the bounding box of the
+    circle and then computes the exact distance to each airport in them.
+    """
+
+    def __init__(self, airports: dict) -> None:
+        located = [
+            (id, fields, point)
+            for id, (fields, point) in airports.items()
+            if point is not None
+        ]
+        points = np.array([point for _, _, point in located], dtype=np.float64)
+        points = points.reshape(-1, 2)
+        cells = cell_row(points[:, 0]) * LON_CELLS + cell_column(points[:, 1])
+        order = np.argsort(cells, kind="stable")
+        self.cells = cells[order]
+        # ID and returned fields of the airport at each position
+        self.airports = [located[i][:2] for i in order]
+        self.lats = np.radians(points[order, 0])
+        self.lons = np.radians(points[order, 1])
+
+    def candidates(self, lat: float, lon: float, radius: float) -> np.ndarray:
+        """Positions of the airports in the cells of the circle's bounding box
+
+        The bounding box follows J. P. Matuschek, "Finding Points Within a
+        Distance of a Latitude/Longitude Using Bounding Coordinates". A circle
+        reaching over a pole spans every longitude.
+        """
+        angle = radius / EARTH_RADIUS_KM
+        lat_min = math.degrees(math.radians(lat) - angle)
+        lat_max = math.degrees(math.radians(lat) + angle)
+        if lat_min <= -90 or lat_max >= 90 or angle >= math.pi / 2:
+            columns = [(0, LON_CELLS - 1)]
+            lat_min, lat_max = max(lat_min, -90.0), min(lat_max, 90.0)
+        else:
+            delta = math.degrees(
+                math.asin(min(1.0, math.sin(angle) / math.cos(math.radians(lat))))
+            )
+            first = int(cell_column(np.array(lon - delta)))
+            last = int(cell_column(np.array(lon + delta)))
+            # A box across the antimeridian wraps to the start of the row
+            columns = (
+                [(first, last)]
+                if first <= last
+                else [(first, LON_CELLS - 1), (0, last)]
+            )
+        rows = range(
+            int(cell_row(np.array(lat_min))), int(cell_row(np.array(lat_max))) + 1
+        )
+        bounds = np.array(
+            [
+                (row * LON_CELLS + first, row * LON_CELLS + last + 1)
+                for row in rows
+                for first, last in columns
+            ]
+        )
+        starts = np.searchsorted(self.cells, bounds[:, 0])
+        ends = np.searchsorted(self.cells, bounds[:, 1])
+        return np.concatenate(
+            [np.arange(start, end) for start, end in zip(starts, ends) if end > start]
+            or [np.empty(0, dtype=np.int64)]
+        )
+
+    def within(self, lat: float, lon: float, radius: float):
+        """Positions and distances of the airports within radius km, nearest first"""
+        positions = self.candidates(lat, lon, radius)
+        distances = haversine_km(
+            math.radians(lat),
+            math.radians(lon),
+            self.lats[positions],
+            self.lons[positions],
+        )
+        inside = distances <= radius
+        positions, distances = positions[inside], distances[inside]
+        order = np.argsort(distances, kind="stable")
+        return positions[order], distances[order]
+
+    def nearest(self, lat: float, lon: float, limit: int, radius: float = None):
+        """The `limit` nearest airports, optionally within radius km
+
+        Without a radius the search widens until it finds `limit` airports.
+        Those are the nearest ones, since every airport outside the searched
+        circle is further away than every airport inside it.
+        """
+        if radius is not None:
+            positions, distances = self.within(lat, lon, radius)
+            return positions[:limit], distances[:limit]
+        search = NEAREST_START_KM
+        while True:
+            positions, distances = self.within(lat, lon, search)
+            if len(positions) >= limit or search >= math.pi * EARTH_RADIUS_KM:
+                return positions[:limit], distances[:limit]
+            search *= 4
+
+
+class AirportGeoIndex(BackgroundIndex):
+    """In-memory spatial index of the airport coordinates
+
+    The index is loaded in a background thread and then kept up to date by the
+    airport write endpoints. The grid is rebuilt on the first lookup after a
+    write.
+    """
+
+    name = "airport_geo"
+
+    def __init__(self) -> None:
+        super().__init__()
+        # Airport ID -> (fields returned by lookups, (lat, lon) or None)
+        self._airports = {}
+        # Rebuilt on first lookup after the airports change
+        self._grid = None
+        # Writes made while a load is running, applied on top of the loaded data
+        self._pending = None
+        self._lock = threading.Lock()
+
+    def load(self, client) -> None:
+        """Read all airports and replace the index with them"""
+        started = time.monotonic()
+        with self._lock:
+            self._pending = {}
+        try:
+            airports = {
+                row["id"]: self._entry(row)
+                for row in client.query(AIRPORT_GEO_INDEX_QUERY)
+            }
+        except Exception:
+            with self._lock:
+                self._pending = None
+            raise
+        grid = GeoGrid(airports)
+        with self._lock:
+            for id, entry in self._pending.items():
+                if entry is None:
+                    airports.pop(id, None)
+                else:
+                    airports[id] = entry
+            self._airports = airports
+            self._grid = grid if not self._pending else None
+            self._pending = None
+            self.loaded(started)
+
+    @staticmethod
+    def _entry(doc: dict) -> tuple:
+        return {f: doc[f] for f in AIRPORT_FIELDS if f in doc}, coordinates(doc)
+
+    def put_airport(self, id: str, doc: dict) -> None:
+        """Add or replace an airport after it was written"""
+        entry = self._entry(doc)
+        with self._lock:
+            if self._pending is not None:
+                self._pending[id] = entry
+            self._airports[id] = entry
+            self._grid = None
+
+    def remove_airport(self, id: str) -> None:
+        """Drop an airport after it was deleted"""
+        with self._lock:
+            if self._pending is not None:
+                self._pending[id] = None
+            if self._airports.pop(id, None) is not None:
+                self._grid = None
+
+    def nearest(self, lat: float, lon: float, limit: int, radius: float = None) -> list:
+        """Airports nearest to a point, with their `id` and `distance` in km"""
+        with self._lock:
+            if self._grid is None:
+                self._grid = GeoGrid(self._airports)
+            grid = self._grid
+        positions, distances = grid.nearest(lat, lon, limit, radius)
+        results = []
+        for position, distance in zip(positions.tolist(), distances.tolist()):
+            id, fields = grid.airports[position]
+            results.append(dict(fields, id=id, distance=distance))
+        return results
+
+    def size(self) -> int:
+        with self._lock:
+            return len(self._airports)
@@ -0,0 +1,227 @@
+from flask import Response
+from flask_restx import Namespace, fields
+from extensions import (
+    couchbase_db,
+    route_index,
+    route_snapshot,
+    airport_geo_index,
+    hotel_index,
+    read_replica,
+    metrics,
+    tracer,
+)
+from tracing import InMemoryExporter
+from api.resource import TracedResource
+from api.serialization import serialize_with, serialize_list_with
+
+admin_ns = Namespace(
+    "Admin", description="Operational APIs for the application", ordered=True
+)
+
+cache_stats_model = admin_ns.model(
+    "Cache Stats",
+    {
+        "enabled": fields.Boolean(description="Whether the cache is enabled"),
+        "reads": fields.Integer(description="KV gets sent to the cluster"),
+        "coalesced": fields.Integer(
+            description="KV gets that waited for a read of the same key in flight"
+        ),
+        "size": fields.Integer(description="Documents currently cached"),
+        "max_size": fields.Integer(description="Maximum number of cached documents"),
+        "hits": fields.Integer(description="Gets answered from the cache"),
+        "misses": fields.Integer(description="Gets that went to the cluster"),
+        "hit_ratio": fields.Float(description="hits / (hits + misses)"),
+        "evictions": fields.Integer(description="Documents evicted to stay in size"),
+        "expirations": fields.Integer(description="Documents dropped after their TTL"),
+        "invalidations": fields.Integer(description="Documents dropped by writes"),
+    },
+)
+
+
+@admin_ns.route("/cache")
+class CacheStats(TracedResource):
+    @admin_ns.doc(
+        description="Get the counters of the read-through document cache. \n\n The cache is enabled by setting `DOC_CACHE_SIZE` and answers repeated [Key Value](https://docs.couchbase.com/python-sdk/current/howtos/kv-operations.html) gets from memory. The counters help to size the cache and show how much load it takes off the Data service.\n\n Concurrent gets of the same document share one KV read whether or not the cache is enabled; `coalesced` counts the gets that joined a read in flight.\n\n Code: [`api/admin.py`](https://github.com/couchbase-examples/python-quickstart/blob/main/src/api/admin.py) \n Class: `CacheStats` \n Method: `get`",
+        responses={200: "Cache counters"},
+    )
+    @serialize_with(admin_ns, cache_stats_model, skip_none=True)
+    def get(self):
+        return couchbase_db.cache_stats()
+
+
+filter_cache_stats_model = admin_ns.model(
+    "Filter Cache Stats",
+    {
+        "enabled": fields.Boolean(description="Whether the cache is enabled"),
+        "searches": fields.Integer(description="FTS searches sent to the cluster"),
+        "coalesced": fields.Integer(
+            description="Searches that waited for an identical search in flight"
+        ),
+        "size": fields.Integer(description="Searches currently cached"),
+        "max_size": fields.Integer(description="Maximum number of cached searches"),
+        "hits": fields.Integer(description="Searches answered from the cache"),
+        "misses": fields.Integer(description="Searches not found in the cache"),
+        "hit_ratio": fields.Float(description="hits / (hits + misses)"),
+        "evictions": fields.Integer(description="Searches evicted to stay in size"),
+        "expirations": fields.Integer(description="Searches dropped after their TTL"),
+    },
+)
+
+
+@admin_ns.route("/filter-cache")
+class FilterCacheStats(TracedResource):
+    @admin_ns.doc(
+        description="Get the counters of the hotel filter cache. \n\n The cache is enabled by setting `FILTER_CACHE_SIZE` and answers repeated [Search](https://docs.couchbase.com/python-sdk/current/howtos/full-text-searching-with-sdk.html#search-queries) filters from memory for `FILTER_CACHE_TTL` seconds. Identical searches arriving while one is in flight wait for it instead of sending their own.\n\n Code: [`api/admin.py`](https://github.com/couchbase-examples/python-quickstart/blob/main/src/api/admin.py) \n Class: `FilterCacheStats` \n Method: `get`",
+        responses={200: "Filter cache counters"},
+    )
+    @serialize_with(admin_ns, filter_cache_stats_model, skip_none=True)
+    def get(self):
+        return couchbase_db.filter_cache_stats()
+
+
+statement_stats_model = admin_ns.model(
+    "Statement Stats",
+    {
+        "name": fields.String(description="Statement name"),
+        "prepared": fields.Boolean(
+            description="Whether the statement runs as a prepared statement"
+        ),
+        "executions": fields.Integer(
+            description="Times the statement was run on the query service"
+        ),
+        "errors": fields.Integer(description="Runs that failed"),
+    },
+)
+
+
+@admin_ns.route("/statements")
+class StatementStats(TracedResource):
+    @admin_ns.doc(
+        description="Get the counters of the registered SQL++ statements. \n\n When `DB_PREPARED_STATEMENTS` is enabled, the statements run as [prepared statements](https://docs.couchbase.com/python-sdk/current/howtos/n1ql-queries-with-sdk.html#prepared-statements-for-query-optimization) so the query service plans each of them once and reuses the plan. The counters cover the runs sent to the query service, not those answered by the read replica.\n\n Code: [`api/admin.py`](https://github.com/couchbase-examples/python-quickstart/blob/main/src/api/admin.py) \n Class: `StatementStats` \n Method: `get`",
+        responses={200: "Statement counters"},
+    )
+    @serialize_list_with(admin_ns, statement_stats_model)
+    def get(self):
+        return couchbase_db.statement_stats()
+
+
+index_stats_model = admin_ns.model(
+    "Index Stats",
+    {
+        "name": fields.String(description="Index name"),
+        "ready": fields.Boolean(description="Whether the first load has completed"),
+        "entries": fields.Integer(description="Documents held by the index"),
+        "loads": fields.Integer(description="Completed loads of the index"),
+        "loaded_at": fields.Float(description="Unix time of the last load"),
+        "load_seconds": fields.Float(description="Duration of the last load"),
+    },
+)
+
+
+@admin_ns.route("/indexes")
+class IndexStats(TracedResource):
+    @admin_ns.doc(
+        description="Get the state of the in-memory indexes. \n\n The indexes are loaded from the cluster with [SQL++ queries](https://docs.couchbase.com/python-sdk/current/howtos/n1ql-queries-with-sdk.html) in the background and kept up to date by the write endpoints. Lookups fall back to the cluster until an index is ready. The read replica is listed when it is enabled.\n\n Code: [`api/admin.py`](https://github.com/couchbase-examples/python-quickstart/blob/main/src/api/admin.py) \n Class: `IndexStats` \n Method: `get`",
+        responses={200: "Index states"},
+    )
+    @serialize_list_with(admin_ns, index_stats_model)
+    def get(self):
+        indexes = [
+            route_index.stats(),
+            route_snapshot.stats(),
+            airport_geo_index.stats(),
+            hotel_index.stats(),
+        ]
+        if read_replica.path is not None:
+            indexes.append(read_replica.stats())
+        return indexes
+
+
+slow_operation_model = admin_ns.model(
+    "Slow Operation",
+    {
+        "operation": fields.String(description="query or search"),
+        "name": fields.String(
+            description="Statement name, the statement itself for ad hoc queries, or the search index"
+        ),
+        "parameters": fields.Raw(description="Parameters of the query or search"),
+        "finished_at": fields.Float(description="Unix time the operation finished"),
+        "duration_ms": fields.Float(
+            description="Time from sending the operation to reading its last row"
+        ),
+        "elapsed_ms": fields.Float(description="Query service elapsed time"),
+        "execution_ms": fields.Float(description="Query service execution time"),
+        "result_count": fields.Integer(description="Rows returned by the query"),
+        "result_size": fields.Integer(description="Bytes returned by the query"),
+        "took_ms": fields.Float(description="Search service time"),
+        "total_hits": fields.Integer(description="Documents matching the search"),
+    },
+)
+
+
+@admin_ns.route("/slow-operations")
+class SlowOperations(TracedResource):
+    @admin_ns.doc(
+        description="Get the most recent slow SQL++ queries and searches, newest first. \n\n The log is enabled by setting `SLOW_LOG_THRESHOLD_MS`, and this returns 404 without it; every [SQL++ query](https://docs.couchbase.com/python-sdk/current/howtos/n1ql-queries-with-sdk.html) or [Search](https://docs.couchbase.com/python-sdk/current/howtos/full-text-searching-with-sdk.html) taking at least that long is kept with its parameters and the metrics reported by the cluster, up to `SLOW_LOG_SIZE` entries.\n\n Code: [`api/admin.py`](https://github.com/couchbase-examples/python-quickstart/blob/main/src/api/admin.py) \n Class: `SlowOperations` \n Method: `get`",
+        responses={200: "Slow operations", 404: "Slow operation log is disabled"},
+    )
+    @serialize_list_with(admin_ns, slow_operation_model, skip_none=True)
+    def get(self):
+        if couchbase_db.slow_log is None:
+            return "Slow operation log is disabled", 404
+        return couchbase_db.slow_operations()
+
+
+span_model = admin_ns.model(
+    "Span",
+    {
+        "span_id": fields.String(description="Span ID"),
+        "parent_id": fields.String(
+            description="ID of the parent span, or of the caller's span for the root"
+        ),
+        "name": fields.String(
+            description="Route of the request, validate, serialize or couchbase.<operation>"
+        ),
+        "start_time": fields.Float(description="Unix time the span started"),
+        "duration_ms": fields.Float(description="Duration of the span"),
+        "attributes": fields.Raw(description="Status code, target and errors"),
+    },
+)
+
+trace_model = admin_ns.model(
+    "Trace",
+    {
+        "trace_id": fields.String(description="Trace ID"),
+        "spans": fields.List(
+            fields.Nested(span_model), description="Root span first, then children"
+        ),
+    },
+)
+
+
+@admin_ns.route("/traces")
+class Traces(TracedResource):
+    @admin_ns.doc(
+        description="Get the most recent sampled request traces, newest first. \n\n A share `TRACE_SAMPLE_RATE` of the requests, and every request whose `traceparent` header is sampled, get a root span with child spans for payload validation, every [Key Value](https://docs.couchbase.com/python-sdk/current/howtos/kv-operations.html), [SQL++](https://docs.couchbase.com/python-sdk/current/howtos/n1ql-queries-with-sdk.html) and [Search](https://docs.couchbase.com/python-sdk/current/howtos/full-text-searching-with-sdk.html) operation and response serialization. The last `TRACE_BUFFER_SIZE` traces are kept when `TRACE_EXPORTER` is `memory`, the default.\n\n Code: [`api/admin.py`](https://github.com/couchbase-examples/python-quickstart/blob/main/src/api/admin.py) \n Class: `Traces` \n Method: `get`",
+        responses={200: "Traces"},
+    )
+    @serialize_list_with(admin_ns, trace_model)
+    def get(self):
+        if not isinstance(tracer.exporter, InMemoryExporter):
+            return []
+        return [
+            {"trace_id": spans[0]["trace_id"], "spans": spans}
+            for spans in tracer.exporter.traces()
+        ]
+
+
+@admin_ns.route("/metrics")
+class MetricsExposition(TracedResource):
+    @admin_ns.doc(
+        description="Get the latency histograms of the application in the [Prometheus text format](https://prometheus.io/docs/instrumenting/exposition_formats/). \n\n `http_request_duration_seconds` covers every request by method, route and status code; its `_count` is the number of requests. `couchbase_operation_duration_seconds` covers every operation sent to the cluster: [Key Value](https://docs.couchbase.com/python-sdk/current/howtos/kv-operations.html) operations by collection, [SQL++ queries](https://docs.couchbase.com/python-sdk/current/howtos/n1ql-queries-with-sdk.html) by statement and [Search](https://docs.couchbase.com/python-sdk/current/howtos/full-text-searching-with-sdk.html) queries by index. Metrics are recorded unless `METRICS` is set to `false`.\n\n Code: [`api/admin.py`](https://github.com/couchbase-examples/python-quickstart/blob/main/src/api/admin.py) \n Class: `MetricsExposition` \n Method: `get`",
+        responses={200: "Metrics in the Prometheus text format"},
+    )
+    def get(self):
+        return Response(
+            metrics.expose(), content_type="text/plain; version=0.0.4; charset=utf-8"
+        )
@@ -1,6 +1,15 @@
-from flask_restx import Namespace, fields, Resource
+from flask_restx import Namespace, fields
 from flask import request
-from extensions import couchbase_db
+from extensions import couchbase_db, route_index
+from api.resource import TracedResource
+from api.serialization import serialize_with, serialize_list_with
+from api.pagination import encode_name_cursor, decode_name_cursor
+from api.streaming import (
+    STREAM_PARAM,
+    stream_format,
+    stream_rows,
+)
+from api.bulk import BulkIngest, bulk_report_model, DEFAULT_WINDOW, MAX_WINDOW
 from couchbase.exceptions import (
     CouchbaseException,
     DocumentExistsException,
@@ -9,6 +18,135 @@ from couchbase.exceptions import (
 
 AIRLINE_COLLECTION = "airline"
 
+AIRLINE_LIST_QUERY = """
+    SELECT META(airline).id,
+        airline.callsign,
+        airline.country,
+        airline.iata,
+        airline.icao,
+        airline.name
+    FROM airline as airline
+    ORDER BY airline.name, META(airline).id
+    LIMIT $limit
+    OFFSET $offset;
+"""
+
+AIRLINE_LIST_BY_COUNTRY_QUERY = """
+    SELECT META(airline).id,
+        airline.callsign,
+        airline.country,
+        airline.iata,
+        airline.icao,
+        airline.name
+    FROM airline as airline
+    WHERE airline.country=$country
+    ORDER BY airline.name, META(airline).id
+    LIMIT $limit
+    OFFSET $offset;
+"""
+
+# Keyset pagination: seek past the (name, id) of the previous page's last row
+AIRLINE_LIST_AFTER_QUERY = """
+    SELECT META(airline).id,
+        airline.callsign,
+        airline.country,
+        airline.iata,
+        airline.icao,
+        airline.name
+    FROM airline as airline
+    WHERE airline.name >= $after_name
+        AND [airline.name, META(airline).id] > [$after_name, $after_id]
+    ORDER BY airline.name, META(airline).id
+    LIMIT $limit;
+"""
+
+AIRLINE_LIST_BY_COUNTRY_AFTER_QUERY = """
+    SELECT META(airline).id,
+        airline.callsign,
+        airline.country,
+        airline.iata,
+        airline.icao,
+        airline.name
+    FROM airline as airline
+    WHERE airline.country=$country
+        AND airline.name >= $after_name
+        AND [airline.name, META(airline).id] > [$after_name, $after_id]
+    ORDER BY airline.name, META(airline).id
+    LIMIT $limit;
+"""
+
+# Keyset pagination past a row without a name. Those rows sort first, the ones
+# whose name is MISSING before the ones where it is NULL, each by ID
+AIRLINE_LIST_AFTER_UNNAMED_QUERY = """
+    SELECT META(airline).id,
+        airline.callsign,
+        airline.country,
+        airline.iata,
+        airline.icao,
+        airline.name
+    FROM airline as airline
+    WHERE airline.name IS VALUED
+        OR (airline.name IS NULL
+            AND ($after_missing OR META(airline).id > $after_id))
+        OR (airline.name IS MISSING
+            AND $after_missing AND META(airline).id > $after_id)
+    ORDER BY airline.name, META(airline).id
+    LIMIT $limit;
+"""
+
+AIRLINE_LIST_BY_COUNTRY_AFTER_UNNAMED_QUERY = """
+    SELECT META(airline).id,
+        airline.callsign,
+        airline.country,
+        airline.iata,
+        airline.icao,
+        airline.name
+    FROM airline as airline
+    WHERE airline.country=$country
+        AND (airline.name IS VALUED
+            OR (airline.name IS NULL
+                AND ($after_missing OR META(airline).id > $after_id))
+            OR (airline.name IS MISSING
+                AND $after_missing AND META(airline).id > $after_id))
+    ORDER BY airline.name, META(airline).id
+    LIMIT $limit;
+"""
+
+AIRLINES_TO_AIRPORT_QUERY = """
+    SELECT air.callsign,
+        air.country,
+        air.iata,
+        air.icao,
+        air.name
+    FROM (
+        SELECT DISTINCT META(airline).id AS airlineId
+        FROM route
+        JOIN airline ON route.airlineid = META(airline).id
+        WHERE route.destinationairport = $airport
+    ) AS subquery
+    JOIN airline AS air ON META(air).id = subquery.airlineId
+    ORDER BY air.name
+    LIMIT $limit
+    OFFSET $offset;
+"""
+
+# Run by name with query_statement, optionally as prepared statements
+couchbase_db.register_statement("airline_list", AIRLINE_LIST_QUERY)
+couchbase_db.register_statement(
+    "airline_list_by_country", AIRLINE_LIST_BY_COUNTRY_QUERY
+)
+couchbase_db.register_statement("airline_list_after", AIRLINE_LIST_AFTER_QUERY)
+couchbase_db.register_statement(
+    "airline_list_by_country_after", AIRLINE_LIST_BY_COUNTRY_AFTER_QUERY
+)
+couchbase_db.register_statement(
+    "airline_list_after_unnamed", AIRLINE_LIST_AFTER_UNNAMED_QUERY
+)
+couchbase_db.register_statement(
+    "airline_list_by_country_after_unnamed", AIRLINE_LIST_BY_COUNTRY_AFTER_UNNAMED_QUERY
+)
+couchbase_db.register_statement("airlines_to_airport", AIRLINES_TO_AIRPORT_QUERY)
+
 airline_ns = Namespace("Airline", description="Airline related APIs", ordered=True)
 
 airline_model = airline_ns.model(
@@ -29,7 +167,7 @@ airline_model = airline_ns.model(
 
 @airline_ns.route("/<id>")
 @airline_ns.doc(params={"id": "Airline ID like airline_10"})
-class AirlineId(Resource):
+class AirlineId(TracedResource):
     @airline_ns.doc(
         description="Create Airline with specified ID.\n\n This provides an example of using [Key Value operations](https://docs.couchbase.com/python-sdk/current/howtos/kv-operations.html) in Couchbase to create a new document with a specified ID.\n\n Key Value operations are unique to Couchbase and provide very high speed get/set/delete operations.\n\n Code: [`api/airline.py`](https://github.com/couchbase-examples/python-quickstart/blob/main/src/api/airline.py) \n Class: `AirlineId` \n Method: `post`",
         responses={
@@ -43,6 +181,7 @@ class AirlineId(Resource):
         try:
             data = request.json
             couchbase_db.insert_document(AIRLINE_COLLECTION, key=id, doc=data)
+            route_index.put_airline(id, data)
             return data, 201
         except DocumentExistsException:
             return "Airline already exists", 409
@@ -57,7 +196,7 @@ class AirlineId(Resource):
             500: "Unexpected Error",
         },
     )
-    @airline_ns.marshal_with(airline_model, skip_none=True)
+    @serialize_with(airline_ns, airline_model, skip_none=True)
     def get(self, id):
         try:
             result = couchbase_db.get_document(AIRLINE_COLLECTION, key=id)
@@ -79,6 +218,7 @@ class AirlineId(Resource):
         try:
             updated_doc = request.json
             couchbase_db.upsert_document(AIRLINE_COLLECTION, key=id, doc=updated_doc)
+            route_index.put_airline(id, updated_doc)
             return updated_doc
         except (CouchbaseException, Exception) as e:
             return f"Unexpected error: {e}", 500
@@ -94,6 +234,7 @@ class AirlineId(Resource):
     def delete(self, id):
         try:
             couchbase_db.delete_document(AIRLINE_COLLECTION, key=id)
+            route_index.remove_airline(id)
             return "Deleted", 204
         except DocumentNotFoundException:
             return "Airline not found", 404
@@ -101,6 +242,121 @@ class AirlineId(Resource):
             return f"Unexpected error: {e}", 500
 
 
+AIRLINE_BATCH_GET_LIMIT = 500
+
+airline_batch_get_model = airline_ns.model(
+    "Airline Batch Get",
+    {
+        "ids": fields.List(
+            fields.String,
+            required=True,
+            min_items=1,
+            max_items=AIRLINE_BATCH_GET_LIMIT,
+            description="Airline IDs to fetch",
+            example=["airline_10", "airline_10123"],
+        ),
+    },
+)
+
+airline_batch_item_model = airline_ns.model(
+    "Airline Batch Item",
+    {
+        "id": fields.String(required=True, description="Airline ID"),
+        "found": fields.Boolean(
+            required=True, description="Whether the airline exists"
+        ),
+        "document": fields.Nested(airline_model, skip_none=True, allow_null=True),
+        "error": fields.String(description="Error for this ID, if any"),
+    },
+)
+
+
+@airline_ns.route("/batch-get")
+class AirlineBatchGet(TracedResource):
+    @airline_ns.doc(
+        description="Get multiple Airlines by ID in one request. \n\n This provides an example of using a [bulk Key Value operation](https://docs.couchbase.com/python-sdk/current/howtos/concurrent-async-apis.html#batching) in Couchbase to fetch many documents with a single pipelined multi-get.\n\n Each requested ID is reported as found or missing.\n\n Code: [`api/airline.py`](https://github.com/couchbase-examples/python-quickstart/blob/main/src/api/airline.py) \n Class: `AirlineBatchGet` \n Method: `post`",
+        responses={
+            200: "Airlines found and missing per ID",
+            400: "Invalid list of IDs",
+            500: "Unexpected Error",
+        },
+    )
+    @airline_ns.expect(airline_batch_get_model, validate=True)
+    @serialize_list_with(airline_ns, airline_batch_item_model, skip_none=True)
+    def post(self):
+        try:
+            # Fetch and report each distinct ID once, in the order requested
+            ids = list(dict.fromkeys(request.json["ids"]))
+            results = couchbase_db.get_documents(AIRLINE_COLLECTION, keys=ids)
+            items = []
+            for id in ids:
+                result = results[id]
+                if isinstance(result, DocumentNotFoundException):
+                    items.append({"id": id, "found": False})
+                elif isinstance(result, Exception):
+                    items.append({"id": id, "found": False, "error": str(result)})
+                else:
+                    items.append(
+                        {"id": id, "found": True, "document": result.content_as[dict]}
+                    )
+            return items
+        except (CouchbaseException, Exception) as e:
+            return f"Unexpected error: {e}", 500
+
+
+airline_bulk_report_model = bulk_report_model(airline_ns, "Airline")
+
+
+@airline_ns.route("/bulk")
+class AirlineBulk(TracedResource):
+    @airline_ns.doc(
+        description='Bulk load Airlines from a streamed NDJSON body. \n\n Each line is a JSON object like `{"id": "airline_10", "document": {...}}`. Records are validated one at a time and written in bounded windows, so uploads of any size use constant memory.\n\n This provides an example of using [bulk Key Value operations](https://docs.couchbase.com/python-sdk/current/howtos/concurrent-async-apis.html#batching) in Couchbase to write many documents with pipelined multi-inserts or multi-upserts.\n\n Code: [`api/airline.py`](https://github.com/couchbase-examples/python-quickstart/blob/main/src/api/airline.py) \n Class: `AirlineBulk` \n Method: `post`',
+        responses={
+            200: "Ingest report with per-record errors",
+            400: "Invalid mode or window",
+            500: "Unexpected Error",
+        },
+        params={
+            "mode": {
+                "description": "`insert` fails records whose ID exists, `upsert` overwrites them",
+                "in": "query",
+                "required": False,
+                "default": "insert",
+                "enum": ["insert", "upsert"],
+            },
+            "window": {
+                "description": f"Documents written per batch (1-{MAX_WINDOW})",
+                "in": "query",
+                "required": False,
+                "default": DEFAULT_WINDOW,
+            },
+        },
+    )
+    @serialize_with(airline_ns, airline_bulk_report_model, skip_none=True)
+    def post(self):
+        mode = request.args.get("mode", "insert")
+        try:
+            window = int(request.args.get("window", DEFAULT_WINDOW))
+        except ValueError:
+            return f"Window must be an integer between 1 and {MAX_WINDOW}", 400
+        if mode not in ("insert", "upsert"):
+            return "Mode must be insert or upsert", 400
+        if not 1 <= window <= MAX_WINDOW:
+            return f"Window must be between 1 and {MAX_WINDOW}", 400
+        try:
+            ingest = BulkIngest(
+                airline_ns,
+                airline_model,
+                AIRLINE_COLLECTION,
+                mode=mode,
+                window=window,
+                on_written=route_index.put_airline,
+            )
+            return ingest.run(request.stream)
+        except (CouchbaseException, Exception) as e:
+            return f"Unexpected error: {e}", 500
+
+
 @airline_ns.route("/list")
 @airline_ns.doc(
     description="Get list of Airlines. Optionally, you can filter the list by Country. \n\n This provides an example of using [SQL++ query](https://docs.couchbase.com/python-sdk/current/howtos/n1ql-queries-with-sdk.html) in Couchbase to fetch a list of documents matching the specified criteria.\n\n Code: [`api/airline.py`](https://github.com/couchbase-examples/python-quickstart/blob/main/src/api/airline.py) \n Class: `AirlineList` \n Method: `get`",
@@ -124,54 +380,76 @@ class AirlineId(Resource):
             "required": False,
             "default": 0,
         },
+        "stream": STREAM_PARAM,
+        "cursor": {
+            "description": "Cursor from the `X-Next-Cursor` header of the previous page. Seeks directly to the next page, so every page costs the same; `offset` is ignored",
+            "in": "query",
+            "required": False,
+        },
     },
 )
-class AirlineList(Resource):
-    @airline_ns.marshal_list_with(airline_model)
+class AirlineList(TracedResource):
+    @serialize_list_with(airline_ns, airline_model)
     def get(self):
         country = request.args.get("country", "")
         limit = int(request.args.get("limit", 10))
         offset = int(request.args.get("offset", 0))
-        if country:
-            query = """
-                SELECT airline.callsign,
-                    airline.country,
-                    airline.iata,
-                    airline.icao,
-                    airline.name
-                FROM airline as airline 
-                WHERE airline.country=$country 
-                ORDER BY airline.name
-                LIMIT $limit 
-                OFFSET $offset;
-            """
-
+        cursor = request.args.get("cursor", "")
+        after_name, after_id, after_missing = None, None, False
+        if cursor:
+            try:
+                after_name, after_id, after_missing = decode_name_cursor(cursor)
+            except ValueError:
+                return "Invalid cursor", 400
+            statement = (
+                "airline_list_by_country_after" if country else "airline_list_after"
+            )
+            if after_name is None:
+                # The previous page ended on a row without a name
+                statement += "_unnamed"
         else:
-            query = """
-                SELECT airline.callsign,
-                    airline.country,
-                    airline.iata,
-                    airline.icao,
-                    airline.name
-                FROM airline as airline 
-                ORDER BY airline.name
-                LIMIT $limit 
-                OFFSET $offset;
-            """
+            statement = "airline_list_by_country" if country else "airline_list"
 
         try:
-            result = couchbase_db.query(
-                query, country=country, limit=limit, offset=offset
+            result = couchbase_db.query_statement(
+                statement,
+                country=country,
+                limit=limit,
+                offset=offset,
+                after_name=after_name,
+                after_id=after_id,
+                after_missing=after_missing,
             )
+            if stream_format():
+                return stream_rows(result, airline_model, stream_format())
             airlines = [r for r in result]
-            return airlines
+            headers = {}
+            if limit > 0 and len(airlines) == limit:
+                last = airlines[-1]
+                headers["X-Next-Cursor"] = encode_name_cursor(last, "name")
+            return airlines, 200, headers
         except (CouchbaseException, Exception) as e:
             return f"Unexpected error: {e}", 500
 
 
+def get_airlines(ids: list) -> list:
+    """Fetch airlines with one multi-get, in the order of their IDs"""
+    results = couchbase_db.get_documents(AIRLINE_COLLECTION, ids)
+    airlines = []
+    for id in ids:
+        result = results[id]
+        if isinstance(result, DocumentNotFoundException):
+            # Deleted since the route index last saw it
+            continue
+        if isinstance(result, Exception):
+            raise result
+        airlines.append(result.content_as[dict])
+    return airlines
+
+
 @airline_ns.route("/to-airport")
 @airline_ns.doc(
-    description="Get Airlines flying to specified destination Airport. \n\n This provides an example of using [SQL++ query](https://docs.couchbase.com/python-sdk/current/howtos/n1ql-queries-with-sdk.html) in Couchbase to fetch a list of documents matching the specified criteria.\n\n Code: [`api/airline.py`](https://github.com/couchbase-examples/python-quickstart/blob/main/src/api/airline.py) \n Class: `AirlinesToAirport` \n Method: `get`",
+    description="Get Airlines flying to specified destination Airport. \n\n This provides an example of using [SQL++ query](https://docs.couchbase.com/python-sdk/current/howtos/n1ql-queries-with-sdk.html) in Couchbase to fetch a list of documents matching the specified criteria.\n\n Once the in-memory route index has loaded the route collection, the airline IDs are looked up in memory and the airlines are fetched with a single [bulk Key Value operation](https://docs.couchbase.com/python-sdk/current/howtos/concurrent-async-apis.html#batching). The query is only used while the index is warming up.\n\n Code: [`api/airline.py`](https://github.com/couchbase-examples/python-quickstart/blob/main/src/api/airline.py) \n Class: `AirlinesToAirport` \n Method: `get`",
     reponses={200: "List of airlines", 500: "Unexpected Error"},
     params={
         "airport": {
@@ -192,35 +470,27 @@ class AirlineList(Resource):
             "required": False,
             "default": 0,
         },
+        "stream": STREAM_PARAM,
     },
 )
-class AirlinesToAirport(Resource):
-    @airline_ns.marshal_list_with(airline_model)
+class AirlinesToAirport(TracedResource):
+    @serialize_list_with(airline_ns, airline_model)
     def get(self):
         airport = request.args.get("airport", "")
         limit = int(request.args.get("limit", 10))
         offset = int(request.args.get("offset", 0))
         try:
-            query = """
-                SELECT air.callsign,
-                    air.country,
-                    air.iata,
-                    air.icao,
-                    air.name
-                FROM (
-                    SELECT DISTINCT META(airline).id AS airlineId
-                    FROM route
-                    JOIN airline ON route.airlineid = META(airline).id
-                    WHERE route.destinationairport = $airport
-                ) AS subquery
-                JOIN airline AS air ON META(air).id = subquery.airlineId
-                ORDER BY air.name
-                LIMIT $limit 
-                OFFSET $offset;
-            """
-            result = couchbase_db.query(
-                query, airport=airport, limit=limit, offset=offset
-            )
+            if route_index.ready:
+                # The index keeps the airlines in name order, so only the
+                # page is fetched
+                result = get_airlines(route_index.airlines_to(airport, limit, offset))
+            else:
+                # Answer from SQL++ while the route index is still loading
+                result = couchbase_db.query_statement(
+                    "airlines_to_airport", airport=airport, limit=limit, offset=offset
+                )
+            if stream_format():
+                return stream_rows(result, airline_model, stream_format())
             airlines = [r for r in result]
             return airlines
         except (CouchbaseException, Exception) as e:
@@ -1,6 +1,15 @@
-from flask_restx import Namespace, fields, Resource
+from flask_restx import Namespace, fields
 from flask import request
-from extensions import couchbase_db
+from extensions import couchbase_db, route_index, airport_geo_index
+from api.resource import TracedResource
+from api.serialization import serialize_with, serialize_list_with
+from api.pagination import encode_name_cursor, decode_name_cursor
+from api.streaming import (
+    STREAM_PARAM,
+    stream_format,
+    stream_rows,
+)
+from api.bulk import BulkIngest, bulk_report_model, DEFAULT_WINDOW, MAX_WINDOW
 from couchbase.exceptions import (
     CouchbaseException,
     DocumentExistsException,
@@ -9,6 +18,139 @@ from couchbase.exceptions import (
 
 AIRPORT_COLLECTION = "airport"
 
+AIRPORT_LIST_QUERY = """
+    SELECT META(airport).id,
+        airport.airportname,
+        airport.city,
+        airport.country,
+        airport.faa,
+        airport.geo,
+        airport.icao,
+        airport.tz
+    FROM airport AS airport
+    ORDER BY airport.airportname, META(airport).id
+    LIMIT $limit
+    OFFSET $offset;
+"""
+
+AIRPORT_LIST_BY_COUNTRY_QUERY = """
+    SELECT META(airport).id,
+        airport.airportname,
+        airport.city,
+        airport.country,
+        airport.faa,
+        airport.geo,
+        airport.icao,
+        airport.tz
+    FROM airport AS airport
+    WHERE airport.country = $country
+    ORDER BY airport.airportname, META(airport).id
+    LIMIT $limit
+    OFFSET $offset;
+"""
+
+# Keyset pagination: seek past the (airportname, id) of the previous page's last row
+AIRPORT_LIST_AFTER_QUERY = """
+    SELECT META(airport).id,
+        airport.airportname,
+        airport.city,
+        airport.country,
+        airport.faa,
+        airport.geo,
+        airport.icao,
+        airport.tz
+    FROM airport AS airport
+    WHERE airport.airportname >= $after_name
+        AND [airport.airportname, META(airport).id] > [$after_name, $after_id]
+    ORDER BY airport.airportname, META(airport).id
+    LIMIT $limit;
+"""
+
+AIRPORT_LIST_BY_COUNTRY_AFTER_QUERY = """
+    SELECT META(airport).id,
+        airport.airportname,
+        airport.city,
+        airport.country,
+        airport.faa,
+        airport.geo,
+        airport.icao,
+        airport.tz
+    FROM airport AS airport
+    WHERE airport.country = $country
+        AND airport.airportname >= $after_name
+        AND [airport.airportname, META(airport).id] > [$after_name, $after_id]
+    ORDER BY airport.airportname, META(airport).id
+    LIMIT $limit;
+"""
+
+# Keyset pagination past a row without a name. Those rows sort first, the ones
+# whose name is MISSING before the ones where it is NULL, each by ID
+AIRPORT_LIST_AFTER_UNNAMED_QUERY = """
+    SELECT META(airport).id,
+        airport.airportname,
+        airport.city,
+        airport.country,
+        airport.faa,
+        airport.geo,
+        airport.icao,
+        airport.tz
+    FROM airport AS airport
+    WHERE airport.airportname IS VALUED
+        OR (airport.airportname IS NULL
+            AND ($after_missing OR META(airport).id > $after_id))
+        OR (airport.airportname IS MISSING
+            AND $after_missing AND META(airport).id > $after_id)
+    ORDER BY airport.airportname, META(airport).id
+    LIMIT $limit;
+"""
+
+AIRPORT_LIST_BY_COUNTRY_AFTER_UNNAMED_QUERY = """
+    SELECT META(airport).id,
+        airport.airportname,
+        airport.city,
+        airport.country,
+        airport.faa,
+        airport.geo,
+        airport.icao,
+        airport.tz
+    FROM airport AS airport
+    WHERE airport.country = $country
+        AND (airport.airportname IS VALUED
+            OR (airport.airportname IS NULL
+                AND ($after_missing OR META(airport).id > $after_id))
+            OR (airport.airportname IS MISSING
+                AND $after_missing AND META(airport).id > $after_id))
+    ORDER BY airport.airportname, META(airport).id
+    LIMIT $limit;
+"""
+
+DIRECT_CONNECTIONS_QUERY = """
+    SELECT distinct (route.destinationairport)
+    FROM airport as airport
+    JOIN route as route on route.sourceairport = airport.faa
+    WHERE airport.faa = $airport and route.stops = 0
+    ORDER BY route.destinationairport
+    LIMIT $limit
+    OFFSET $offset
+"""
+
+# Run by name with query_statement, optionally as prepared statements
+couchbase_db.register_statement("airport_list", AIRPORT_LIST_QUERY)
+couchbase_db.register_statement(
+    "airport_list_by_country", AIRPORT_LIST_BY_COUNTRY_QUERY
+)
+couchbase_db.register_statement("airport_list_after", AIRPORT_LIST_AFTER_QUERY)
+couchbase_db.register_statement(
+    "airport_list_by_country_after", AIRPORT_LIST_BY_COUNTRY_AFTER_QUERY
+)
+couchbase_db.register_statement(
+    "airport_list_after_unnamed", AIRPORT_LIST_AFTER_UNNAMED_QUERY
+)
+couchbase_db.register_statement(
+    "airport_list_by_country_after_unnamed", AIRPORT_LIST_BY_COUNTRY_AFTER_UNNAMED_QUERY
+)
+couchbase_db.register_statement("direct_connections", DIRECT_CONNECTIONS_QUERY)
+
 airport_ns = Namespace("Airport", description="Airport related APIs", ordered=True)
 
 geo_cordinate_fields = airport_ns.model(
@@ -49,7 +191,7 @@ airport_model = airport_ns.model(
 
 @airport_ns.route("/<id>")
 @airport_ns.doc(params={"id": "Airport ID like airport_1273"})
-class AirportId(Resource):
+class AirportId(TracedResource):
     @airport_ns.doc(
         description="Create Airport with specified ID. \n\n This provides an example of using [Key Value operations](https://docs.couchbase.com/python-sdk/current/howtos/kv-operations.html) in Couchbase to create a new document with a specified ID.\n\n Key Value operations are unique to Couchbase and provide very high speed get/set/delete operations.\n\n Code: [`api/airport.py`](https://github.com/couchbase-examples/python-quickstart/blob/main/src/api/airport.py) \n Class: `AirportId` \n Method: `post`",
         responses={
@@ -63,6 +205,8 @@ class AirportId(Resource):
         try:
             data = request.json
             couchbase_db.insert_document(AIRPORT_COLLECTION, key=id, doc=data)
+            route_index.put_airport(id, data)
+            airport_geo_index.put_airport(id, data)
             return data, 201
         except DocumentExistsException:
             return "Airport already exists", 409
@@ -77,7 +221,7 @@ class AirportId(Resource):
             500: "Unexpected Error",
         },
     )
-    @airport_ns.marshal_with(airport_model, skip_none=True)
+    @serialize_with(airport_ns, airport_model, skip_none=True)
     def get(self, id):
         try:
             result = couchbase_db.get_document(AIRPORT_COLLECTION, key=id)
@@ -99,6 +243,8 @@ class AirportId(Resource):
         try:
             updated_doc = request.json
             couchbase_db.upsert_document(AIRPORT_COLLECTION, key=id, doc=updated_doc)
+            route_index.put_airport(id, updated_doc)
+            airport_geo_index.put_airport(id, updated_doc)
             return updated_doc
         except (CouchbaseException, Exception) as e:
             return f"Unexpected error: {e}", 500
@@ -114,6 +260,8 @@ class AirportId(Resource):
     def delete(self, id):
         try:
             couchbase_db.delete_document(AIRPORT_COLLECTION, key=id)
+            route_index.remove_airport(id)
+            airport_geo_index.remove_airport(id)
             return "Deleted", 204
         except DocumentNotFoundException:
             return "Airport not found", 404
@@ -121,6 +269,127 @@ class AirportId(Resource):
             return f"Unexpected error: {e}", 500
 
 
+AIRPORT_BATCH_GET_LIMIT = 500
+
+airport_batch_get_model = airport_ns.model(
+    "Airport Batch Get",
+    {
+        "ids": fields.List(
+            fields.String,
+            required=True,
+            min_items=1,
+            max_items=AIRPORT_BATCH_GET_LIMIT,
+            description="Airport IDs to fetch",
+            example=["airport_1254", "airport_1255"],
+        ),
+    },
+)
+
+airport_batch_item_model = airport_ns.model(
+    "Airport Batch Item",
+    {
+        "id": fields.String(required=True, description="Airport ID"),
+        "found": fields.Boolean(
+            required=True, description="Whether the airport exists"
+        ),
+        "document": fields.Nested(airport_model, skip_none=True, allow_null=True),
+        "error": fields.String(description="Error for this ID, if any"),
+    },
+)
+
+
+@airport_ns.route("/batch-get")
+class AirportBatchGet(TracedResource):
+    @airport_ns.doc(
+        description="Get multiple Airports by ID in one request. \n\n This provides an example of using a [bulk Key Value operation](https://docs.couchbase.com/python-sdk/current/howtos/concurrent-async-apis.html#batching) in Couchbase to fetch many documents with a single pipelined multi-get.\n\n Each requested ID is reported as found or missing.\n\n Code: [`api/airport.py`](https://github.com/couchbase-examples/python-quickstart/blob/main/src/api/airport.py) \n Class: `AirportBatchGet` \n Method: `post`",
+        responses={
+            200: "Airports found and missing per ID",
+            400: "Invalid list of IDs",
+            500: "Unexpected Error",
+        },
+    )
+    @airport_ns.expect(airport_batch_get_model, validate=True)
+    @serialize_list_with(airport_ns, airport_batch_item_model, skip_none=True)
+    def post(self):
+        try:
+            # Fetch and report each distinct ID once, in the order requested
+            ids = list(dict.fromkeys(request.json["ids"]))
+            results = couchbase_db.get_documents(AIRPORT_COLLECTION, keys=ids)
+            items = []
+            for id in ids:
+                result = results[id]
+                if isinstance(result, DocumentNotFoundException):
+                    items.append({"id": id, "found": False})
+                elif isinstance(result, Exception):
+                    items.append({"id": id, "found": False, "error": str(result)})
+                else:
+                    items.append(
+                        {"id": id, "found": True, "document": result.content_as[dict]}
+                    )
+            return items
+        except (CouchbaseException, Exception) as e:
+            return f"Unexpected error: {e}", 500
+
+
+airport_bulk_report_model = bulk_report_model(airport_ns, "Airport")
+
+
+def put_airport(id: str, doc: dict) -> None:
+    """Update the in-memory route and geo indexes after a bulk write"""
+    route_index.put_airport(id, doc)
+    airport_geo_index.put_airport(id, doc)
+
+
+@airport_ns.route("/bulk")
+class AirportBulk(TracedResource):
+    @airport_ns.doc(
+        description='Bulk load Airports from a streamed NDJSON body. \n\n Each line is a JSON object like `{"id": "airport_1254", "document": {...}}`. Records are validated one at a time and written in bounded windows, so uploads of any size use constant memory.\n\n This provides an example of using [bulk Key Value operations](https://docs.couchbase.com/python-sdk/current/howtos/concurrent-async-apis.html#batching) in Couchbase to write many documents with pipelined multi-inserts or multi-upserts.\n\n Code: [`api/airport.py`](https://github.com/couchbase-examples/python-quickstart/blob/main/src/api/airport.py) \n Class: `AirportBulk` \n Method: `post`',
+        responses={
+            200: "Ingest report with per-record errors",
+            400: "Invalid mode or window",
+            500: "Unexpected Error",
+        },
+        params={
+            "mode": {
+                "description": "`insert` fails records whose ID exists, `upsert` overwrites them",
+                "in": "query",
+                "required": False,
+                "default": "insert",
+                "enum": ["insert", "upsert"],
+            },
+            "window": {
+                "description": f"Documents written per batch (1-{MAX_WINDOW})",
+                "in": "query",
+                "required": False,
+                "default": DEFAULT_WINDOW,
+            },
+        },
+    )
+    @serialize_with(airport_ns, airport_bulk_report_model, skip_none=True)
+    def post(self):
+        mode = request.args.get("mode", "insert")
+        try:
+            window = int(request.args.get("window", DEFAULT_WINDOW))
+        except ValueError:
+            return f"Window must be an integer between 1 and {MAX_WINDOW}", 400
+        if mode not in ("insert", "upsert"):
+            return "Mode must be insert or upsert", 400
+        if not 1 <= window <= MAX_WINDOW:
+            return f"Window must be between 1 and {MAX_WINDOW}", 400
+        try:
+            ingest = BulkIngest(
+                airport_ns,
+                airport_model,
+                AIRPORT_COLLECTION,
+                mode=mode,
+                window=window,
+                on_written=put_airport,
+            )
+            return ingest.run(request.stream)
+        except (CouchbaseException, Exception) as e:
+            return f"Unexpected error: {e}", 500
+
+
 @airport_ns.route("/list")
 @airport_ns.doc(
     description="Get list of Airports. Optionally, you can filter the list by Country. \n\n This provides an example of using a [SQL++ query](https://docs.couchbase.com/python-sdk/current/howtos/n1ql-queries-with-sdk.html) in Couchbase to fetch a list of documents matching the specified criteria.\n\n Code: [`api/airport.py`](https://github.com/couchbase-examples/python-quickstart/blob/main/src/api/airport.py) \n Class: `AirportList` \n Method: `get`",
@@ -144,50 +413,55 @@ class AirportId(Resource):
             "required": False,
             "default": 0,
         },
+        "stream": STREAM_PARAM,
+        "cursor": {
+            "description": "Cursor from the `X-Next-Cursor` header of the previous page. Seeks directly to the next page, so every page costs the same; `offset` is ignored",
+            "in": "query",
+            "required": False,
+        },
     },
 )
-class AirportList(Resource):
-    @airport_ns.marshal_list_with(airport_model)
+class AirportList(TracedResource):
+    @serialize_list_with(airport_ns, airport_model)
     def get(self):
         country = request.args.get("country", "")
         limit = int(request.args.get("limit", 10))
         offset = int(request.args.get("offset", 0))
 
-        if country:
-            query = """
-                SELECT airport.airportname,
-                    airport.city,
-                    airport.country,
-                    airport.faa,
-                    airport.geo,
-                    airport.icao,
-                    airport.tz
-                FROM airport AS airport
-                WHERE airport.country = $country
-                ORDER BY airport.airportname
-                LIMIT $limit
-                OFFSET $offset;
-            """
+        cursor = request.args.get("cursor", "")
+        after_name, after_id, after_missing = None, None, False
+        if cursor:
+            try:
+                after_name, after_id, after_missing = decode_name_cursor(cursor)
+            except ValueError:
+                return "Invalid cursor", 400
+            statement = (
+                "airport_list_by_country_after" if country else "airport_list_after"
+            )
+            if after_name is None:
+                # The previous page ended on a row without a name
+                statement += "_unnamed"
         else:
-            query = """
-                SELECT airport.airportname,
-                    airport.city,
-                    airport.country,
-                    airport.faa,
-                    airport.geo,
-                    airport.icao,
-                    airport.tz
-                FROM airport AS airport
-                ORDER BY airport.airportname
-                LIMIT $limit
-                OFFSET $offset;
-            """
+            statement = "airport_list_by_country" if country else "airport_list"
+
         try:
-            results = couchbase_db.query(
-                query, country=country, limit=limit, offset=offset
+            results = couchbase_db.query_statement(
+                statement,
+                country=country,
+                limit=limit,
+                offset=offset,
+                after_name=after_name,
+                after_id=after_id,
+                after_missing=after_missing,
             )
+            if stream_format():
+                return stream_rows(results, airport_model, stream_format())
             airports = [r for r in results]
-            return airports
+            headers = {}
+            if limit > 0 and len(airports) == limit:
+                last = airports[-1]
+                headers["X-Next-Cursor"] = encode_name_cursor(last, "airportname")
+            return airports, 200, headers
         except (CouchbaseException, Exception) as e:
             return f"Unexpected error: {e}", 500
 
@@ -204,7 +478,7 @@ destination_airports_model = airport_ns.model(
 
 @airport_ns.route("/direct-connections")
 @airport_ns.doc(
-    description="Get Direct Connections from specified Airport. \n\n This provides an example of using a [SQL++ query](https://docs.couchbase.com/python-sdk/current/howtos/n1ql-queries-with-sdk.html) in Couchbase to fetch a list of documents matching the specified criteria.\n\n Code: [`api/airport.py`](https://github.com/couchbase-examples/python-quickstart/blob/main/src/api/airport.py) \n Class: `DirectConnections` \n Method: `get`",
+    description="Get Direct Connections from specified Airport. \n\n This provides an example of using a [SQL++ query](https://docs.couchbase.com/python-sdk/current/howtos/n1ql-queries-with-sdk.html) in Couchbase to fetch a list of documents matching the specified criteria.\n\n Once the in-memory route index has loaded the route collection, the connections are answered from memory and the query is only used while the index is warming up.\n\n Code: [`api/airport.py`](https://github.com/couchbase-examples/python-quickstart/blob/main/src/api/airport.py) \n Class: `DirectConnections` \n Method: `get`",
     reponses={200: "List of direct connections", 500: "Unexpected Error"},
     params={
         "airport": {
@@ -225,29 +499,109 @@ destination_airports_model = airport_ns.model(
             "required": False,
             "default": 0,
         },
+        "stream": STREAM_PARAM,
     },
 )
-class DirectConnections(Resource):
-    @airport_ns.marshal_list_with(destination_airports_model)
+class DirectConnections(TracedResource):
+    @serialize_list_with(airport_ns, destination_airports_model)
     def get(self):
         airport = request.args.get("airport", "")
         limit = int(request.args.get("limit", 10))
         offset = int(request.args.get("offset", 0))
 
         try:
-            query = """
-                SELECT distinct (route.destinationairport)
-                FROM airport as airport
-                JOIN route as route on route.sourceairport = airport.faa
-                WHERE airport.faa = $airport and route.stops = 0
-                ORDER BY route.destinationairport
-                LIMIT $limit
-                OFFSET $offset
-            """
-            result = couchbase_db.query(
-                query, airport=airport, limit=limit, offset=offset
-            )
+            if route_index.ready:
+                destinations = route_index.direct_connections(airport)
+                result = (
+                    {"destinationairport": destination}
+                    for destination in destinations[offset : offset + limit]
+                )
+            else:
+                # Answer from SQL++ while the route index is still loading
+                result = couchbase_db.query_statement(
+                    "direct_connections", airport=airport, limit=limit, offset=offset
+                )
+            if stream_format():
+                return stream_rows(result, destination_airports_model, stream_format())
             airports = [r for r in result]
             return airports
         except (CouchbaseException, Exception) as e:
             return f"Unexpected error: {e}", 500
+
+
+AIRPORT_NEAREST_MAX_LIMIT = 100
+
+nearby_airport_model = airport_ns.clone(
+    "Nearby Airport",
+    airport_model,
+    {
+        "id": fields.String(description="Airport ID", example="airport_3469"),
+        "distance": fields.Float(
+            description="Great-circle distance from the point in km", example=21.4
+        ),
+    },
+)
+
+
+@airport_ns.route("/nearest")
+@airport_ns.doc(
+    description="Get the Airports nearest to a point, optionally only those within a radius, nearest first. \n\n The lookup runs over an in-memory spatial index of the airport coordinates: a latitude/longitude grid narrows the search to the cells around the point, and the great-circle distances to the airports in them are computed with vectorised [NumPy](https://numpy.org/) operations. The index is kept up to date by the airport write endpoints, so no [SQL++ query](https://docs.couchbase.com/python-sdk/current/howtos/n1ql-queries-with-sdk.html) is run.\n\n Code: [`api/airport.py`](https://github.com/couchbase-examples/python-quickstart/blob/main/src/api/airport.py) \n Class: `NearestAirports` \n Method: `get`",
+    responses={
+        200: "Airports ordered by distance",
+        400: "Invalid parameters",
+        503: "Airport geo index is loading",
+        500: "Unexpected Error",
+    },
+    params={
+        "lat": {
+            "description": "Latitude of the point (-90 to 90)",
+            "in": "query",
+            "required": True,
+            "example": 37.62,
+        },
+        "lon": {
+            "description": "Longitude of the point (-180 to 180)",
+            "in": "query",
+            "required": True,
+            "example": -122.38,
+        },
+        "radius": {
+            "description": "Only return airports within this many km",
+            "in": "query",
+            "required": False,
+        },
+        "limit": {
+            "description": f"Number of airports to return (1-{AIRPORT_NEAREST_MAX_LIMIT})",
+            "in": "query",
+            "required": False,
+            "default": 10,
+        },
+    },
+)
+class NearestAirports(TracedResource):
+    @serialize_list_with(airport_ns, nearby_airport_model, skip_none=True)
+    def get(self):
+        try:
+            lat = float(request.args["lat"])
+            lon = float(request.args["lon"])
+            radius = request.args.get("radius")
+            radius = float(radius) if radius is not None else None
+            limit = int(request.args.get("limit", 10))
+        except (KeyError, ValueError):
+            return (
+                "lat and lon are required, and lat, lon and radius must be numbers",
+                400,
+            )
+        if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+            return "lat must be between -90 and 90 and lon between -180 and 180", 400
+        if radius is not None and not radius > 0:
+            return "radius must be greater than 0", 400
+        if not 1 <= limit <= AIRPORT_NEAREST_MAX_LIMIT:
+            return f"limit must be between 1 and {AIRPORT_NEAREST_MAX_LIMIT}", 400
+        if not airport_geo_index.ready:
+            return "Airport geo index is loading, try again shortly", 503
+
+        try:
+            return airport_geo_index.nearest(lat, lon, limit, radius)
+        except (CouchbaseException, Exception) as e:
+            return f"Unexpected error: {e}", 500
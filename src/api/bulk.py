@@ -0,0 +1,163 @@
+import json
+from flask_restx import fields
+from couchbase.exceptions import DocumentExistsException
+from extensions import couchbase_db
+from api.validation import payload_validator
+
+# Number of documents written per multi-insert/upsert by default and at most
+DEFAULT_WINDOW = 500
+MAX_WINDOW = 1000
+
+# Longest NDJSON line accepted; longer records are rejected without being buffered
+MAX_RECORD_BYTES = 1024 * 1024
+
+# Per-record error reports kept in the response; further failures are only counted
+MAX_ERROR_REPORTS = 1000
+
+
+def bulk_report_model(namespace, title):
+    """Register the bulk ingest report model for a namespace"""
+    error_model = namespace.model(
+        f"{title} Bulk Ingest Error",
+        {
+            "line": fields.Integer(description="Line number in the NDJSON body"),
+            "id": fields.String(description="Document ID, if it could be read"),
+            "error": fields.String(description="Why the record was not written"),
+            "errors": fields.Raw(description="Schema validation errors per field"),
+        },
+    )
+    return namespace.model(
+        f"{title} Bulk Ingest Report",
+        {
+            "received": fields.Integer(description="Records read from the body"),
+            "written": fields.Integer(description="Documents written"),
+            "failed": fields.Integer(description="Records that were not written"),
+            "errors": fields.List(fields.Nested(error_model, skip_none=True)),
+            "errors_truncated": fields.Integer(
+                description="Failed records left out of `errors`"
+            ),
+        },
+    )
+
+
+def iter_records(stream):
+    """Yield (line number, raw line) from a binary stream without reading it all
+
+    Lines longer than MAX_RECORD_BYTES are yielded as None and skipped.
+    """
+    line_number = 0
+    while True:
+        line = stream.readline(MAX_RECORD_BYTES + 1)
+        if not line:
+            return
+        line_number += 1
+        if len(line) > MAX_RECORD_BYTES:
+            # Discard the rest of the oversized line
+            while line and not line.endswith(b"\n"):
+                line = stream.readline(MAX_RECORD_BYTES)
+            yield line_number, None
+            continue
+        if line.strip():
+            yield line_number, line
+
+
+class BulkIngest(object):
+    """Validate NDJSON records incrementally and write them in bounded windows
+
+    Each line must be a JSON object of the form {"id": <key>, "document": {...}}.
+    At most `window` documents are held in memory at a time, so memory use does
+    not depend on the size of the upload.
+    """
+
+    def __init__(
+        self, namespace, model, collection_name, mode, window, on_written=None
+    ) -> None:
+        self.validate = payload_validator(namespace, model)
+        self.collection_name = collection_name
+        self.write = (
+            couchbase_db.insert_documents
+            if mode == "insert"
+            else couchbase_db.upsert_documents
+        )
+        self.window = window
+        # Called with (id, document) for every document that was written
+        self.on_written = on_written
+        self.pending = {}
+        self.received = 0
+        self.written = 0
+        self.failed = 0
+        self.errors = []
+
+    def report_error(self, line, id=None, error=None, errors=None) -> None:
+        self.failed += 1
+        if len(self.errors) < MAX_ERROR_REPORTS:
+            self.errors.append(
+                {"line": line, "id": id, "error": error, "errors": errors}
+            )
+
+    def add(self, line_number, line) -> None:
+        self.received += 1
+        if line is None:
+            self.report_error(line_number, error="Record is too large")
+            return
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            self.report_error(line_number, error=f"Invalid JSON: {e}")
+            return
+        if not isinstance(record, dict) or not isinstance(record.get("id"), str):
+            self.report_error(line_number, error="Record must have a string 'id'")
+            return
+        id = record["id"]
+        document = record.get("document")
+        errors = self.validate(document)
+        if errors:
+            self.report_error(
+                line_number,
+                id=id,
+                error="Input payload validation failed",
+                errors=errors,
+            )
+            return
+        # A repeated key must not overwrite a document still waiting to be written
+        if id in self.pending:
+            self.flush()
+        self.pending[id] = (line_number, document)
+        if len(self.pending) >= self.window:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self.pending:
+            return
+        pending, self.pending = self.pending, {}
+        try:
+            results = self.write(
+                self.collection_name,
+                {id: document for id, (_, document) in pending.items()},
+            )
+        except Exception as e:
+            for id, (line_number, _) in pending.items():
+                self.report_error(line_number, id=id, error=str(e))
+            return
+        for id, (line_number, document) in pending.items():
+            result = results.get(id)
+            if isinstance(result, DocumentExistsException):
+                self.report_error(line_number, id=id, error="Document already exists")
+            elif isinstance(result, Exception):
+                self.report_error(line_number, id=id, error=str(result))
+            else:
+                self.written += 1
+                if self.on_written:
+                    self.on_written(id, document)
+
+    def run(self, stream) -> dict:
+        for line_number, line in iter_records(stream):
+            self.add(line_number, line)
+        self.flush()
+        return {
+            "received": self.received,
+            "written": self.written,
+            "failed": self.failed,
+            "errors": self.errors,
+            "errors_truncated": self.failed - len(self.errors),
+        }
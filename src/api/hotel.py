@@ -1,9 +1,15 @@
-from flask_restx import Namespace, fields, Resource
+from flask_restx import Namespace, fields
 from flask import request
-from extensions import couchbase_db
-from couchbase.exceptions import CouchbaseException
+from extensions import couchbase_db, hotel_index
+from api.resource import TracedResource
+from api.serialization import serialize_with, serialize_list_with
+from couchbase.exceptions import CouchbaseException, DocumentNotFoundException
+from db import geo_point
 
 hotel_COLLECTION = "hotel"
+
+# Most hotel names returned by autocomplete
+HOTEL_AUTOCOMPLETE_LIMIT = 50
 hotel_ns = Namespace("Hotel", description="Hotel related APIs", ordered=True)
 
 hotel_name_model = hotel_ns.model(
@@ -28,28 +34,33 @@ hotel_model = hotel_ns.model(
 
 
 @hotel_ns.route("/autocomplete")
-class HotelAutoComplete(Resource):
+class HotelAutoComplete(TracedResource):
     @hotel_ns.doc(
-        description="Search for hotels based on their name. \n\n This provides an example of using [Search operations](https://docs.couchbase.com/python-sdk/current/howtos/full-text-searching-with-sdk.html#search-queries) in Couchbase to search for a specific name using the fts index.\n\n Code: [`api/hotel.py`](https://github.com/couchbase-examples/python-quickstart/blob/main/src/api/hotel.py) \n Class: `HotelAutoComplete` \n Method: `get`",
+        description="Search for hotels based on their name. \n\n This provides an example of using [Search operations](https://docs.couchbase.com/python-sdk/current/howtos/full-text-searching-with-sdk.html#search-queries) in Couchbase to search for a specific name using the fts index.\n\n Names having words that start with the typed words are answered from an in-memory prefix index of hotel names. The fts index is only searched when that finds nothing or while the prefix index is loading.\n\n Code: [`api/hotel.py`](https://github.com/couchbase-examples/python-quickstart/blob/main/src/api/hotel.py) \n Class: `HotelAutoComplete` \n Method: `get`",
         responses={
             200: "List of Hotel Names",
             500: "Unexpected Error",
         },
     )
-    @hotel_ns.marshal_with(hotel_name_model)
+    @serialize_with(hotel_ns, hotel_name_model)
     @hotel_ns.doc(params={"name": "Hotel Name like Seal View"})
     def get(self):
         name = request.args.get("name", "")
         try:
-            result = couchbase_db.search_by_name(name=name)
+            result = []
+            if hotel_index.ready:
+                result = hotel_index.search(name, limit=HOTEL_AUTOCOMPLETE_LIMIT)
+            if not result:
+                # Fuzzy and mid-word matches need the FTS edge n-gram index
+                result = couchbase_db.search_by_name(name=name)
             return [{"name": name} for name in result], 200
         except (CouchbaseException, Exception) as e:
             return f"Unexpected error: {e}", 500
 
 
 @hotel_ns.route("/filter")
-class HotelFilter(Resource):
-    @hotel_ns.marshal_list_with(hotel_model)
+class HotelFilter(TracedResource):
+    @serialize_list_with(hotel_ns, hotel_model)
     @hotel_ns.doc(
         description="Filter hotels using various filters such as name, title, description, country, state and city. \n\n This provides an example of using [Search operations](https://docs.couchbase.com/python-sdk/current/howtos/full-text-searching-with-sdk.html#search-queries) in Couchbase to filter documents using the fts index.\n\n Code: [`api/hotel.py`](https://github.com/couchbase-examples/python-quickstart/blob/main/src/api/hotel.py) \n Class: `HotelFilter` \n Method: `post`",
         responses={
@@ -81,3 +92,115 @@ class HotelFilter(Resource):
             return hotels, 200
         except (CouchbaseException, Exception) as e:
             return f"Unexpected error: {e}", 500
+
+
+HOTEL_NEAR_MAX_LIMIT = 100
+HOTEL_NEAR_MAX_RADIUS = 500
+
+hotel_near_model = hotel_ns.clone(
+    "Nearby Hotel",
+    hotel_model,
+    {
+        "id": fields.String(description="Hotel ID", example="hotel_10025"),
+        "geo": fields.Nested(
+            hotel_ns.model(
+                "Hotel Geo",
+                {
+                    "lat": fields.Float(description="Latitude", example=37.6068),
+                    "lon": fields.Float(description="Longitude", example=-122.3917),
+                },
+            ),
+            skip_none=True,
+        ),
+        "distance": fields.Float(
+            description="Great-circle distance from the point in km", example=2.1
+        ),
+    },
+)
+
+
+@hotel_ns.route("/near")
+class HotelNear(TracedResource):
+    @serialize_list_with(hotel_ns, hotel_near_model, skip_none=True)
+    @hotel_ns.doc(
+        description="Find hotels within a radius of an Airport or a point, nearest first. \n\n This provides an example of using a [geospatial Search query](https://docs.couchbase.com/python-sdk/current/howtos/full-text-searching-with-sdk.html#search-queries) in Couchbase: one geo-distance query on the `geo` geopoint field of the fts index, sorted by distance, replaces looking up the airport and then filtering hotels by city.\n\n Code: [`api/hotel.py`](https://github.com/couchbase-examples/python-quickstart/blob/main/src/api/hotel.py) \n Class: `HotelNear` \n Method: `get`",
+        responses={
+            200: "List of Hotels ordered by distance",
+            400: "Invalid parameters",
+            404: "Airport not found",
+            500: "Unexpected Error",
+        },
+        params={
+            "airport": {
+                "description": "Airport ID to search around, instead of lat and lon",
+                "in": "query",
+                "required": False,
+                "example": "airport_3469",
+            },
+            "lat": {
+                "description": "Latitude of the point (-90 to 90)",
+                "in": "query",
+                "required": False,
+            },
+            "lon": {
+                "description": "Longitude of the point (-180 to 180)",
+                "in": "query",
+                "required": False,
+            },
+            "radius": {
+                "description": f"Search radius in km (up to {HOTEL_NEAR_MAX_RADIUS})",
+                "in": "query",
+                "required": False,
+                "default": 10,
+            },
+            "limit": {
+                "description": f"Number of hotels to return (1-{HOTEL_NEAR_MAX_LIMIT})",
+                "in": "query",
+                "required": False,
+                "default": 10,
+            },
+            "offset": {
+                "description": "Number of hotels to skip (for pagination)",
+                "in": "query",
+                "required": False,
+                "default": 0,
+            },
+        },
+    )
+    def get(self):
+        airport = request.args.get("airport")
+        try:
+            lat = request.args.get("lat")
+            lon = request.args.get("lon")
+            point = (float(lat), float(lon)) if lat is not None else None
+            radius = float(request.args.get("radius", 10))
+            limit = int(request.args.get("limit", 10))
+            offset = int(request.args.get("offset", 0))
+        except (TypeError, ValueError):
+            return "lat, lon and radius must be numbers, limit and offset integers", 400
+        if (airport is None) == (point is None):
+            return "Either an airport or lat and lon are required", 400
+        if point is not None and not (
+            -90 <= point[0] <= 90 and -180 <= point[1] <= 180
+        ):
+            return "lat must be between -90 and 90 and lon between -180 and 180", 400
+        if not 0 < radius <= HOTEL_NEAR_MAX_RADIUS:
+            return f"radius must be between 0 and {HOTEL_NEAR_MAX_RADIUS} km", 400
+        if not 1 <= limit <= HOTEL_NEAR_MAX_LIMIT:
+            return f"limit must be between 1 and {HOTEL_NEAR_MAX_LIMIT}", 400
+        if offset < 0:
+            return "offset must not be negative", 400
+
+        try:
+            if airport is not None:
+                result = couchbase_db.get_document("airport", key=airport)
+                point = geo_point(result.content_as[dict].get("geo"))
+                if point is None:
+                    return "Airport has no coordinates", 400
+            return couchbase_db.search_near(
+                point[0], point[1], radius, limit=limit, offset=offset
+            )
+        except DocumentNotFoundException:
+            return "Airport not found", 404
+        except (CouchbaseException, Exception) as e:
+            return f"Unexpected error: {e}", 500
@@ -0,0 +1,44 @@
+import base64
+import json
+
+
+def encode_cursor(*values) -> str:
+    """Encode the sort key of the last row on a page as an opaque cursor"""
+    raw = json.dumps(list(values), separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str, size: int, optional: int = 0) -> list:
+    """Decode a cursor made by encode_cursor, raising ValueError if it is invalid
+
+    The cursor must hold `size` values, plus up to `optional` more.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(raw)
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor")
+    if not isinstance(values, list) or not size <= len(values) <= size + optional:
+        raise ValueError("Invalid cursor")
+    return values
+
+
+def encode_name_cursor(row: dict, field: str) -> str:
+    """Cursor after a row of a list sorted by a name field and then ID
+
+    SQL++ sorts the rows without a name first, those where it is MISSING before
+    those where it is NULL. JSON cannot tell the two apart, so the cursor of
+    such a row has a third value, true when the name was MISSING.
+    """
+    if row.get(field) is None:
+        return encode_cursor(None, row["id"], field not in row)
+    return encode_cursor(row[field], row["id"])
+
+
+def decode_name_cursor(cursor: str) -> tuple:
+    """(name, id, whether the name was MISSING) of a cursor from encode_name_cursor"""
+    values = decode_cursor(cursor, size=2, optional=1)
+    missing = values[2] if len(values) == 3 else False
+    if not isinstance(missing, bool) or (missing and values[0] is not None):
+        raise ValueError("Invalid cursor")
+    return values[0], values[1], missing
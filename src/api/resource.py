@@ -0,0 +1,12 @@
+from flask_restx import Resource
+from extensions import tracer
+
+
+class TracedResource(Resource):
+    """Resource recording payload validation as a span of the request's trace"""
+
+    def validate_payload(self, func):
+        if not getattr(func, "__apidoc__", {}).get("expect"):
+            return super().validate_payload(func)
+        with tracer.span("validate"):
+            super().validate_payload(func)
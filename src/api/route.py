@@ -1,6 +1,10 @@
-from flask_restx import Namespace, fields, Resource
+from flask_restx import Namespace, fields
 from flask import request
-from extensions import couchbase_db
+from extensions import couchbase_db, route_index, route_snapshot
+from route_snapshot import STATS_GROUPS, STATS_METRICS, group_stats
+from api.resource import TracedResource
+from api.serialization import serialize_with, serialize_list_with
+from api.bulk import BulkIngest, bulk_report_model, DEFAULT_WINDOW, MAX_WINDOW
 from couchbase.exceptions import (
     CouchbaseException,
     DocumentExistsException,
@@ -42,7 +46,7 @@ route_model = route_ns.model(
 
 @route_ns.route("/<id>")
 @route_ns.doc(params={"id": "Route ID like route_10000"})
-class RouteId(Resource):
+class RouteId(TracedResource):
     @route_ns.doc(
         description="Create Route with specified ID. \n\n This provides an example of using [Key Value operations](https://docs.couchbase.com/python-sdk/current/howtos/kv-operations.html) in Couchbase to create a new document with a specified ID.\n\n Key Value operations are unique to Couchbase and provide very high speed get/set/delete operations.\n\n Code: [`api/route.py`](https://github.com/couchbase-examples/python-quickstart/blob/main/src/api/route.py) \n Class: `RouteId` \n Method: `post`",
         responses={
@@ -56,6 +60,8 @@ class RouteId(Resource):
         try:
             data = request.json
             couchbase_db.insert_document(ROUTE_COLLECTION, key=id, doc=data)
+            route_index.put_route(id, data)
+            route_snapshot.put_route(id, data)
             return data, 201
         except DocumentExistsException:
             return "Route already exists", 409
@@ -70,7 +76,7 @@ class RouteId(Resource):
             500: "Unexpected Error",
         },
     )
-    @route_ns.marshal_with(route_model, skip_none=True)
+    @serialize_with(route_ns, route_model, skip_none=True)
     def get(self, id):
         try:
             result = couchbase_db.get_document(ROUTE_COLLECTION, key=id)
@@ -92,6 +98,8 @@ class RouteId(Resource):
         try:
             updated_doc = request.json
             couchbase_db.upsert_document(ROUTE_COLLECTION, key=id, doc=updated_doc)
+            route_index.put_route(id, updated_doc)
+            route_snapshot.put_route(id, updated_doc)
             return updated_doc
         except (CouchbaseException, Exception) as e:
             return f"Unexpected error: {e}", 500
@@ -107,8 +115,349 @@ class RouteId(Resource):
     def delete(self, id):
         try:
             couchbase_db.delete_document(ROUTE_COLLECTION, key=id)
+            route_index.remove_route(id)
+            route_snapshot.remove_route(id)
             return "Deleted", 204
         except DocumentNotFoundException:
             return "Route not found", 404
         except (CouchbaseException, Exception) as e:
             return f"Unexpected error: {e}", 500
+
+
+ROUTE_BATCH_GET_LIMIT = 500
+
+route_batch_get_model = route_ns.model(
+    "Route Batch Get",
+    {
+        "ids": fields.List(
+            fields.String,
+            required=True,
+            min_items=1,
+            max_items=ROUTE_BATCH_GET_LIMIT,
+            description="Route IDs to fetch",
+            example=["route_10000", "route_10001"],
+        ),
+    },
+)
+
+route_batch_item_model = route_ns.model(
+    "Route Batch Item",
+    {
+        "id": fields.String(required=True, description="Route ID"),
+        "found": fields.Boolean(required=True, description="Whether the route exists"),
+        "document": fields.Nested(route_model, skip_none=True, allow_null=True),
+        "error": fields.String(description="Error for this ID, if any"),
+    },
+)
+
+
+@route_ns.route("/batch-get")
+class RouteBatchGet(TracedResource):
+    @route_ns.doc(
+        description="Get multiple Routes by ID in one request. \n\n This provides an example of using a [bulk Key Value operation](https://docs.couchbase.com/python-sdk/current/howtos/concurrent-async-apis.html#batching) in Couchbase to fetch many documents with a single pipelined multi-get.\n\n Each requested ID is reported as found or missing.\n\n Code: [`api/route.py`](https://github.com/couchbase-examples/python-quickstart/blob/main/src/api/route.py) \n Class: `RouteBatchGet` \n Method: `post`",
+        responses={
+            200: "Routes found and missing per ID",
+            400: "Invalid list of IDs",
+            500: "Unexpected Error",
+        },
+    )
+    @route_ns.expect(route_batch_get_model, validate=True)
+    @serialize_list_with(route_ns, route_batch_item_model, skip_none=True)
+    def post(self):
+        try:
+            # Fetch and report each distinct ID once, in the order requested
+            ids = list(dict.fromkeys(request.json["ids"]))
+            results = couchbase_db.get_documents(ROUTE_COLLECTION, keys=ids)
+            items = []
+            for id in ids:
+                result = results[id]
+                if isinstance(result, DocumentNotFoundException):
+                    items.append({"id": id, "found": False})
+                elif isinstance(result, Exception):
+                    items.append({"id": id, "found": False, "error": str(result)})
+                else:
+                    items.append(
+                        {"id": id, "found": True, "document": result.content_as[dict]}
+                    )
+            return items
+        except (CouchbaseException, Exception) as e:
+            return f"Unexpected error: {e}", 500
+
+
+route_bulk_report_model = bulk_report_model(route_ns, "Route")
+
+
+def put_route(id: str, doc: dict) -> None:
+    """Update the in-memory route index and snapshot after a bulk write"""
+    route_index.put_route(id, doc)
+    route_snapshot.put_route(id, doc)
+
+
+@route_ns.route("/bulk")
+class RouteBulk(TracedResource):
+    @route_ns.doc(
+        description='Bulk load Routes from a streamed NDJSON body. \n\n Each line is a JSON object like `{"id": "route_10000", "document": {...}}`. Records are validated one at a time and written in bounded windows, so uploads of any size use constant memory.\n\n This provides an example of using [bulk Key Value operations](https://docs.couchbase.com/python-sdk/current/howtos/concurrent-async-apis.html#batching) in Couchbase to write many documents with pipelined multi-inserts or multi-upserts.\n\n Code: [`api/route.py`](https://github.com/couchbase-examples/python-quickstart/blob/main/src/api/route.py) \n Class: `RouteBulk` \n Method: `post`',
+        responses={
+            200: "Ingest report with per-record errors",
+            400: "Invalid mode or window",
+            500: "Unexpected Error",
+        },
+        params={
+            "mode": {
+                "description": "`insert` fails records whose ID exists, `upsert` overwrites them",
+                "in": "query",
+                "required": False,
+                "default": "insert",
+                "enum": ["insert", "upsert"],
+            },
+            "window": {
+                "description": f"Documents written per batch (1-{MAX_WINDOW})",
+                "in": "query",
+                "required": False,
+                "default": DEFAULT_WINDOW,
+            },
+        },
+    )
+    @serialize_with(route_ns, route_bulk_report_model, skip_none=True)
+    def post(self):
+        mode = request.args.get("mode", "insert")
+        try:
+            window = int(request.args.get("window", DEFAULT_WINDOW))
+        except ValueError:
+            return f"Window must be an integer between 1 and {MAX_WINDOW}", 400
+        if mode not in ("insert", "upsert"):
+            return "Mode must be insert or upsert", 400
+        if not 1 <= window <= MAX_WINDOW:
+            return f"Window must be between 1 and {MAX_WINDOW}", 400
+        try:
+            ingest = BulkIngest(
+                route_ns,
+                route_model,
+                ROUTE_COLLECTION,
+                mode=mode,
+                window=window,
+                on_written=put_route,
+            )
+            return ingest.run(request.stream)
+        except (CouchbaseException, Exception) as e:
+            return f"Unexpected error: {e}", 500
+
+
+ROUTE_PATH_MAX_STOPS = 3
+ROUTE_PATH_MAX_LIMIT = 50
+
+route_leg_model = route_ns.model(
+    "Route Leg",
+    {
+        "sourceairport": fields.String(description="Source Airport", example="SFO"),
+        "destinationairport": fields.String(
+            description="Destination Airport", example="JFK"
+        ),
+        "distance": fields.Float(description="Distance in km", example=4151.79),
+        "routes": fields.List(
+            fields.String,
+            description="IDs of the nonstop routes flying this leg",
+            example=["route_10000"],
+        ),
+    },
+)
+
+route_itinerary_model = route_ns.model(
+    "Route Itinerary",
+    {
+        "stops": fields.Integer(description="Connections on the way", example=1),
+        "distance": fields.Float(description="Total distance in km", example=9120.5),
+        "legs": fields.List(fields.Nested(route_leg_model)),
+    },
+)
+
+
+@route_ns.route("/path")
+@route_ns.doc(
+    description="Find itineraries between two Airports with up to `max_stops` connections, shortest total distance first. \n\n The search runs over the in-memory route index, which holds the nonstop routes of the route collection as an array-backed graph. Chaining [SQL++ queries](https://docs.couchbase.com/python-sdk/current/howtos/n1ql-queries-with-sdk.html) for every hop would take one round trip per airport visited.\n\n Code: [`api/route.py`](https://github.com/couchbase-examples/python-quickstart/blob/main/src/api/route.py) \n Class: `RoutePath` \n Method: `get`",
+    responses={
+        200: "Itineraries ordered by distance",
+        400: "Invalid parameters",
+        503: "Route index is loading",
+        500: "Unexpected Error",
+    },
+    params={
+        "from": {
+            "description": "Source airport",
+            "in": "query",
+            "required": True,
+            "example": "SFO",
+        },
+        "to": {
+            "description": "Destination airport",
+            "in": "query",
+            "required": True,
+            "example": "LHR",
+        },
+        "max_stops": {
+            "description": f"Maximum number of connections (0-{ROUTE_PATH_MAX_STOPS})",
+            "in": "query",
+            "required": False,
+            "default": 1,
+        },
+        "limit": {
+            "description": f"Number of itineraries to return (1-{ROUTE_PATH_MAX_LIMIT})",
+            "in": "query",
+            "required": False,
+            "default": 10,
+        },
+    },
+)
+class RoutePath(TracedResource):
+    @serialize_list_with(route_ns, route_itinerary_model)
+    def get(self):
+        source = request.args.get("from", "")
+        destination = request.args.get("to", "")
+        try:
+            max_stops = int(request.args.get("max_stops", 1))
+            limit = int(request.args.get("limit", 10))
+        except ValueError:
+            return "max_stops and limit must be integers", 400
+        if not source or not destination:
+            return "Both from and to airports are required", 400
+        if not 0 <= max_stops <= ROUTE_PATH_MAX_STOPS:
+            return f"max_stops must be between 0 and {ROUTE_PATH_MAX_STOPS}", 400
+        if not 1 <= limit <= ROUTE_PATH_MAX_LIMIT:
+            return f"limit must be between 1 and {ROUTE_PATH_MAX_LIMIT}", 400
+        if not route_index.ready:
+            return "Route index is loading, try again shortly", 503
+
+        try:
+            itineraries = route_index.paths(
+                source, destination, max_stops=max_stops, limit=limit
+            )
+            return [
+                {
+                    "stops": len(legs) - 1,
+                    "distance": distance,
+                    "legs": [
+                        {
+                            "sourceairport": leg.source,
+                            "destinationairport": leg.destination,
+                            "distance": leg.distance,
+                            "routes": leg.routes,
+                        }
+                        for leg in legs
+                    ],
+                }
+                for distance, legs in itineraries
+            ]
+        except (CouchbaseException, Exception) as e:
+            return f"Unexpected error: {e}", 500
+
+
+ROUTE_STATS_MAX_PERCENTILES = 10
+ROUTE_STATS_MAX_LIMIT = 1000
+
+route_stats_group_model = route_ns.model(
+    "Route Stats Group",
+    {
+        "group": fields.Raw(description="Value of the grouped field", example="AA"),
+        "count": fields.Integer(description="Routes in the group", example=2354),
+        "values": fields.Integer(
+            description="Routes in the group having the metric", example=2354
+        ),
+        "sum": fields.Float(description="Sum of the metric", example=4583021.6),
+        "mean": fields.Float(description="Mean of the metric", example=1946.9),
+        "min": fields.Float(description="Smallest value of the metric", example=72.8),
+        "max": fields.Float(description="Largest value of the metric", example=12021.9),
+        "percentiles": fields.Raw(
+            description="Value of the metric at each requested percentile",
+            example={"50": 1403.2, "90": 4102.5, "99": 8370.1},
+        ),
+    },
+)
+
+route_stats_model = route_ns.model(
+    "Route Stats",
+    {
+        "group_by": fields.String(description="Grouped field", example="airline"),
+        "metric": fields.String(description="Aggregated metric", example="distance"),
+        "routes": fields.Integer(description="Routes counted", example=24024),
+        "groups": fields.Integer(description="Number of groups", example=187),
+        "stats": fields.List(
+            fields.Nested(route_stats_group_model),
+            description="Largest groups first",
+        ),
+    },
+)
+
+
+@route_ns.route("/stats")
+@route_ns.doc(
+    description="Get statistics of a metric over the routes, grouped by a field, for example the distance distribution per airline, the route counts per airport or the equipment mix. \n\n The aggregates are computed with vectorised [NumPy](https://numpy.org/) operations over the in-memory columnar snapshot of the route collection, instead of a [SQL++ query](https://docs.couchbase.com/python-sdk/current/howtos/n1ql-queries-with-sdk.html) scanning every route document. Grouping by `equipment` counts a route once for each of its aircraft types. The `flights` metric is the number of weekly flights in a route's schedule.\n\n Code: [`api/route.py`](https://github.com/couchbase-examples/python-quickstart/blob/main/src/api/route.py) \n Class: `RouteStats` \n Method: `get`",
+    responses={
+        200: "Statistics per group, largest groups first",
+        400: "Invalid parameters",
+        503: "Route snapshot is loading",
+        500: "Unexpected Error",
+    },
+    params={
+        "group_by": {
+            "description": f"Field to group the routes by: {', '.join(STATS_GROUPS)}",
+            "in": "query",
+            "required": False,
+            "default": "airline",
+        },
+        "metric": {
+            "description": f"Metric to aggregate: {', '.join(STATS_METRICS)}",
+            "in": "query",
+            "required": False,
+            "default": "distance",
+        },
+        "percentiles": {
+            "description": f"Comma-separated percentiles from 0 to 100 (up to {ROUTE_STATS_MAX_PERCENTILES})",
+            "in": "query",
+            "required": False,
+            "default": "50,90,99",
+        },
+        "limit": {
+            "description": f"Number of groups to return (1-{ROUTE_STATS_MAX_LIMIT})",
+            "in": "query",
+            "required": False,
+            "default": 100,
+        },
+    },
+)
+class RouteStats(TracedResource):
+    @serialize_with(route_ns, route_stats_model)
+    def get(self):
+        group_by = request.args.get("group_by", "airline")
+        metric = request.args.get("metric", "distance")
+        try:
+            percentiles = [
+                float(percentile)
+                for percentile in request.args.get("percentiles", "50,90,99").split(",")
+                if percentile.strip()
+            ]
+            limit = int(request.args.get("limit", 100))
+        except ValueError:
+            return "percentiles must be numbers and limit an integer", 400
+        if group_by not in STATS_GROUPS:
+            return f"group_by must be one of {', '.join(STATS_GROUPS)}", 400
+        if metric not in STATS_METRICS:
+            return f"metric must be one of {', '.join(STATS_METRICS)}", 400
+        if len(percentiles) > ROUTE_STATS_MAX_PERCENTILES or not all(
+            0 <= percentile <= 100 for percentile in percentiles
+        ):
+            return (
+                f"Up to {ROUTE_STATS_MAX_PERCENTILES} percentiles between 0 and 100 are allowed",
+                400,
+            )
+        if not 1 <= limit <= ROUTE_STATS_MAX_LIMIT:
+            return f"limit must be between 1 and {ROUTE_STATS_MAX_LIMIT}", 400
+        if not route_snapshot.ready:
+            return "Route snapshot is loading, try again shortly", 503
+
+        try:
+            stats = group_stats(
+                route_snapshot.view(), group_by, metric, percentiles, limit
+            )
+            return dict(stats, group_by=group_by, metric=metric)
+        except (CouchbaseException, Exception) as e:
+            return f"Unexpected error: {e}", 500
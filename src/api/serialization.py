@@ -0,0 +1,266 @@
+import json
+from functools import wraps
+from flask import Response, current_app, request
+from flask_restx import fields, marshal
+from flask_restx.utils import merge, unpack
+from werkzeug.wrappers import Response as BaseResponse
+from extensions import tracer
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is optional
+    orjson = None
+
+# Field types whose values are passed through unchanged when already of this type
+FAST_TYPES = {
+    fields.String: str,
+    fields.Integer: int,
+    fields.Float: float,
+    fields.Boolean: bool,
+}
+
+# Keys that dict objects also have as attributes; flask_restx resolves these
+# differently for missing keys, so they always take the generic path
+DICT_ATTRIBUTES = set(dir(dict))
+
+_projectors = {}
+
+# orjson writes compact separators and raw UTF-8, so its bytes differ from the
+# ones flask_restx writes; it is only used once enabled with `enable_orjson`
+use_orjson = False
+
+
+def is_plain(field) -> bool:
+    """True if the field only reads its own key and has no default or mask"""
+    return (
+        field.attribute is None
+        and field.default is None
+        and getattr(field, "mask", None) is None
+    )
+
+
+def compile_field(key, field):
+    """Return a function producing `field.output(key, obj)` for a dict obj"""
+    if isinstance(field, type):
+        field = field()
+
+    def generic(obj):
+        return field.output(key, obj)
+
+    if not isinstance(key, str) or "." in key or key in DICT_ATTRIBUTES:
+        return generic
+    if not is_plain(field):
+        return generic
+
+    if type(field) is fields.Raw:
+        return lambda obj: obj.get(key)
+
+    fast_type = FAST_TYPES.get(type(field))
+    if fast_type is not None:
+
+        def primitive(obj):
+            value = obj.get(key)
+            if value is None or type(value) is fast_type:
+                return value
+            return field.output(key, obj)
+
+        return primitive
+
+    if type(field) is fields.Nested and not field.as_list:
+        project = compile_model(field.nested, skip_none=field.skip_none)
+        allow_null = field.allow_null
+
+        def nested(obj):
+            value = obj.get(key)
+            if type(value) is dict:
+                return project(value)
+            if value is None and allow_null:
+                return None
+            return field.output(key, obj)
+
+        return nested
+
+    if type(field) is fields.List:
+        container = field.container
+        if type(container) is fields.Nested and is_plain(container):
+            project = compile_model(container.nested, skip_none=container.skip_none)
+
+            def items(values):
+                if all(type(value) is dict for value in values):
+                    return [project(value) for value in values]
+                return None
+
+        elif type(container) in FAST_TYPES and is_plain(container):
+            fast_type = FAST_TYPES[type(container)]
+
+            def items(values):
+                if all(type(value) is fast_type for value in values):
+                    return list(values)
+                return None
+
+        else:
+            return generic
+
+        def list_field(obj):
+            value = obj.get(key)
+            if value is None:
+                return None
+            if type(value) is list:
+                result = items(value)
+                if result is not None:
+                    return result
+            return field.output(key, obj)
+
+        return list_field
+
+    return generic
+
+
+def compile_model(model, skip_none=False):
+    """Compile a model into a function equivalent to `marshal(obj, model)` for dicts
+
+    The fields are resolved once, and values that already have the declared
+    type are copied without going through the field classes. Anything else is
+    handed to the field itself, so the output always matches flask_restx.
+    """
+    cache_key = (id(model), skip_none)
+    project = _projectors.get(cache_key)
+    if project is not None:
+        return project
+
+    resolved = getattr(model, "resolved", model)
+    if any(
+        isinstance(field, (dict, fields.Wildcard, fields.Polymorph))
+        for field in resolved.values()
+    ):
+        # Inline dicts, wildcards and polymorphism are left to flask_restx
+        def project(obj):
+            return marshal(obj, model, skip_none=skip_none)
+
+    else:
+        compiled = [(key, compile_field(key, field)) for key, field in resolved.items()]
+
+        if skip_none:
+
+            def project(obj):
+                out = {}
+                for key, output in compiled:
+                    value = output(obj)
+                    if value is not None and not (
+                        isinstance(value, dict) and not value
+                    ):
+                        out[key] = value
+                return out
+
+        else:
+
+            def project(obj):
+                return {key: output(obj) for key, output in compiled}
+
+    _projectors[cache_key] = project
+    return project
+
+
+def serialize(data, model, skip_none=False):
+    """Fast equivalent of `marshal(data, model, skip_none=skip_none)`"""
+    project = compile_model(model, skip_none=skip_none)
+    if isinstance(data, (list, tuple)):
+        return [
+            (
+                project(item)
+                if type(item) is dict
+                else marshal(item, model, skip_none=skip_none)
+            )
+            for item in data
+        ]
+    if type(data) is dict:
+        return project(data)
+    return marshal(data, model, skip_none=skip_none)
+
+
+def enable_orjson() -> bool:
+    """Encode responses with orjson if it is installed, returning whether it is"""
+    global use_orjson
+    use_orjson = orjson is not None
+    return use_orjson
+
+
+def dumps(data, **settings) -> bytes:
+    """Encode data as JSON like flask_restx, or with orjson once it is enabled
+
+    Without settings the output is that of `json.dumps`: ", " and ": "
+    separators and non-ASCII characters escaped. orjson is not used when
+    settings are given.
+    """
+    if use_orjson and not settings:
+        try:
+            return orjson.dumps(data)
+        except TypeError:
+            # For example integers beyond 64 bits or non-string keys
+            pass
+    return json.dumps(data, **settings).encode("utf-8")
+
+
+def json_response(data, code=200, headers=None) -> Response:
+    """Build the JSON response flask_restx would, without its generic encoder
+
+    The settings of `output_json` are honoured, so the body has the bytes
+    flask_restx would write, unless orjson is enabled.
+    """
+    settings = dict(current_app.config.get("RESTX_JSON", {}))
+    if current_app.debug:
+        settings.setdefault("indent", 4)
+    response = Response(
+        dumps(data, **settings) + b"\n", code, mimetype="application/json"
+    )
+    response.headers.extend(headers or {})
+    return response
+
+
+def serialize_with(
+    namespace, model, as_list=False, code=200, description=None, **kwargs
+):
+    """Drop-in replacement for `namespace.marshal_with` using compiled models
+
+    Responses returned by the handler, such as streamed lists, are passed
+    through. Requests using a field mask header fall back to flask_restx.
+    """
+
+    def decorator(func):
+        doc = {
+            "responses": {
+                str(code): (
+                    (description, [model], kwargs)
+                    if as_list
+                    else (description, model, kwargs)
+                )
+            },
+            "__mask__": kwargs.get("mask", True),
+        }
+        func.__apidoc__ = merge(getattr(func, "__apidoc__", {}), doc)
+        skip_none = kwargs.get("skip_none", False)
+
+        @wraps(func)
+        def wrapper(*args, **kw):
+            resp = func(*args, **kw)
+            if isinstance(resp, BaseResponse):
+                return resp
+            data, status, headers = unpack(resp)
+            with tracer.span("serialize"):
+                if request.headers.get(current_app.config["RESTX_MASK_HEADER"]):
+                    mask = request.headers[current_app.config["RESTX_MASK_HEADER"]]
+                    return (
+                        marshal(data, model, skip_none=skip_none, mask=mask),
+                        status,
+                        headers,
+                    )
+                return json_response(serialize(data, model, skip_none), status, headers)
+
+        return wrapper
+
+    return decorator
+
+
+def serialize_list_with(namespace, model, **kwargs):
+    """Drop-in replacement for `namespace.marshal_list_with`"""
+    return serialize_with(namespace, model, as_list=True, **kwargs)
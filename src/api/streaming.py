@@ -0,0 +1,48 @@
+from flask import Response, request, stream_with_context
+from api import serialization
+from api.serialization import dumps, serialize
+
+# Content types of the ?stream= formats supported by the list endpoints
+STREAM_FORMATS = {"json": "application/json", "ndjson": "application/x-ndjson"}
+
+STREAM_PARAM = {
+    "description": "Stream rows as they arrive from the query service, as a chunked JSON array (`json`) or one JSON object per line (`ndjson`)",
+    "in": "query",
+    "required": False,
+    "enum": list(STREAM_FORMATS),
+}
+
+
+def stream_format():
+    """Return the ?stream= format of the current request, or None"""
+    format = request.args.get("stream", "")
+    return format if format in STREAM_FORMATS else None
+
+
+def stream_rows(rows, model, format):
+    """Stream query rows marshalled with model, without holding the page in memory
+
+    The first row is fetched before the response starts, so errors such as a
+    failed query are still raised to the handler and reported with a status code.
+    """
+    rows = iter(rows)
+    first = next(rows, None)
+    # Matches the separator of the encoder used for non-streamed lists
+    separator = b"," if serialization.use_orjson else b", "
+
+    def generate():
+        if format == "ndjson":
+            if first is not None:
+                yield dumps(serialize(first, model)) + b"\n"
+            for row in rows:
+                yield dumps(serialize(row, model)) + b"\n"
+        else:
+            if first is None:
+                yield b"[]\n"
+                return
+            yield b"[" + dumps(serialize(first, model))
+            for row in rows:
+                yield separator + dumps(serialize(row, model))
+            yield b"]\n"
+
+    return Response(stream_with_context(generate()), mimetype=STREAM_FORMATS[format])
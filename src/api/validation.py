@@ -0,0 +1,20 @@
+from jsonschema import Draft4Validator
+
+
+def payload_validator(namespace, model):
+    """Build a validator for a namespace model, like `expect(..., validate=True)`
+
+    The returned function takes a payload and returns a dict of field errors
+    in the same format as flask_restx, which is empty when the payload is valid.
+    """
+    schema = dict(model.__schema__)
+    # Nested models are referenced as #/definitions/<name>
+    schema["definitions"] = {
+        name: nested.__schema__ for name, nested in namespace.models.items()
+    }
+    validator = Draft4Validator(schema)
+
+    def validate(data) -> dict:
+        return dict(model.format_error(e) for e in validator.iter_errors(data))
+
+    return validate
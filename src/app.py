@@ -1,24 +1,31 @@
-from extensions import couchbase_db
+import time
+
+# Measure the startup time, including the imports below
+startup_started = time.perf_counter()
+
+from extensions import (
+    couchbase_db,
+    route_index,
+    route_snapshot,
+    airport_geo_index,
+    hotel_index,
+    read_replica,
+    metrics,
+    tracer,
+)
+from tracing import InMemoryExporter, FileExporter
 from api.airport import airport_ns
 from api.airline import airline_ns
 from api.route import route_ns
 from api.hotel import hotel_ns
+from api.admin import admin_ns
+from api.serialization import enable_orjson
 import os
 from dotenv import load_dotenv
 from flask import Flask
 from flask_restx import Api
 
-# Define the flask app and api
-app = Flask(__name__)
-
-# Disable field masks in the Swagger docs
-# https://flask-restx.readthedocs.io/en/latest/mask.html
-app.config["RESTX_MASK_SWAGGER"] = False
-
-api = Api(
-    title="Python Quickstart using Flask",
-    version="1.0",
-    description="""
+API_DESCRIPTION = """
     A quickstart API using Python with Couchbase, Flask & travel-sample data.
 
     We have a visual representation of the API documentation using Swagger which allows you to interact with the API's endpoints directly through the browser. It provides a clear view of the API including endpoints, HTTP methods, request parameters, and response objects. 
@@ -36,35 +43,181 @@ api = Api(
     Swagger documents the structure of request and response bodies using models. These models define the expected data structure using JSON schema and are extremely helpful in understanding what data to send and expect.
 
     For details on the API, please check the tutorial on the Couchbase Developer Portal: https://developer.couchbase.com/tutorial-quickstart-flask-python/
-    """,
-)
-api.init_app(app)
-
-load_dotenv()
-
-conn_str = os.getenv("DB_CONN_STR")
-username = os.getenv("DB_USERNAME")
-password = os.getenv("DB_PASSWORD")
-
-if conn_str is None:
-    print("DB_CONN_STR environment variable not set")
-    exit()
-if username is None:
-    print("DB_USERNAME environment variable not set")
-    exit()
-if password is None:
-    print("DB_PASSWORD environment variable not set")
-    exit()
-
-# Create the database connection
-couchbase_db.init_app(conn_str, username, password, app)
-couchbase_db.connect()
-
-# Add the routes
-api.add_namespace(airport_ns, path="/api/v1/airport")
-api.add_namespace(airline_ns, path="/api/v1/airline")
-api.add_namespace(route_ns, path="/api/v1/route")
-api.add_namespace(hotel_ns, path="/api/v1/hotel")
+    """
+
+
+def create_app(start: bool = True) -> Flask:
+    """Create and configure the Flask application
+
+    With start=False nothing connects to the cluster and no threads are
+    started, so a pre-fork server can load the application once and call
+    `start_app` in every worker after fork (see gunicorn.conf.py).
+    """
+    # Define the flask app and api
+    app = Flask(__name__)
+
+    # Disable field masks in the Swagger docs
+    # https://flask-restx.readthedocs.io/en/latest/mask.html
+    app.config["RESTX_MASK_SWAGGER"] = False
+
+    api = Api(
+        title="Python Quickstart using Flask",
+        version="1.0",
+        description=API_DESCRIPTION,
+    )
+    api.init_app(app)
+
+    load_dotenv()
+
+    conn_str = os.getenv("DB_CONN_STR")
+    username = os.getenv("DB_USERNAME")
+    password = os.getenv("DB_PASSWORD")
+
+    if conn_str is None:
+        print("DB_CONN_STR environment variable not set")
+        exit()
+    if username is None:
+        print("DB_USERNAME environment variable not set")
+        exit()
+    if password is None:
+        print("DB_PASSWORD environment variable not set")
+        exit()
+
+    app.config["DB_CONN_STR"] = conn_str
+    app.config["DB_USERNAME"] = username
+    app.config["DB_PASSWORD"] = password
+    app.config["DB_FAST_START"] = os.getenv("DB_FAST_START", "false").lower() == "true"
+    app.config["DB_PROVISION"] = os.getenv("DB_PROVISION", "true").lower() == "true"
+
+    # Optionally run the fixed SQL++ statements as prepared statements
+    if os.getenv("DB_PREPARED_STATEMENTS", "false").lower() == "true":
+        couchbase_db.enable_prepared_statements()
+
+    # Optionally cache KV gets in memory, with per-collection TTLs in seconds
+    doc_cache_size = int(os.getenv("DOC_CACHE_SIZE", 0))
+    if doc_cache_size > 0:
+        couchbase_db.enable_cache(
+            max_size=doc_cache_size,
+            default_ttl=float(os.getenv("DOC_CACHE_TTL", 60)),
+            ttls={
+                collection: float(os.getenv(f"DOC_CACHE_TTL_{collection.upper()}"))
+                for collection in ("airline", "airport", "route", "hotel")
+                if os.getenv(f"DOC_CACHE_TTL_{collection.upper()}") is not None
+            },
+        )
+
+    # Optionally cache hotel filter search results in memory
+    filter_cache_size = int(os.getenv("FILTER_CACHE_SIZE", 0))
+    if filter_cache_size > 0:
+        couchbase_db.enable_filter_cache(
+            max_size=filter_cache_size,
+            ttl=float(os.getenv("FILTER_CACHE_TTL", 30)),
+        )
+
+    # Optionally encode responses with orjson, at the cost of flask_restx's exact bytes
+    if os.getenv("ORJSON", "false").lower() == "true":
+        enable_orjson()
+
+    # Record request and Couchbase operation latencies for /api/v1/admin/metrics
+    if os.getenv("METRICS", "true").lower() == "true":
+        metrics.instrument(app)
+        couchbase_db.enable_metrics(metrics.operations)
+
+    # Optionally log the SQL++ and FTS operations slower than a threshold
+    slow_log_threshold = float(os.getenv("SLOW_LOG_THRESHOLD_MS", 0))
+    if slow_log_threshold > 0:
+        couchbase_db.enable_slow_log(
+            threshold=slow_log_threshold / 1000,
+            max_size=int(os.getenv("SLOW_LOG_SIZE", 100)),
+        )
+
+    # Trace a sample of the requests, propagating the traceparent header, and
+    # keep their spans for /api/v1/admin/traces or append them to a file
+    trace_exporter = os.getenv("TRACE_EXPORTER", "memory").lower()
+    if trace_exporter == "memory":
+        tracer.exporter = InMemoryExporter(int(os.getenv("TRACE_BUFFER_SIZE", 100)))
+    elif trace_exporter == "file":
+        tracer.exporter = FileExporter(os.getenv("TRACE_FILE", "traces.jsonl"))
+    tracer.sample_rate = float(os.getenv("TRACE_SAMPLE_RATE", 0.01))
+    tracer.instrument(app)
+    couchbase_db.enable_tracing(tracer)
+
+    # Add the routes
+    api.add_namespace(airport_ns, path="/api/v1/airport")
+    api.add_namespace(airline_ns, path="/api/v1/airline")
+    api.add_namespace(route_ns, path="/api/v1/route")
+    api.add_namespace(hotel_ns, path="/api/v1/hotel")
+
+    # The admin endpoints expose the statements and parameters of recent
+    # requests, so they are only served when explicitly enabled
+    if os.getenv("ADMIN_API", "false").lower() == "true":
+        api.add_namespace(admin_ns, path="/api/v1/admin")
+
+    if start:
+        start_app(app)
+
+    app.config["STARTUP_SECONDS"] = time.perf_counter() - startup_started
+    print(f"Application started in {app.config['STARTUP_SECONDS']:.3f}s")
+    return app
+
+
+def start_app(app: Flask, provision: bool = True) -> None:
+    """Connect to the database and start the background indexes
+
+    Call it once per process. With provision=False this process skips the
+    scope check and search index upsert, because they already ran elsewhere.
+    """
+    # Create the database connection. In fast-start mode it is made by the first
+    # request, and provisioning runs in the background or from provision.py
+    couchbase_db.init_app(
+        app.config["DB_CONN_STR"],
+        app.config["DB_USERNAME"],
+        app.config["DB_PASSWORD"],
+        app,
+        lazy=app.config["DB_FAST_START"],
+        provision=provision and app.config["DB_PROVISION"],
+    )
+
+    # Optionally answer KV gets and the airline and airport lists from a local
+    # SQLite copy of the inventory scope, refreshed in the background from the
+    # documents whose CAS changed, found through an index on META().cas
+    if os.getenv("READ_REPLICA", "false").lower() == "true":
+        read_replica.open(
+            os.getenv("READ_REPLICA_PATH", "inventory_replica.sqlite3"),
+            source=f"{couchbase_db.conn_str}/{couchbase_db.bucket_name}/{couchbase_db.scope_name}",
+            create_indexes=provision and app.config["DB_PROVISION"],
+        )
+        couchbase_db.enable_read_replica(read_replica)
+        read_replica.start(
+            couchbase_db, refresh=float(os.getenv("READ_REPLICA_REFRESH", 60))
+        )
+
+    # Load the route network into memory in the background and reload it every
+    # minute by default, to pick up writes made outside this process
+    if os.getenv("ROUTE_INDEX", "true").lower() == "true":
+        route_index.start(
+            couchbase_db, refresh=float(os.getenv("ROUTE_INDEX_REFRESH", 60))
+        )
+
+    # Load the route collection into NumPy columns in the background
+    if os.getenv("ROUTE_SNAPSHOT", "true").lower() == "true":
+        route_snapshot.start(
+            couchbase_db, refresh=float(os.getenv("ROUTE_SNAPSHOT_REFRESH", 60))
+        )
+
+    # Load the airport coordinates into a spatial grid in the background
+    if os.getenv("AIRPORT_GEO_INDEX", "true").lower() == "true":
+        airport_geo_index.start(
+            couchbase_db, refresh=float(os.getenv("AIRPORT_GEO_INDEX_REFRESH", 60))
+        )
+
+    # Load hotel names for autocomplete in the background and reload them periodically
+    if os.getenv("HOTEL_INDEX", "true").lower() == "true":
+        hotel_index.start(
+            couchbase_db, refresh=float(os.getenv("HOTEL_INDEX_REFRESH", 300))
+        )
+
 
 if __name__ == "__main__":
+    app = create_app()
     app.run(debug=True, host="0.0.0.0", port=8080)
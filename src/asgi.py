@@ -0,0 +1,333 @@
+"""ASGI entry point serving the API from an asyncio event loop.
+
+The handlers mirror the Flask resources in `api/` and share their models and
+SQL++ statements, but talk to Couchbase through `AsyncCouchbaseClient` so a
+single process can keep thousands of KV and SQL++ requests in flight.
+
+Only the endpoints registered on `router` are served: document CRUD for
+airports, airlines and routes, the offset-paginated airport and airline lists,
+direct connections, airlines to an airport, hotel autocomplete and the hotel
+filter. Batch gets, bulk ingest, cursor pagination, streaming, route paths and
+stats, nearest airports, hotels near a point and the admin endpoints are
+served by the Flask application only, as are the document and filter caches,
+coalesced reads, prepared statements, the in-memory indexes, the read replica,
+metrics and tracing.
+
+Run it with an ASGI server, for example:
+
+    uvicorn asgi:app --host 0.0.0.0 --port 8080
+"""
+
+import json
+import os
+import re
+from urllib.parse import parse_qs
+from dotenv import load_dotenv
+from couchbase.exceptions import (
+    CouchbaseException,
+    DocumentExistsException,
+    DocumentNotFoundException,
+)
+from extensions import async_couchbase_db
+from api.airport import (
+    airport_ns,
+    airport_model,
+    destination_airports_model,
+    AIRPORT_COLLECTION,
+    AIRPORT_LIST_QUERY,
+    AIRPORT_LIST_BY_COUNTRY_QUERY,
+    DIRECT_CONNECTIONS_QUERY,
+)
+from api.airline import (
+    airline_ns,
+    airline_model,
+    AIRLINE_COLLECTION,
+    AIRLINE_LIST_QUERY,
+    AIRLINE_LIST_BY_COUNTRY_QUERY,
+    AIRLINES_TO_AIRPORT_QUERY,
+)
+from api.route import route_ns, route_model, ROUTE_COLLECTION
+from api.hotel import hotel_ns, hotel_model, hotel_name_model
+from api.validation import payload_validator
+from api.serialization import dumps, enable_orjson, serialize
+
+
+class Request(object):
+    """The parts of an ASGI HTTP request the handlers need"""
+
+    def __init__(self, scope, body: bytes, path_params: dict) -> None:
+        self.method = scope["method"]
+        self.path = scope["path"]
+        self.path_params = path_params
+        self.body = body
+        query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+        self.args = {key: values[0] for key, values in query.items()}
+
+    def json(self):
+        return json.loads(self.body or b"null")
+
+
+class Router(object):
+    """Map (method, path template) pairs to async handlers"""
+
+    def __init__(self) -> None:
+        self.routes = []
+
+    def route(self, method: str, template: str):
+        pattern = re.compile("^" + re.sub(r"{(\w+)}", r"(?P<\1>[^/]+)", template) + "$")
+
+        def decorator(handler):
+            self.routes.append((method, template, pattern, handler))
+            # Static paths such as /list must win over /{id}
+            self.routes.sort(key=lambda r: "{" in r[1])
+            return handler
+
+        return decorator
+
+    def match(self, method: str, path: str):
+        allowed = False
+        for route_method, _, pattern, handler in self.routes:
+            match = pattern.match(path)
+            if match:
+                if route_method == method:
+                    return handler, match.groupdict()
+                allowed = True
+        return None, allowed
+
+
+def validate(validator, data):
+    """Return a flask_restx style 400 payload if the data fails validation"""
+    errors = validator(data)
+    if errors:
+        return {"errors": errors, "message": "Input payload validation failed"}
+    return None
+
+
+router = Router()
+
+
+def add_document_routes(namespace, path, model, collection, label):
+    """Register the KV create/read/update/delete handlers for a collection"""
+    validator = payload_validator(namespace, model)
+
+    @router.route("POST", f"{path}/{{id}}")
+    async def create(request):
+        data = request.json()
+        errors = validate(validator, data)
+        if errors:
+            return errors, 400
+        try:
+            await async_couchbase_db.insert_document(
+                collection, key=request.path_params["id"], doc=data
+            )
+            return data, 201
+        except DocumentExistsException:
+            return f"{label} already exists", 409
+        except (CouchbaseException, Exception) as e:
+            return f"Unexpected error: {e}", 500
+
+    @router.route("GET", f"{path}/{{id}}")
+    async def read(request):
+        try:
+            result = await async_couchbase_db.get_document(
+                collection, key=request.path_params["id"]
+            )
+            data, status = result.content_as[dict], 200
+        except DocumentNotFoundException:
+            data, status = f"{label} not found", 404
+        except (CouchbaseException, Exception) as e:
+            data, status = f"Unexpected error: {e}", 500
+        # Errors are marshalled with the model too, like the Flask resource does
+        return serialize(data, model, skip_none=True), status
+
+    @router.route("PUT", f"{path}/{{id}}")
+    async def update(request):
+        updated_doc = request.json()
+        errors = validate(validator, updated_doc)
+        if errors:
+            return errors, 400
+        try:
+            await async_couchbase_db.upsert_document(
+                collection, key=request.path_params["id"], doc=updated_doc
+            )
+            return updated_doc, 200
+        except (CouchbaseException, Exception) as e:
+            return f"Unexpected error: {e}", 500
+
+    @router.route("DELETE", f"{path}/{{id}}")
+    async def delete(request):
+        try:
+            await async_couchbase_db.delete_document(
+                collection, key=request.path_params["id"]
+            )
+            return "Deleted", 204
+        except DocumentNotFoundException:
+            return f"{label} not found", 404
+        except (CouchbaseException, Exception) as e:
+            return f"Unexpected error: {e}", 500
+
+
+add_document_routes(
+    airport_ns, "/api/v1/airport", airport_model, AIRPORT_COLLECTION, "Airport"
+)
+add_document_routes(
+    airline_ns, "/api/v1/airline", airline_model, AIRLINE_COLLECTION, "Airline"
+)
+add_document_routes(route_ns, "/api/v1/route", route_model, ROUTE_COLLECTION, "Route")
+
+
+@router.route("GET", "/api/v1/airport/list")
+async def airport_list(request):
+    country = request.args.get("country", "")
+    try:
+        limit = int(request.args.get("limit", 10))
+        offset = int(request.args.get("offset", 0))
+        query = AIRPORT_LIST_BY_COUNTRY_QUERY if country else AIRPORT_LIST_QUERY
+        airports = await async_couchbase_db.query(
+            query, country=country, limit=limit, offset=offset
+        )
+        return serialize(airports, airport_model), 200
+    except (CouchbaseException, Exception) as e:
+        return f"Unexpected error: {e}", 500
+
+
+@router.route("GET", "/api/v1/airport/direct-connections")
+async def direct_connections(request):
+    airport = request.args.get("airport", "")
+    try:
+        limit = int(request.args.get("limit", 10))
+        offset = int(request.args.get("offset", 0))
+        airports = await async_couchbase_db.query(
+            DIRECT_CONNECTIONS_QUERY, airport=airport, limit=limit, offset=offset
+        )
+        return serialize(airports, destination_airports_model), 200
+    except (CouchbaseException, Exception) as e:
+        return f"Unexpected error: {e}", 500
+
+
+@router.route("GET", "/api/v1/airline/list")
+async def airline_list(request):
+    country = request.args.get("country", "")
+    try:
+        limit = int(request.args.get("limit", 10))
+        offset = int(request.args.get("offset", 0))
+        query = AIRLINE_LIST_BY_COUNTRY_QUERY if country else AIRLINE_LIST_QUERY
+        airlines = await async_couchbase_db.query(
+            query, country=country, limit=limit, offset=offset
+        )
+        return serialize(airlines, airline_model), 200
+    except (CouchbaseException, Exception) as e:
+        return f"Unexpected error: {e}", 500
+
+
+@router.route("GET", "/api/v1/airline/to-airport")
+async def airlines_to_airport(request):
+    airport = request.args.get("airport", "")
+    try:
+        limit = int(request.args.get("limit", 10))
+        offset = int(request.args.get("offset", 0))
+        airlines = await async_couchbase_db.query(
+            AIRLINES_TO_AIRPORT_QUERY, airport=airport, limit=limit, offset=offset
+        )
+        return serialize(airlines, airline_model), 200
+    except (CouchbaseException, Exception) as e:
+        return f"Unexpected error: {e}", 500
+
+
+@router.route("GET", "/api/v1/hotel/autocomplete")
+async def hotel_autocomplete(request):
+    name = request.args.get("name", "")
+    try:
+        result = await async_couchbase_db.search_by_name(name=name)
+        return serialize([{"name": name} for name in result], hotel_name_model), 200
+    except (CouchbaseException, Exception) as e:
+        return f"Unexpected error: {e}", 500
+
+
+hotel_filter_validator = payload_validator(hotel_ns, hotel_model)
+
+
+@router.route("POST", "/api/v1/hotel/filter")
+async def hotel_filter(request):
+    data = request.json()
+    errors = validate(hotel_filter_validator, data)
+    if errors:
+        return errors, 400
+    try:
+        limit = int(request.args.get("limit", 10))
+        offset = int(request.args.get("offset", 0))
+        hotels = await async_couchbase_db.filter(data, limit=limit, offset=offset)
+        return serialize(hotels, hotel_model), 200
+    except (CouchbaseException, Exception) as e:
+        return f"Unexpected error: {e}", 500
+
+
+async def send_json(send, data, status: int) -> None:
+    body = b"" if status == 204 else dumps(data) + b"\n"
+    await send(
+        {
+            "type": "http.response.start",
+            "status": status,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode("latin-1")),
+            ],
+        }
+    )
+    await send({"type": "http.response.body", "body": body})
+
+
+async def lifespan(receive, send) -> None:
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            load_dotenv()
+            if os.getenv("ORJSON", "false").lower() == "true":
+                enable_orjson()
+            async_couchbase_db.init_app(
+                os.getenv("DB_CONN_STR"),
+                os.getenv("DB_USERNAME"),
+                os.getenv("DB_PASSWORD"),
+            )
+            try:
+                await async_couchbase_db.connect()
+            except (CouchbaseException, Exception) as e:
+                # The server reports the failure and exits
+                await send({"type": "lifespan.startup.failed", "message": str(e)})
+                return
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await async_couchbase_db.close()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def app(scope, receive, send) -> None:
+    """The ASGI application"""
+    if scope["type"] == "lifespan":
+        await lifespan(receive, send)
+        return
+
+    handler, path_params = router.match(scope["method"], scope["path"])
+    if handler is None:
+        status = 405 if path_params else 404
+        await send_json(
+            send,
+            {"message": "Not Found" if status == 404 else "Method Not Allowed"},
+            status,
+        )
+        return
+
+    body = b""
+    more_body = True
+    while more_body:
+        message = await receive()
+        body += message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+    request = Request(scope, body, path_params)
+    try:
+        data, status = await handler(request)
+    except ValueError:
+        data, status = {"message": "Failed to decode JSON object"}, 400
+    await send_json(send, data, status)
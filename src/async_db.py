@@ -0,0 +1,212 @@
+import json
+from datetime import timedelta
+from acouchbase.cluster import Cluster
+from couchbase.options import ClusterOptions
+from couchbase.auth import PasswordAuthenticator
+from couchbase.exceptions import CouchbaseException
+from couchbase.diagnostics import PingState, ServiceType
+from couchbase.management.search import SearchIndex
+from couchbase.exceptions import (
+    QueryIndexAlreadyExistsException,
+    ScopeNotFoundException,
+    SearchIndexNotFoundException,
+)
+from couchbase.options import SearchOptions
+import couchbase.search as search
+from db import build_filter_query, index_applied
+
+
+class AsyncCouchbaseClient(object):
+    """Class to handle interactions with Couchbase cluster from an asyncio event loop
+
+    Mirrors the interface of `db.CouchbaseClient` using the SDK's acouchbase API,
+    so every operation is awaitable and never blocks the event loop.
+    """
+
+    def __init__(self) -> None:
+        self.cluster = None
+        self.bucket = None
+        self.scope = None
+
+    def init_app(self, conn_str: str, username: str, password: str):
+        """Store the connection settings; the connection is made by `connect`"""
+        self.conn_str = conn_str
+        self.bucket_name = "travel-sample"
+        self.scope_name = "inventory"
+        self.username = username
+        self.password = password
+        self.index_name = "hotel_search"
+
+    async def connect(self) -> None:
+        """Connect to the Couchbase cluster on the running event loop
+
+        Raises a CouchbaseException if the cluster cannot be reached or has no
+        inventory scope, so the ASGI server can fail its startup.
+        """
+        if not self.cluster:
+            try:
+                # authentication for Couchbase cluster
+                auth = PasswordAuthenticator(self.username, self.password)
+
+                cluster_opts = ClusterOptions(auth)
+                # wan_development is used to avoid latency issues while connecting to Couchbase over the internet
+                cluster_opts.apply_profile("wan_development")
+
+                # connect to the cluster
+                self.cluster = await Cluster.connect(self.conn_str, cluster_opts)
+
+                # wait until the cluster is ready for use
+                await self.cluster.wait_until_ready(timedelta(seconds=5))
+
+                # get a reference to our bucket
+                self.bucket = self.cluster.bucket(self.bucket_name)
+                await self.bucket.on_connect()
+            except CouchbaseException as error:
+                print(f"Could not connect to cluster. \nError: {error}")
+                print(
+                    "Ensure that you have the travel-sample bucket loaded in the cluster."
+                )
+                await self.close()
+                raise
+
+            if not await self.check_scope_exists():
+                await self.close()
+                raise ScopeNotFoundException(
+                    message="Inventory scope does not exist in the bucket. \nEnsure that you have the inventory scope in your travel-sample bucket."
+                )
+
+            # get a reference to our scope
+            self.scope = self.bucket.scope(self.scope_name)
+            # Call the method to create the fts index if search service is enabled
+            if await self.is_search_service_enabled():
+                await self.create_search_index()
+            else:
+                print(
+                    "Search service is not enabled on this cluster. Skipping search index creation."
+                )
+
+    async def close(self) -> None:
+        """Close the connection to the Couchbase cluster"""
+        if self.cluster:
+            await self.cluster.close()
+            self.cluster = None
+            self.bucket = None
+            self.scope = None
+
+    async def check_scope_exists(self) -> bool:
+        """Check if the scope exists in the bucket"""
+        try:
+            scopes_in_bucket = [
+                scope.name for scope in await self.bucket.collections().get_all_scopes()
+            ]
+            return self.scope_name in scopes_in_bucket
+        except Exception as e:
+            print(
+                "Error fetching scopes in cluster. \nEnsure that travel-sample bucket exists."
+            )
+            print(e)
+            raise
+
+    async def is_search_service_enabled(self, min_nodes: int = 1) -> bool:
+        try:
+            ping_result = await self.cluster.ping()
+            search_endpoints = ping_result.endpoints[ServiceType.Search]
+            available_search_nodes = 0
+            for endpoint in search_endpoints:
+                if endpoint.state == PingState.OK:
+                    available_search_nodes += 1
+            return available_search_nodes >= min_nodes
+        except Exception as e:
+            print(
+                f"Error checking search service status. \nEnsure that Search Service is enabled: {e}"
+            )
+            return False
+
+    async def create_search_index(self) -> None:
+        """Upsert a fts index in the Couchbase cluster
+
+        Like `db.CouchbaseClient.create_search_index`, the upsert is skipped
+        when the index on the cluster already has the local definition.
+        """
+        try:
+            scope_index_manager = self.bucket.scope(self.scope_name).search_indexes()
+            with open(f"{self.index_name}_index.json", "r") as f:
+                index = SearchIndex.from_json(json.load(f))
+
+            try:
+                existing = await scope_index_manager.get_index(index.name)
+            except SearchIndexNotFoundException:
+                existing = None
+            if existing is not None and index_applied(index, existing):
+                print(f"Index '{self.index_name}' is up to date.")
+                return
+
+            # Updating an existing index requires its current uuid
+            if existing is not None:
+                index.uuid = existing.uuid
+            await scope_index_manager.upsert_index(index)
+            print(f"Index '{self.index_name}' created or updated successfully.")
+        except QueryIndexAlreadyExistsException:
+            print(f"Index with name '{self.index_name}' already exists")
+        except Exception as e:
+            print(f"Error upserting index '{self.index_name}': {e}")
+
+    async def get_document(self, collection_name: str, key: str):
+        """Get document by key using KV operation"""
+        return await self.scope.collection(collection_name).get(key)
+
+    async def insert_document(self, collection_name: str, key: str, doc: dict):
+        """Insert document using KV operation"""
+        return await self.scope.collection(collection_name).insert(key, doc)
+
+    async def delete_document(self, collection_name: str, key: str):
+        """Delete document using KV operation"""
+        return await self.scope.collection(collection_name).remove(key)
+
+    async def upsert_document(self, collection_name: str, key: str, doc: dict):
+        """Upsert document using KV operation"""
+        return await self.scope.collection(collection_name).upsert(key, doc)
+
+    async def query(self, sql_query, *options, **kwargs):
+        """Query Couchbase using SQL++ and return all the rows"""
+        # options are used for positional parameters
+        # kwargs are used for named parameters
+        result = self.scope.query(sql_query, *options, **kwargs)
+        return [row async for row in result.rows()]
+
+    async def search_by_name(self, name):
+        """Perform a full-text search for hotel names using the given name"""
+        names = []
+        try:
+            searchQuery = search.SearchRequest.create(
+                search.MatchQuery(name, field="name")
+            )
+            searchResult = self.scope.search(
+                self.index_name, searchQuery, SearchOptions(limit=50, fields=["name"])
+            )
+            async for row in searchResult.rows():
+                hotel = row.fields
+                names.append(hotel.get("name", ""))
+        except Exception as e:
+            print("Error while performing fts search", {e})
+        return names
+
+    async def filter(self, filter, limit, offset):
+        """Perform a full-text search with filters and pagination"""
+        hotels = []
+        try:
+            query = build_filter_query(filter)
+            if query is None:
+                return []
+
+            options = SearchOptions(fields=["*"], limit=limit, skip=offset)
+
+            result = self.scope.search(
+                self.index_name, search.SearchRequest.create(query), options
+            )
+            async for row in result.rows():
+                hotel = row.fields
+                hotels.append(hotel)
+        except Exception as e:
+            print("Error while performing fts search", {e})
+        return hotels
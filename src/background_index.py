@@ -0,0 +1,62 @@
+import threading
+import time
+from abc import ABC, abstractmethod
+
+
+class BackgroundIndex(ABC):
+    """Base class for in-memory indexes loaded from the cluster in a daemon thread
+
+    Subclasses implement `load`, which reads the documents with SQL++, swaps
+    them in and then calls `loaded`, and `size`. Until the first load completes
+    `ready` is False and callers should fall back to the cluster.
+    """
+
+    name = None
+
+    def __init__(self) -> None:
+        self.ready = False
+        self.loaded_at = None
+        self.load_seconds = None
+        self.loads = 0
+
+    def start(self, client, refresh: float = 0) -> threading.Thread:
+        """Load the index in a daemon thread, then reload it every refresh seconds"""
+
+        def run():
+            while True:
+                try:
+                    self.load(client)
+                except Exception as e:
+                    print(f"Error loading {self.name} index: {e}")
+                if refresh <= 0 and self.ready:
+                    return
+                time.sleep(refresh if refresh > 0 else 5)
+
+        thread = threading.Thread(target=run, name=f"{self.name}-index", daemon=True)
+        thread.start()
+        return thread
+
+    @abstractmethod
+    def load(self, client) -> None:
+        """Read the documents from the cluster and swap them in"""
+
+    def loaded(self, started: float) -> None:
+        """Record a completed load that began at time.monotonic() `started`"""
+        self.ready = True
+        self.loaded_at = time.time()
+        self.load_seconds = time.monotonic() - started
+        self.loads += 1
+
+    @abstractmethod
+    def size(self) -> int:
+        """Number of entries in the index"""
+
+    def stats(self) -> dict:
+        return {
+            "name": self.name,
+            "ready": self.ready,
+            "entries": self.size(),
+            "loads": self.loads,
+            "loaded_at": self.loaded_at,
+            "load_seconds": self.load_seconds,
+        }
@@ -0,0 +1,681 @@
+"""Stand-in for the Couchbase cluster, used by the endpoint benchmarks.
+
+It implements the parts of the SDK that CouchbaseClient uses, over documents
+held in memory, so the whole application runs without a cluster.
+"""
+
+import json
+import math
+import threading
+import time
+from bisect import bisect_right
+from datetime import timedelta
+from functools import lru_cache, partial
+import numpy as np
+from couchbase.exceptions import (
+    CouchbaseException,
+    DocumentExistsException,
+    DocumentNotFoundException,
+)
+from db import CouchbaseClient, geo_point
+from route_index import (
+    ROUTE_INDEX_ROUTES_QUERY,
+    ROUTE_INDEX_AIRPORTS_QUERY,
+    ROUTE_INDEX_AIRLINES_QUERY,
+)
+from route_snapshot import ROUTE_SNAPSHOT_QUERY
+from airport_geo_index import AIRPORT_GEO_INDEX_QUERY, AIRPORT_FIELDS, haversine_km
+from hotel_index import HOTEL_INDEX_QUERY
+from read_replica import (
+    REPLICA_CAS_INDEX,
+    REPLICA_CHANGES_QUERY,
+    REPLICA_IDS_QUERY,
+)
+
+# Fields stored by the hotel_search index and returned by searches for "*"
+HOTEL_STORED_FIELDS = (
+    "title",
+    "name",
+    "description",
+    "city",
+    "state",
+    "country",
+    "geo",
+)
+
+# Sort field and projected fields of the airline and airport list statements
+LIST_FIELDS = {
+    "airline": ("name", ("callsign", "country", "iata", "icao", "name")),
+    "airport": (
+        "airportname",
+        ("airportname", "city", "country", "faa", "geo", "icao", "tz"),
+    ),
+}
+
+# Longest edge n-gram of the hotel_search index's name analyzer
+EDGE_NGRAM_MAX = 8
+
+
+def normalize(sql: str) -> str:
+    return " ".join(sql.split())
+
+
+@lru_cache(maxsize=65536)
+def tokens(text: str) -> frozenset:
+    """Lower case words of a text field, as the search index would analyze it"""
+    return frozenset(text.lower().split())
+
+
+class Content(object):
+    """Stand-in for `result.content_as`
+
+    Like the SDK, the document is decoded once and `content_as[dict]` returns
+    a shallow copy of it, so nested values are shared between accesses.
+    """
+
+    __slots__ = ("value",)
+
+    def __init__(self, value) -> None:
+        self.value = value
+
+    def __getitem__(self, type_):
+        return type_(self.value)
+
+
+class GetResult(object):
+    def __init__(self, key: str, value: str, cas: int) -> None:
+        self.key = key
+        self.cas = cas
+        self.content_as = Content(json.loads(value))
+
+
+class MutationResult(object):
+    def __init__(self, key: str, cas: int) -> None:
+        self.key = key
+        self.cas = cas
+
+
+class MultiResult(object):
+    """Per-key results and exceptions, like the SDK's multi-operation results"""
+
+    def __init__(self, results: dict, exceptions: dict) -> None:
+        self.results = results
+        self.exceptions = exceptions
+        self.all_ok = not exceptions
+
+
+class QueryMetrics(object):
+    def __init__(self, elapsed: float, rows: list) -> None:
+        self._elapsed = timedelta(seconds=elapsed)
+        self._rows = rows
+
+    def elapsed_time(self) -> timedelta:
+        return self._elapsed
+
+    def execution_time(self) -> timedelta:
+        return self._elapsed
+
+    def result_count(self) -> int:
+        return len(self._rows)
+
+    def result_size(self) -> int:
+        return len(json.dumps(self._rows))
+
+
+class SearchMetrics(object):
+    def __init__(self, took: float, total_rows: int) -> None:
+        self._took = timedelta(seconds=took)
+        self._total_rows = total_rows
+
+    def took(self) -> timedelta:
+        return self._took
+
+    def total_rows(self) -> int:
+        return self._total_rows
+
+
+class Metadata(object):
+    def __init__(self, metrics) -> None:
+        self._metrics = metrics
+
+    def metrics(self):
+        return self._metrics
+
+
+class QueryResult(object):
+    """Rows of a SQL++ query, iterable once like the SDK's QueryResult"""
+
+    def __init__(self, rows: list, elapsed: float) -> None:
+        self._rows = rows
+        self._metadata = Metadata(QueryMetrics(elapsed, rows))
+
+    def __iter__(self):
+        return iter(self._rows)
+
+    def rows(self):
+        return iter(self._rows)
+
+    def metadata(self) -> Metadata:
+        return self._metadata
+
+
+class SearchRow(object):
+    def __init__(self, id: str, fields: dict) -> None:
+        self.id = id
+        self.fields = fields
+
+
+class SearchResult(object):
+    def __init__(self, rows: list, total_rows: int, took: float) -> None:
+        self._rows = rows
+        self._metadata = Metadata(SearchMetrics(took, total_rows))
+
+    def rows(self):
+        return iter(self._rows)
+
+    def metadata(self) -> Metadata:
+        return self._metadata
+
+
+class InMemoryCollection(object):
+    """Documents of one collection, stored as JSON like the data service does
+
+    Secondary indexes on a field are built on first use and kept up to date by
+    every write, so queries stay cheap while the benchmark mutates documents.
+    """
+
+    def __init__(self, scope, name: str, documents: dict) -> None:
+        self.scope = scope
+        self.name = name
+        self._documents = {}
+        self._cas = 0
+        self._lock = threading.RLock()
+        # field -> {value: set of keys}
+        self._indexes = {}
+        # field -> (version, sorted [(value, key)])
+        self._sorted = {}
+        # field -> (version, (keys, lats, lons)) of the documents with a geopoint
+        self._points = {}
+        self.version = 0
+        for key, document in documents.items():
+            self._store(key, document)
+
+    def _store(self, key: str, document: dict) -> int:
+        previous = self._documents.get(key)
+        if previous is not None:
+            self._unindex(key, previous[2])
+        # CAS values are nanosecond clocks, like the data service's
+        self._cas = max(self._cas + 1, time.time_ns())
+        value = json.dumps(document)
+        # Keep a private decoded copy for indexing and scans
+        document = json.loads(value)
+        self._documents[key] = (value, self._cas, document)
+        for field, index in self._indexes.items():
+            index.setdefault(document.get(field), set()).add(key)
+        self.version += 1
+        return self._cas
+
+    def _unindex(self, key: str, document: dict) -> None:
+        for field, index in self._indexes.items():
+            keys = index.get(document.get(field))
+            if keys is not None:
+                keys.discard(key)
+
+    def changes(self, since: int) -> list:
+        """(key, CAS, document) of the documents written at or after a CAS"""
+        with self._lock:
+            return [
+                (key, cas, document)
+                for key, (_, cas, document) in self._documents.items()
+                if cas >= since
+            ]
+
+    def scan(self) -> list:
+        """(key, document) of every document in key order, not to be modified"""
+        with self._lock:
+            items = sorted(self._documents.items())
+        return [(key, document) for key, (_, _, document) in items]
+
+    def document(self, key: str):
+        """The document, or None if it does not exist, not to be modified"""
+        with self._lock:
+            stored = self._documents.get(key)
+        return stored[2] if stored is not None else None
+
+    def keys_where(self, field: str, value) -> set:
+        """Keys of the documents whose field equals value"""
+        with self._lock:
+            index = self._indexes.get(field)
+            if index is None:
+                index = self._indexes[field] = {}
+                for key, (_, _, document) in self._documents.items():
+                    index.setdefault(document.get(field), set()).add(key)
+            return set(index.get(value, ()))
+
+    def sorted_by(self, field: str) -> list:
+        """[(value or "", key)] of every document, sorted like ORDER BY field, id"""
+        with self._lock:
+            cached = self._sorted.get(field)
+            if cached is not None and cached[0] == self.version:
+                return cached[1]
+            entries = sorted(
+                (document.get(field) or "", key)
+                for key, (_, _, document) in self._documents.items()
+            )
+            self._sorted[field] = (self.version, entries)
+            return entries
+
+    def points(self, field: str) -> tuple:
+        """Keys and coordinates in radians of the documents with a geopoint field"""
+        with self._lock:
+            cached = self._points.get(field)
+            if cached is not None and cached[0] == self.version:
+                return cached[1]
+            located = [
+                (key, point)
+                for key, (_, _, document) in self._documents.items()
+                for point in [geo_point(document.get(field))]
+                if point is not None
+            ]
+            coordinates = np.radians(
+                np.array([point for _, point in located], dtype=np.float64)
+            ).reshape(-1, 2)
+            entries = (
+                [key for key, _ in located],
+                coordinates[:, 0],
+                coordinates[:, 1],
+            )
+            self._points[field] = (self.version, entries)
+            return entries
+
+    def get(self, key: str, *options) -> GetResult:
+        self.scope.wait("kv")
+        return self._get(key)
+
+    def insert(self, key: str, document: dict, *options) -> MutationResult:
+        self.scope.wait("kv")
+        return self._insert(key, document)
+
+    def upsert(self, key: str, document: dict, *options) -> MutationResult:
+        self.scope.wait("kv")
+        return self._upsert(key, document)
+
+    def remove(self, key: str, *options) -> MutationResult:
+        self.scope.wait("kv")
+        with self._lock:
+            stored = self._documents.pop(key, None)
+            if stored is None:
+                raise DocumentNotFoundException(message=f"{self.name}/{key} not found")
+            self._unindex(key, stored[2])
+            self.version += 1
+            return MutationResult(key, stored[1])
+
+    def get_multi(self, keys: list, *options) -> MultiResult:
+        return self._multi(self._get, [(key, ()) for key in keys])
+
+    def insert_multi(self, documents: dict, *options) -> MultiResult:
+        return self._multi(
+            self._insert, [(key, (doc,)) for key, doc in documents.items()]
+        )
+
+    def upsert_multi(self, documents: dict, *options) -> MultiResult:
+        return self._multi(
+            self._upsert, [(key, (doc,)) for key, doc in documents.items()]
+        )
+
+    def _multi(self, operation, items: list) -> MultiResult:
+        # The operations of a multi-operation are pipelined: one round trip
+        self.scope.wait("kv")
+        results, exceptions = {}, {}
+        for key, args in items:
+            try:
+                results[key] = operation(key, *args)
+            except CouchbaseException as e:
+                exceptions[key] = e
+        return MultiResult(results, exceptions)
+
+    def _get(self, key: str) -> GetResult:
+        with self._lock:
+            stored = self._documents.get(key)
+        if stored is None:
+            raise DocumentNotFoundException(message=f"{self.name}/{key} not found")
+        return GetResult(key, stored[0], stored[1])
+
+    def _insert(self, key: str, document: dict) -> MutationResult:
+        with self._lock:
+            if key in self._documents:
+                raise DocumentExistsException(message=f"{self.name}/{key} exists")
+            return MutationResult(key, self._store(key, document))
+
+    def _upsert(self, key: str, document: dict) -> MutationResult:
+        with self._lock:
+            return MutationResult(key, self._store(key, document))
+
+
+class InMemoryScope(object):
+    """Stand-in for the inventory scope, answering the app's SQL++ and FTS requests
+
+    Queries are recognized by their SQL++ text, either a statement registered
+    with the client or one of the index loading queries, and answered by a
+    Python function with the same results. Any other query raises, so a new
+    statement fails loudly until it is given a stand-in here.
+    """
+
+    def __init__(self, client, dataset: dict, latency: dict = None) -> None:
+        self.client = client
+        self.latency = latency or {}
+        self.collections = {
+            name: InMemoryCollection(self, name, documents)
+            for name, documents in dataset.items()
+        }
+        self._handlers = {
+            "airlines_to_airport": self._airlines_to_airport,
+            "direct_connections": self._direct_connections,
+        }
+        for collection in LIST_FIELDS:
+            for suffix, by_country, after in (
+                ("", False, False),
+                ("_by_country", True, False),
+                ("_after", False, True),
+                ("_by_country_after", True, True),
+                ("_after_unnamed", False, True),
+                ("_by_country_after_unnamed", True, True),
+            ):
+                self._handlers[f"{collection}_list{suffix}"] = partial(
+                    self._list, collection, by_country, after
+                )
+        self._adhoc = {
+            normalize(ROUTE_INDEX_ROUTES_QUERY): self._route_index_routes,
+            normalize(ROUTE_INDEX_AIRPORTS_QUERY): self._route_index_airports,
+            normalize(ROUTE_INDEX_AIRLINES_QUERY): self._route_index_airlines,
+            normalize(ROUTE_SNAPSHOT_QUERY): self._route_snapshot,
+            normalize(AIRPORT_GEO_INDEX_QUERY): self._airport_geo_index,
+            normalize(HOTEL_INDEX_QUERY): self._hotel_index,
+        }
+        for name in self.collections:
+            # Changes are found by scanning the documents, creating the index is a no-op
+            self._adhoc[normalize(REPLICA_CAS_INDEX.format(collection=name))] = list
+            self._adhoc[normalize(REPLICA_CHANGES_QUERY.format(collection=name))] = (
+                lambda since, name=name: self._replica_changes(name, since)
+            )
+            self._adhoc[normalize(REPLICA_IDS_QUERY.format(collection=name))] = (
+                lambda name=name: [key for key, _ in self.collections[name].scan()]
+            )
+
+    def wait(self, service: str) -> None:
+        """Sleep for the simulated round trip to the service, if any"""
+        delay = self.latency.get(service, 0)
+        if delay > 0:
+            time.sleep(delay)
+
+    def collection(self, name: str) -> InMemoryCollection:
+        return self.collections[name]
+
+    def _handler(self, sql: str):
+        sql = normalize(sql)
+        handler = self._adhoc.get(sql)
+        if handler is not None:
+            return handler
+        for name, statement in self.client.statements.items():
+            if normalize(statement.sql) == sql and name in self._handlers:
+                return self._handlers[name]
+        raise CouchbaseException(message=f"No in-memory stand-in for query: {sql}")
+
+    def query(self, sql: str, *options, **params) -> QueryResult:
+        started = time.perf_counter()
+        # Options passed as keyword arguments, like metrics=True, are not parameters
+        params.pop("metrics", None)
+        handler = self._handler(sql)
+        self.wait("query")
+        rows = handler(**params)
+        return QueryResult(rows, time.perf_counter() - started)
+
+    def search(self, index_name: str, request, options=None) -> SearchResult:
+        started = time.perf_counter()
+        options = dict(options or {})
+        query = request._search_query.encodable
+        conjuncts = query.get("conjuncts", [query])
+        self.wait("search")
+
+        hotels = self.collections["hotel"]
+        # Term and geo-distance queries narrow the candidates like an index would
+        candidates = None
+        for conjunct in conjuncts:
+            if "term" in conjunct:
+                keys = hotels.keys_where(conjunct["field"], conjunct["term"])
+            elif "distance" in conjunct:
+                radius = float(conjunct["distance"].removesuffix("km"))
+                distances = self._distances(hotels, conjunct["field"], conjunct)
+                keys = {key for key, d in distances.items() if d <= radius}
+            else:
+                continue
+            candidates = keys if candidates is None else candidates & keys
+        if candidates is None:
+            documents = hotels.scan()
+        else:
+            documents = [(key, hotels.document(key)) for key in sorted(candidates)]
+        matches = [
+            (key, document)
+            for key, document in documents
+            if document is not None
+            and all(
+                self._search_matches(document, c)
+                for c in conjuncts
+                if "distance" not in c
+            )
+        ]
+        for sort in options.get("sort", ()):
+            if sort._json_["by"] == "geo_distance":
+                distances = self._distances(hotels, sort._json_["field"], sort._json_)
+                matches.sort(
+                    key=lambda match: (distances.get(match[0], math.inf), match[0])
+                )
+        skip = options.get("skip", 0)
+        limit = options.get("limit")
+        page = matches[skip : skip + limit if limit is not None else None]
+        fields = options.get("fields") or []
+        if "*" in fields:
+            fields = HOTEL_STORED_FIELDS
+        rows = [
+            SearchRow(
+                key,
+                {
+                    f: self._stored(f, document[f])
+                    for f in fields
+                    if document.get(f) is not None
+                },
+            )
+            for key, document in page
+        ]
+        return SearchResult(rows, len(matches), time.perf_counter() - started)
+
+    @staticmethod
+    def _stored(field: str, value):
+        """A field as FTS returns it, with geopoints as [lon, lat]"""
+        if field == "geo":
+            return [value.get("lon"), value.get("lat")]
+        return value
+
+    @staticmethod
+    def _distances(collection, field: str, query: dict) -> dict:
+        """Key -> km from the [lon, lat] location of a geo query or sort"""
+        lon, lat = query["location"]
+        keys, lats, lons = collection.points(field)
+        distances = haversine_km(math.radians(lat), math.radians(lon), lats, lons)
+        return dict(zip(keys, distances.tolist()))
+
+    @staticmethod
+    def _search_matches(document: dict, query: dict) -> bool:
+        value = document.get(query["field"])
+        if not isinstance(value, str):
+            return False
+        if "term" in query:
+            # city, country and state use the keyword analyzer
+            return value == query["term"]
+        words = tokens(value)
+        terms = tokens(query["match"])
+        if query["field"] == "name":
+            # Edge n-grams match words by their prefix, up to EDGE_NGRAM_MAX chars
+            return any(
+                word.startswith(term[:EDGE_NGRAM_MAX])
+                for term in terms
+                if len(term) >= 2
+                for word in words
+            )
+        return not words.isdisjoint(terms)
+
+    def _list(
+        self,
+        collection: str,
+        by_country: bool,
+        after: bool,
+        country=None,
+        limit=10,
+        offset=0,
+        after_name=None,
+        after_id=None,
+        after_missing=False,
+    ) -> list:
+        name_field, fields = LIST_FIELDS[collection]
+        entries = self.collections[collection].sorted_by(name_field)
+        if after:
+            position = bisect_right(entries, (after_name or "", after_id))
+            entries = entries[position:]
+            offset = 0
+        rows = []
+        for _, key in entries:
+            document = self.collections[collection].document(key)
+            if document is None or (by_country and document.get("country") != country):
+                continue
+            if offset > 0:
+                offset -= 1
+                continue
+            if len(rows) == limit:
+                break
+            row = {"id": key}
+            row.update({f: document[f] for f in fields if f in document})
+            rows.append(row)
+        return rows
+
+    def _direct_connections(self, airport, limit=10, offset=0) -> list:
+        if not self.collections["airport"].keys_where("faa", airport):
+            return []
+        routes = self.collections["route"]
+        destinations = set()
+        for key in routes.keys_where("sourceairport", airport):
+            route = routes.document(key)
+            if route is not None and route.get("stops") == 0:
+                destinations.add(route.get("destinationairport"))
+        destinations = sorted(d for d in destinations if d is not None)
+        return [{"destinationairport": d} for d in destinations[offset:][:limit]]
+
+    def _airlines_to_airport(self, airport, limit=10, offset=0) -> list:
+        routes = self.collections["route"]
+        airline_ids = set()
+        for key in routes.keys_where("destinationairport", airport):
+            route = routes.document(key)
+            if route is not None:
+                airline_ids.add(route.get("airlineid"))
+        airlines = []
+        for airline_id in airline_ids:
+            airline = self.collections["airline"].document(airline_id)
+            if airline is not None:
+                airlines.append((airline.get("name") or "", airline))
+        airlines.sort(key=lambda item: item[0])
+        fields = ("callsign", "country", "iata", "icao", "name")
+        return [
+            {f: airline[f] for f in fields if f in airline}
+            for _, airline in airlines[offset:][:limit]
+        ]
+
+    def _route_index_routes(self) -> list:
+        fields = (
+            "sourceairport",
+            "destinationairport",
+            "stops",
+            "airlineid",
+            "distance",
+        )
+        return [
+            dict({"id": key}, **{f: route[f] for f in fields if f in route})
+            for key, route in self.collections["route"].scan()
+        ]
+
+    def _route_snapshot(self) -> list:
+        fields = (
+            "airline",
+            "airlineid",
+            "sourceairport",
+            "destinationairport",
+            "stops",
+            "equipment",
+            "distance",
+            "schedule",
+        )
+        return [
+            dict({"id": key}, **{f: route[f] for f in fields if f in route})
+            for key, route in self.collections["route"].scan()
+        ]
+
+    def _airport_geo_index(self) -> list:
+        return [
+            dict({"id": key}, **{f: airport[f] for f in AIRPORT_FIELDS if f in airport})
+            for key, airport in self.collections["airport"].scan()
+        ]
+
+    def _route_index_airports(self) -> list:
+        return [
+            {"id": key, "faa": airport["faa"]}
+            for key, airport in self.collections["airport"].scan()
+            if "faa" in airport
+        ]
+
+    def _route_index_airlines(self) -> list:
+        return [
+            {"id": key, "name": airline["name"]} if "name" in airline else {"id": key}
+            for key, airline in self.collections["airline"].scan()
+        ]
+
+    def _replica_changes(self, collection: str, since: int) -> list:
+        return [
+            {"id": key, "cas": cas, "document": document}
+            for key, cas, document in self.collections[collection].changes(since)
+        ]
+
+    def _hotel_index(self) -> list:
+        return [
+            {"id": key, "name": hotel["name"]}
+            for key, hotel in self.collections["hotel"].scan()
+            if hotel.get("name") is not None
+        ]
+
+
+class InMemoryCouchbaseClient(CouchbaseClient):
+    """CouchbaseClient backed by an in-memory scope instead of a cluster
+
+    Everything above the SDK calls, such as caching, coalescing, prepared
+    statement bookkeeping, metrics and tracing, runs unchanged. `latency`
+    optionally adds a simulated round trip in seconds per service, as
+    {"kv": ..., "query": ..., "search": ...}.
+    """
+
+    def __init__(self, dataset: dict, latency: dict = None) -> None:
+        super().__init__()
+        self.dataset = dataset
+        self.latency = latency
+
+    def connect(self) -> None:
+        with self._connect_lock:
+            if self.cluster:
+                return
+            self.scope = InMemoryScope(self, self.dataset, self.latency)
+            # No cluster, but the client must consider itself connected
+            self.cluster = self.scope
+
+    def close(self) -> None:
+        with self._connect_lock:
+            self.cluster = None
+            self.scope = None
+
+    def provision(self, force: bool = False) -> bool:
+        return True
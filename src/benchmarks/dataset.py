@@ -0,0 +1,194 @@
+"""Synthetic documents shaped like the travel-sample inventory scope.
+
+The documents have the same fields and ID scheme as travel-sample, and are
+generated from a seed so that every benchmark run sees the same data.
+"""
+
+import math
+import random
+import string
+
+COUNTRIES = ["United States", "France", "United Kingdom"]
+
+CITY_WORDS = [
+    "Spring",
+    "Green",
+    "Lake",
+    "Port",
+    "River",
+    "Oak",
+    "Fair",
+    "Mill",
+    "Bay",
+    "Stone",
+]
+
+HOTEL_WORDS = [
+    "Sea",
+    "Seal",
+    "View",
+    "Grand",
+    "Inn",
+    "Lodge",
+    "Royal",
+    "Park",
+    "Harbour",
+    "Garden",
+    "Hostel",
+    "Campground",
+    "Palace",
+    "Cottage",
+    "Tower",
+]
+
+DESCRIPTION_WORDS = [
+    "newly",
+    "renovated",
+    "rooms",
+    "quiet",
+    "breakfast",
+    "parking",
+    "pool",
+    "beach",
+    "downtown",
+    "family",
+    "friendly",
+    "historic",
+    "views",
+    "garden",
+    "restaurant",
+]
+
+
+def code(rng: random.Random, length: int, used: set) -> str:
+    """A random unused upper case code, like an IATA or FAA code"""
+    while True:
+        value = "".join(rng.choice(string.ascii_uppercase) for _ in range(length))
+        if value not in used:
+            used.add(value)
+            return value
+
+
+def generate(
+    seed: int = 42,
+    airlines: int = 190,
+    airports: int = 1960,
+    routes: int = 24000,
+    hotels: int = 900,
+) -> dict:
+    """Documents per collection as {collection: {id: document}}
+
+    The defaults are close to the document counts of travel-sample.
+    """
+    rng = random.Random(seed)
+    cities = [
+        f"{first}{second.lower()}"
+        for first in CITY_WORDS
+        for second in CITY_WORDS
+        if first != second
+    ]
+
+    airline_docs = {}
+    used = set()
+    for i in range(airlines):
+        iata = code(rng, 2, used)
+        name = (
+            f"{rng.choice(CITY_WORDS)} {rng.choice(['Air', 'Airways', 'Airlines'])} {i}"
+        )
+        airline_docs[f"airline_{10 + i}"] = {
+            "id": 10 + i,
+            "type": "airline",
+            "name": name,
+            "iata": iata,
+            "icao": iata + code(rng, 1, set()),
+            "callsign": name.split()[0].upper(),
+            "country": rng.choice(COUNTRIES),
+        }
+
+    airport_docs = {}
+    used = set()
+    for i in range(airports):
+        faa = code(rng, 3, used)
+        city = rng.choice(cities)
+        airport_docs[f"airport_{1000 + i}"] = {
+            "id": 1000 + i,
+            "type": "airport",
+            "airportname": f"{city} {rng.choice(['Intl', 'Regional', 'Municipal'])}",
+            "city": city,
+            "country": rng.choice(COUNTRIES),
+            "faa": faa,
+            "icao": "K" + faa,
+            "tz": rng.choice(["America/New_York", "Europe/Paris", "Europe/London"]),
+            "geo": {
+                "lat": round(rng.uniform(-60, 70), 6),
+                "lon": round(rng.uniform(-180, 180), 6),
+                "alt": rng.randint(0, 3000),
+            },
+        }
+
+    # Routes connect a skewed set of hubs, like the real network
+    airport_list = list(airport_docs.values())
+    weights = [1 / (rank + 1) for rank in range(len(airport_list))]
+    airline_items = list(airline_docs.items())
+    route_docs = {}
+    for i in range(routes):
+        source, destination = rng.choices(airport_list, weights, k=2)
+        if source is destination:
+            destination = rng.choice(airport_list)
+        airline_id, airline = rng.choice(airline_items)
+        distance = math.dist(
+            (source["geo"]["lat"], source["geo"]["lon"]),
+            (destination["geo"]["lat"], destination["geo"]["lon"]),
+        )
+        route_docs[f"route_{10000 + i}"] = {
+            "id": 10000 + i,
+            "type": "route",
+            "airline": airline["iata"],
+            "airlineid": airline_id,
+            "sourceairport": source["faa"],
+            "destinationairport": destination["faa"],
+            "stops": 0 if rng.random() < 0.95 else 1,
+            "equipment": rng.choice(["320", "737", "738", "CR9"]),
+            "schedule": [
+                {
+                    "day": day,
+                    "flight": f"{airline['iata']}{rng.randint(100, 999)}",
+                    "utc": f"{rng.randint(0, 23):02d}:{rng.choice(['00', '15', '30', '45'])}:00",
+                }
+                for day in range(7)
+                for _ in range(rng.randint(1, 3))
+            ],
+            "distance": distance * 111.0,
+        }
+
+    hotel_docs = {}
+    for i in range(hotels):
+        city = rng.choice(cities)
+        # Hotels are spread around the airports
+        near = rng.choice(airport_list)["geo"]
+        hotel_docs[f"hotel_{20000 + i}"] = {
+            "id": 20000 + i,
+            "type": "hotel",
+            "name": " ".join(rng.sample(HOTEL_WORDS, rng.randint(2, 3))),
+            "title": f"{city} {rng.choice(['Bay', 'Hills', 'Centre', 'Coast'])}",
+            "description": " ".join(rng.choices(DESCRIPTION_WORDS, k=12)),
+            "city": city,
+            "state": rng.choice(["California", "Normandy", "Kent", None]),
+            "country": rng.choice(COUNTRIES),
+            "geo": {
+                "lat": round(
+                    max(-90, min(90, near["lat"] + rng.uniform(-0.2, 0.2))), 6
+                ),
+                "lon": round(
+                    (near["lon"] + rng.uniform(-0.2, 0.2) + 180) % 360 - 180, 6
+                ),
+                "accuracy": "ROOFTOP",
+            },
+        }
+
+    return {
+        "airline": airline_docs,
+        "airport": airport_docs,
+        "route": route_docs,
+        "hotel": hotel_docs,
+    }
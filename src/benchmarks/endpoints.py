@@ -0,0 +1,437 @@
+"""Benchmark every endpoint in-process against an in-memory Couchbase stand-in
+
+Run from the src folder:
+
+    python -m benchmarks.endpoints --concurrency 8 --requests 500
+
+The application is configured from the environment as usual (caches, metrics,
+tracing, prepared statements...), but its Couchbase client is replaced by an
+InMemoryCouchbaseClient seeded with a synthetic travel-sample-shaped dataset,
+so no cluster is needed. Results can be saved as a baseline and later runs
+compared against it; the exit status is 1 if any endpoint regressed.
+"""
+
+import argparse
+import itertools
+import json
+import math
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from benchmarks import dataset as synthetic
+from benchmarks.backend import InMemoryCouchbaseClient
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+# `request(i)` returns the path and keyword arguments of the i-th request;
+# `setup(n)`, if any, prepares the data for n requests before timing starts
+Endpoint = namedtuple("Endpoint", ["name", "method", "request", "setup"])
+
+# Records per NDJSON body sent to the bulk endpoints
+BULK_RECORDS = 100
+
+
+def percentile(values: list, p: float) -> float:
+    """Nearest-rank percentile of sorted values"""
+    if not values:
+        return 0.0
+    return values[max(0, math.ceil(p / 100 * len(values)) - 1)]
+
+
+def document_endpoints(collection: str, documents: dict, keys: list, db) -> list:
+    """Endpoints reading and writing the documents of a collection by key"""
+    base = f"/api/v1/{collection}"
+    created = itertools.count()
+    deleted = []
+
+    def key(i: int) -> str:
+        return keys[i % len(keys)]
+
+    def get(i):
+        return f"{base}/{key(i)}", {}
+
+    def put(i):
+        return f"{base}/{key(i)}", {"json": documents[key(i)]}
+
+    def post(i):
+        # Every POST creates a new document
+        return f"{base}/{collection}_bench_{next(created)}", {"json": documents[key(i)]}
+
+    def create_deleted(n):
+        # Documents for the DELETE requests, written before timing starts
+        start = len(deleted)
+        docs = {
+            f"{collection}_bench_delete_{start + i}": documents[key(i)]
+            for i in range(n)
+        }
+        db.scope.collection(collection).upsert_multi(docs)
+        deleted.extend(docs)
+
+    def delete(i):
+        return f"{base}/{deleted.pop()}", {}
+
+    def batch_get(i):
+        return f"{base}/batch-get", {"json": {"ids": [key(i + j) for j in range(20)]}}
+
+    def bulk(i):
+        records = (
+            json.dumps({"id": key(i + j), "document": documents[key(i + j)]})
+            for j in range(BULK_RECORDS)
+        )
+        return f"{base}/bulk?mode=upsert", {
+            "data": "\n".join(records),
+            "content_type": "application/x-ndjson",
+        }
+
+    return [
+        Endpoint(f"GET {base}/<id>", "GET", get, None),
+        Endpoint(f"PUT {base}/<id>", "PUT", put, None),
+        Endpoint(f"POST {base}/<id>", "POST", post, None),
+        Endpoint(f"DELETE {base}/<id>", "DELETE", delete, create_deleted),
+        Endpoint(f"POST {base}/batch-get", "POST", batch_get, None),
+        Endpoint(f"POST {base}/bulk", "POST", bulk, None),
+    ]
+
+
+def list_endpoints(collection: str, names: list, countries: list) -> list:
+    """Endpoints listing a collection by offset and by cursor"""
+    # Imported here, after the client in extensions has been replaced
+    from api.pagination import encode_cursor
+
+    base = f"/api/v1/{collection}"
+    cursors = [encode_cursor(*name) for name in names]
+
+    def by_offset(i):
+        country = countries[i % len(countries)]
+        return f"{base}/list?country={country}&limit=10&offset={i % 50 * 10}", {}
+
+    def by_cursor(i):
+        return f"{base}/list?limit=10&cursor={cursors[i % len(cursors)]}", {}
+
+    return [
+        Endpoint(f"GET {base}/list", "GET", by_offset, None),
+        Endpoint(f"GET {base}/list?cursor", "GET", by_cursor, None),
+    ]
+
+
+def build_endpoints(data: dict, db, seed: int) -> list:
+    """The benchmarked requests of every endpoint, using keys from the dataset"""
+    rng = random.Random(seed)
+
+    def pick(values, n: int = 1000) -> list:
+        return [rng.choice(values) for _ in range(n)]
+
+    airports = list(data["airport"].values())
+    # The first airports generated are the hubs with the most routes
+    hubs = pick([airport["faa"] for airport in airports[:100]])
+    countries = sorted({airport["country"] for airport in airports})
+
+    endpoints = []
+    for collection in ("airline", "airport", "route"):
+        keys = pick(sorted(data[collection]))
+        endpoints += document_endpoints(collection, data[collection], keys, db)
+
+    for collection, name_field in (("airline", "name"), ("airport", "airportname")):
+        names = sorted(
+            (doc.get(name_field) or "", key) for key, doc in data[collection].items()
+        )
+        # Cursors in the first half, so every page is full
+        endpoints += list_endpoints(
+            collection, pick(names[: len(names) // 2]), countries
+        )
+
+    hotel_words = sorted(
+        {word for hotel in data["hotel"].values() for word in hotel["name"].split()}
+    )
+    prefixes = [word[: rng.randint(2, len(word))] for word in pick(hotel_words)]
+    filters = [
+        {"country": rng.choice(countries), "description": word}
+        for word in pick(synthetic.DESCRIPTION_WORDS)
+    ]
+    points = pick([airport["geo"] for airport in airports])
+
+    def direct_connections(i):
+        return f"/api/v1/airport/direct-connections?airport={hubs[i % 1000]}", {}
+
+    def to_airport(i):
+        return f"/api/v1/airline/to-airport?airport={hubs[i % 1000]}", {}
+
+    def path(i):
+        source, destination = hubs[i % 1000], hubs[(i * 7 + 1) % 1000]
+        return f"/api/v1/route/path?from={source}&to={destination}&max_stops=1", {}
+
+    def nearest(i):
+        point = points[i % 1000]
+        return (
+            f"/api/v1/airport/nearest?lat={point['lat']}&lon={point['lon']}&limit=10",
+            {},
+        )
+
+    def route_stats(i):
+        group_by = ("airline", "sourceairport", "equipment")[i % 3]
+        return f"/api/v1/route/stats?group_by={group_by}&metric=distance", {}
+
+    def autocomplete(i):
+        return f"/api/v1/hotel/autocomplete?name={prefixes[i % 1000]}", {}
+
+    def hotels_near(i):
+        point = points[i % 1000]
+        return (
+            f"/api/v1/hotel/near?lat={point['lat']}&lon={point['lon']}&radius=50",
+            {},
+        )
+
+    def hotel_filter(i):
+        return "/api/v1/hotel/filter?limit=10", {"json": filters[i % 1000]}
+
+    return endpoints + [
+        Endpoint(
+            "GET /api/v1/airport/direct-connections", "GET", direct_connections, None
+        ),
+        Endpoint("GET /api/v1/airline/to-airport", "GET", to_airport, None),
+        Endpoint("GET /api/v1/route/path", "GET", path, None),
+        Endpoint("GET /api/v1/airport/nearest", "GET", nearest, None),
+        Endpoint("GET /api/v1/route/stats", "GET", route_stats, None),
+        Endpoint("GET /api/v1/hotel/autocomplete", "GET", autocomplete, None),
+        Endpoint("POST /api/v1/hotel/filter", "POST", hotel_filter, None),
+        Endpoint("GET /api/v1/hotel/near", "GET", hotels_near, None),
+    ]
+
+
+def run_endpoint(app, endpoint: Endpoint, requests: int, concurrency: int) -> dict:
+    """Send the requests from `concurrency` threads and summarize their latencies"""
+    clients = threading.local()
+
+    def send(i: int):
+        client = getattr(clients, "client", None)
+        if client is None:
+            client = clients.client = app.test_client()
+        path, kwargs = endpoint.request(i)
+        started = time.perf_counter()
+        response = client.open(path, method=endpoint.method, **kwargs)
+        elapsed = time.perf_counter() - started
+        return elapsed, response.status_code
+
+    if endpoint.setup is not None:
+        endpoint.setup(requests)
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        started = time.perf_counter()
+        results = list(executor.map(send, range(requests)))
+        wall = time.perf_counter() - started
+
+    latencies = sorted(elapsed for elapsed, _ in results)
+    return {
+        "requests": requests,
+        "errors": sum(1 for _, status in results if status >= 400),
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "rps": requests / wall if wall > 0 else 0.0,
+    }
+
+
+def median_result(rounds: list) -> dict:
+    """Median of each measure over rounds, with requests and errors summed"""
+    result = {
+        measure: statistics.median(r[measure] for r in rounds)
+        for measure in ("p50_ms", "p95_ms", "p99_ms", "rps")
+    }
+    result["requests"] = sum(r["requests"] for r in rounds)
+    result["errors"] = sum(r["errors"] for r in rounds)
+    return result
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """Names of the endpoints whose median latency or throughput regressed
+
+    The tail percentiles of in-process threads mostly measure waits for the
+    GIL, so they are reported but do not fail the comparison.
+    """
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        slower = result["p50_ms"] > base["p50_ms"] * (1 + tolerance)
+        fewer = result["rps"] < base["rps"] * (1 - tolerance)
+        if slower or fewer:
+            regressions.append(name)
+    return regressions
+
+
+def change(value: float, base) -> str:
+    if not base:
+        return ""
+    return f"{(value - base) / base * 100:+.0f}%"
+
+
+def print_report(results: dict, baseline: dict, regressions: list) -> None:
+    print(
+        f"{'endpoint':<44} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+        f"{'rps':>9} {'errors':>6} {'p50 vs base':>12} {'rps vs base':>12}"
+    )
+    for name, result in results.items():
+        base = baseline.get(name, {})
+        flag = "  REGRESSED" if name in regressions else ""
+        print(
+            f"{name:<44} {result['p50_ms']:>8.2f} {result['p95_ms']:>8.2f} "
+            f"{result['p99_ms']:>8.2f} {result['rps']:>9.0f} {result['errors']:>6} "
+            f"{change(result['p50_ms'], base.get('p50_ms')):>12} "
+            f"{change(result['rps'], base.get('rps')):>12}{flag}"
+        )
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description="Benchmark every endpoint against an in-memory Couchbase stand-in"
+    )
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument(
+        "--requests", type=int, default=500, help="Timed requests per endpoint"
+    )
+    parser.add_argument(
+        "--rounds",
+        type=int,
+        default=3,
+        help="Rounds per endpoint, reporting the median of each measure",
+    )
+    parser.add_argument(
+        "--warmup", type=int, default=50, help="Untimed requests per endpoint"
+    )
+    parser.add_argument(
+        "--endpoint", default="", help="Only run endpoints whose name contains this"
+    )
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument(
+        "--scale",
+        type=float,
+        default=1.0,
+        help="Dataset size relative to travel-sample",
+    )
+    parser.add_argument(
+        "--kv-latency", type=float, default=0, help="Simulated KV round trip in ms"
+    )
+    parser.add_argument(
+        "--query-latency",
+        type=float,
+        default=0,
+        help="Simulated SQL++ round trip in ms",
+    )
+    parser.add_argument(
+        "--search-latency", type=float, default=0, help="Simulated FTS round trip in ms"
+    )
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument(
+        "--save-baseline",
+        action="store_true",
+        help="Write the results to the baseline file instead of comparing",
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.2,
+        help="Allowed relative p50 increase or throughput drop before failing",
+    )
+    args = parser.parse_args()
+
+    data = synthetic.generate(
+        seed=args.seed,
+        airlines=max(1, int(190 * args.scale)),
+        airports=max(2, int(1960 * args.scale)),
+        routes=max(1, int(24000 * args.scale)),
+        hotels=max(1, int(900 * args.scale)),
+    )
+    db = InMemoryCouchbaseClient(
+        data,
+        latency={
+            "kv": args.kv_latency / 1000,
+            "query": args.query_latency / 1000,
+            "search": args.search_latency / 1000,
+        },
+    )
+
+    # The api modules bind the shared client when imported, so replace it first
+    import extensions
+
+    extensions.couchbase_db = db
+    os.environ.setdefault("DB_CONN_STR", "couchbase://in-memory")
+    os.environ.setdefault("DB_USERNAME", "benchmark")
+    os.environ.setdefault("DB_PASSWORD", "benchmark")
+    os.environ["DB_FAST_START"] = "false"
+    from app import create_app
+
+    app = create_app()
+    for name, index in (
+        ("ROUTE_INDEX", extensions.route_index),
+        ("ROUTE_SNAPSHOT", extensions.route_snapshot),
+        ("AIRPORT_GEO_INDEX", extensions.airport_geo_index),
+        ("HOTEL_INDEX", extensions.hotel_index),
+    ):
+        if os.getenv(name, "true").lower() == "true":
+            while not index.ready:
+                time.sleep(0.05)
+
+    endpoints = [
+        endpoint
+        for endpoint in build_endpoints(data, db, args.seed)
+        if args.endpoint in endpoint.name
+    ]
+    results = {}
+    for endpoint in endpoints:
+        if args.warmup > 0:
+            run_endpoint(app, endpoint, args.warmup, args.concurrency)
+        result = results[endpoint.name] = median_result(
+            [
+                run_endpoint(app, endpoint, args.requests, args.concurrency)
+                for _ in range(args.rounds)
+            ]
+        )
+        print(
+            f"{endpoint.name}: p95 {result['p95_ms']:.2f} ms, {result['rps']:.0f} rps",
+            file=sys.stderr,
+        )
+
+    settings = {
+        "concurrency": args.concurrency,
+        "requests": args.requests,
+        "rounds": args.rounds,
+        "seed": args.seed,
+        "scale": args.scale,
+        "kv_latency_ms": args.kv_latency,
+        "query_latency_ms": args.query_latency,
+        "search_latency_ms": args.search_latency,
+    }
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump({"settings": settings, "results": results}, f, indent=2)
+        print_report(results, {}, [])
+        print(f"Baseline saved to {args.baseline}")
+        return 0
+
+    baseline = {}
+    try:
+        with open(args.baseline, "r") as f:
+            saved = json.load(f)
+        if saved.get("settings") != settings:
+            print(f"Baseline settings differ from this run: {saved.get('settings')}")
+        baseline = saved.get("results", {})
+    except OSError:
+        print(f"No baseline at {args.baseline}, run with --save-baseline to create one")
+
+    regressions = compare(results, baseline, args.tolerance)
+    print_report(results, baseline, regressions)
+    if regressions:
+        print(
+            f"{len(regressions)} endpoint(s) regressed by more than {args.tolerance:.0%}"
+        )
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,106 @@
+"""Compare flask_restx marshalling with the compiled serialization path.
+
+Run from the src folder:
+
+    python -m benchmarks.serialization
+
+Each case checks that both paths produce the same bytes before timing them.
+The compiled path is also timed with orjson, which `ORJSON=true` enables.
+"""
+
+import json
+import timeit
+from flask_restx import marshal
+from api.serialization import dumps, orjson, serialize
+from api.airport import airport_model
+from api.route import route_model
+from api.airline import airline_batch_item_model
+
+
+def airport_page(size):
+    return [
+        {
+            "id": f"airport_{i}",
+            "airportname": f"Airport {i}",
+            "city": "Calais",
+            "country": "France",
+            "faa": "CQF",
+            "icao": "LFAC",
+            "tz": "Europe/Paris",
+            "geo": {"lat": 50.962097, "lon": 1.954764, "alt": 12},
+        }
+        for i in range(size)
+    ]
+
+
+def route(schedule_length):
+    return {
+        "airline": "AF",
+        "airlineid": "airline_137",
+        "sourceairport": "TLV",
+        "destinationairport": "MRS",
+        "stops": 0,
+        "equipment": "320",
+        "schedule": [
+            {"day": i % 7, "flight": f"AF{i:03d}", "utc": "10:13:00"}
+            for i in range(schedule_length)
+        ],
+        "distance": 2881.6940863173978,
+    }
+
+
+def batch(size):
+    return [
+        {
+            "id": f"airline_{i}",
+            "found": i % 3 != 0,
+            "document": (
+                {"name": "40-Mile Air", "iata": "Q5", "icao": "MLA", "country": "US"}
+                if i % 3
+                else None
+            ),
+        }
+        for i in range(size)
+    ]
+
+
+CASES = [
+    ("airport list page (100)", airport_page(100), airport_model, False),
+    ("route with 200 schedule entries", route(200), route_model, True),
+    ("airline batch get (500)", batch(500), airline_batch_item_model, True),
+]
+
+
+def run(number=200):
+    print(
+        f"{'case':<34}{'marshal+json':>14}{'compiled':>12}{'speedup':>10}"
+        f"{'+orjson':>12}{'speedup':>10}"
+    )
+    for name, data, model, skip_none in CASES:
+        expected = marshal(data, model, skip_none=skip_none)
+        actual = serialize(data, model, skip_none=skip_none)
+        assert json.dumps(expected).encode("utf-8") == dumps(actual), name
+
+        current = timeit.timeit(
+            lambda: json.dumps(marshal(data, model, skip_none=skip_none)),
+            number=number,
+        )
+        compiled = timeit.timeit(
+            lambda: dumps(serialize(data, model, skip_none=skip_none)),
+            number=number,
+        )
+        line = (
+            f"{name:<34}{current / number * 1e6:>12.0f}us"
+            f"{compiled / number * 1e6:>10.0f}us{current / compiled:>9.1f}x"
+        )
+        if orjson is not None:
+            fast = timeit.timeit(
+                lambda: orjson.dumps(serialize(data, model, skip_none=skip_none)),
+                number=number,
+            )
+            line += f"{fast / number * 1e6:>10.0f}us{current / fast:>9.1f}x"
+        print(line)
+
+
+if __name__ == "__main__":
+    run()
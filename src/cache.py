@@ -0,0 +1,161 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+
+# Returned by LRUCache.get when the key is not cached
+MISSING = object()
+
+
+class LRUCache(object):
+    """Thread-safe bounded cache with per-entry TTLs and LRU eviction
+
+    Every invalidation bumps `generation`. A reader that captures the generation
+    before going to the cluster and passes it to `set` will not cache a value
+    that a concurrent write has already made stale.
+    """
+
+    def __init__(self, max_size: int) -> None:
+        self.max_size = max_size
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return the cached value for key, or MISSING"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return MISSING
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return MISSING
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, ttl: float, generation: int = None) -> bool:
+        """Cache value for ttl seconds unless the cache was invalidated since generation"""
+        if ttl <= 0:
+            return False
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return False
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+            return True
+
+    def invalidate(self, key) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+            self.generation += 1
+            self.invalidations += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.generation += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
+
+
+class CachedContent(object):
+    """Decodes a fresh copy of the document on every access, like `content_as`"""
+
+    __slots__ = ("value",)
+
+    def __init__(self, value: str) -> None:
+        self.value = value
+
+    def __getitem__(self, type_):
+        return type_(json.loads(self.value))
+
+
+class CachedDocument(object):
+    """A KV get result held in a cache, used like the SDK's GetResult
+
+    The document is kept encoded, so a caller changing the content it was
+    given cannot change what later reads of the cached entry see.
+    """
+
+    __slots__ = ("key", "cas", "content_as")
+
+    def __init__(self, key: str, cas: int, value: str) -> None:
+        self.key = key
+        self.cas = cas
+        self.content_as = CachedContent(value)
+
+    @classmethod
+    def from_result(cls, result) -> "CachedDocument":
+        return cls(result.key, result.cas, json.dumps(result.content_as[dict]))
+
+
+class SingleFlight(object):
+    """Coalesce concurrent calls for the same key into one
+
+    The first caller for a key runs the function; callers arriving while it is
+    in flight wait for it and get the same result or exception. After `forget`
+    new callers start a fresh call instead of joining the one in flight.
+    """
+
+    def __init__(self) -> None:
+        self.calls = 0
+        self.coalesced = 0
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, function):
+        with self._lock:
+            call = self._in_flight.get(key)
+            leader = call is None
+            if leader:
+                call = self._in_flight[key] = {"done": threading.Event()}
+                self.calls += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            call["done"].wait()
+            if "error" in call:
+                raise call["error"]
+            return call["result"]
+
+        try:
+            call["result"] = function()
+            return call["result"]
+        except Exception as e:
+            call["error"] = e
+            raise
+        finally:
+            with self._lock:
+                if self._in_flight.get(key) is call:
+                    del self._in_flight[key]
+            call["done"].set()
+
+    def forget(self, key) -> None:
+        with self._lock:
+            self._in_flight.pop(key, None)
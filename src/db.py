@@ -1,16 +1,122 @@
 import json
+import math
+import threading
+import time
 from couchbase.cluster import Cluster
 from couchbase.options import ClusterOptions
 from couchbase.auth import PasswordAuthenticator
 from couchbase.exceptions import CouchbaseException
 from datetime import timedelta
+import numpy as np
 from couchbase.result import PingResult
 from couchbase.diagnostics import PingState, ServiceType
 from couchbase.management.search import SearchIndex
-from couchbase.exceptions import QueryIndexAlreadyExistsException
-from couchbase.options import SearchOptions
+from couchbase.exceptions import (
+    QueryIndexAlreadyExistsException,
+    SearchIndexNotFoundException,
+)
+from couchbase.options import (
+    QueryOptions,
+    SearchOptions,
+    GetMultiOptions,
+    InsertMultiOptions,
+    UpsertMultiOptions,
+)
 from couchbase.search import MatchQuery, ConjunctionQuery, TermQuery
 import couchbase.search as search
+from cache import LRUCache, SingleFlight, CachedDocument, MISSING
+from airport_geo_index import haversine_km
+from metrics import SlowOperationLog
+
+
+def build_filter_query(filter):
+    """Build the conjunction FTS query for a hotel filter, or None if it is empty"""
+    conjuncts = []
+
+    match_query_terms = ["description", "name", "title"]
+    conjuncts.extend(
+        [MatchQuery(filter[t], field=t) for t in match_query_terms if t in filter]
+    )
+    term_query_terms = ["city", "country", "state"]
+    conjuncts.extend(
+        [TermQuery(filter[t], field=t) for t in term_query_terms if t in filter]
+    )
+
+    if not conjuncts:
+        return None
+    return ConjunctionQuery(*conjuncts)
+
+
+def filter_cache_key(filter, limit, offset) -> str:
+    """Key identifying a hotel filter search, independent of field order
+
+    Only the fields used by build_filter_query take part, so bodies differing
+    in other fields share an entry.
+    """
+    fields = {
+        field: filter[field]
+        for field in ("description", "name", "title", "city", "country", "state")
+        if field in filter
+    }
+    return json.dumps([fields, limit, offset], sort_keys=True)
+
+
+def contains(expected, actual) -> bool:
+    """Whether `actual` has every value of `expected`, recursing into dicts"""
+    if isinstance(expected, dict):
+        return isinstance(actual, dict) and all(
+            key in actual and contains(value, actual[key])
+            for key, value in expected.items()
+        )
+    return expected == actual
+
+
+def index_applied(index: SearchIndex, existing: SearchIndex) -> bool:
+    """Whether the index on the cluster already has the local definition
+
+    The search service fills in defaults the local definition leaves out, so
+    only the values set locally are compared.
+    """
+    return (
+        index.source_name == existing.source_name
+        and contains(index.params, existing.params)
+        and contains(index.plan_params, existing.plan_params)
+    )
+
+
+def geo_point(value):
+    """(lat, lon) of a geopoint as stored by FTS ([lon, lat]) or in a document"""
+    if isinstance(value, dict):
+        value = [value.get("lon"), value.get("lat")]
+    if (
+        isinstance(value, list)
+        and len(value) == 2
+        and all(isinstance(v, (int, float)) for v in value)
+    ):
+        return float(value[1]), float(value[0])
+    return None
+
+
+class Statement(object):
+    """A named SQL++ statement and how often it was run on the query service
+
+    Preparing a statement and reusing its plan is left to the SDK and the
+    query service, so only runs and failures are counted here.
+    """
+
+    def __init__(self, name: str, sql: str) -> None:
+        self.name = name
+        self.sql = sql
+        self.executions = 0
+        self.errors = 0
+
+    def stats(self, prepared: bool) -> dict:
+        return {
+            "name": self.name,
+            "prepared": prepared,
+            "executions": self.executions,
+            "errors": self.errors,
+        }
 
 
 class CouchbaseClient(object):
@@ -21,9 +127,42 @@ class CouchbaseClient(object):
         self.bucket = None
         self.scope = None
         self.app = None
+        self.lazy = False
+        self.provision_on_connect = True
+        self._connect_lock = threading.Lock()
+        self.cache = None
+        self.filter_cache = None
+        self.filter_flight = SingleFlight()
+        # Concurrent KV gets of the same document share one read
+        self.kv_flight = SingleFlight()
+        self.statements = {}
+        self.prepared_statements = False
+        self._statements_lock = threading.Lock()
+        # Latency histogram of the operations sent to the cluster, if enabled
+        self.operations = None
+        # Recent SQL++ and FTS operations above the slow threshold, if enabled
+        self.slow_log = None
+        # Tracer recording a span for every operation of a traced request
+        self.tracer = None
+        # Local copy of the inventory scope answering gets and list queries
+        self.replica = None
 
-    def init_app(self, conn_str: str, username: str, password: str, app):
-        """Initialize connection to the Couchbase cluster"""
+    def init_app(
+        self,
+        conn_str: str,
+        username: str,
+        password: str,
+        app,
+        lazy: bool = False,
+        provision: bool = True,
+    ):
+        """Initialize connection to the Couchbase cluster
+
+        With lazy=True the connection is only made by the first operation that
+        needs it, and provisioning runs in a background thread. With
+        provision=False the scope check and search index upsert are skipped, for
+        deployments that run `provision.py` instead.
+        """
         self.conn_str = conn_str
         self.bucket_name = "travel-sample"
         self.scope_name = "inventory"
@@ -31,12 +170,28 @@ class CouchbaseClient(object):
         self.password = password
         self.index_name = "hotel_search"
         self.app = app
-        self.connect()
+        self.lazy = lazy
+        self.provision_on_connect = provision
+        if not lazy:
+            self.connect()
+
+    @property
+    def scope(self):
+        """The inventory scope, connecting first if the client is lazy"""
+        if self._scope is None and self.lazy and self.cluster is None:
+            self.connect()
+        return self._scope
+
+    @scope.setter
+    def scope(self, scope) -> None:
+        self._scope = scope
 
     def connect(self) -> None:
         """Connect to the Couchbase cluster"""
-        # If the connection is not established, establish it now
-        if not self.cluster:
+        with self._connect_lock:
+            # If the connection is not established, establish it now
+            if self.cluster:
+                return
             try:
                 # authentication for Couchbase cluster
                 auth = PasswordAuthenticator(self.username, self.password)
@@ -46,35 +201,61 @@ class CouchbaseClient(object):
                 cluster_opts.apply_profile("wan_development")
 
                 # connect to the cluster
-                self.cluster = Cluster(self.conn_str, cluster_opts)
+                cluster = Cluster(self.conn_str, cluster_opts)
 
-                # wait until the cluster is ready for use
-                self.cluster.wait_until_ready(timedelta(seconds=5))
+                # wait until the cluster is ready for use; a lazy client lets the
+                # first operation wait instead
+                if not self.lazy:
+                    cluster.wait_until_ready(timedelta(seconds=5))
 
-                # get a reference to our bucket
-                self.bucket = self.cluster.bucket(self.bucket_name)
+                # get a reference to our bucket and scope
+                self.bucket = cluster.bucket(self.bucket_name)
+                self.scope = self.bucket.scope(self.scope_name)
+                self.cluster = cluster
             except CouchbaseException as error:
                 print(f"Could not connect to cluster. \nError: {error}")
                 print(
                     "Ensure that you have the travel-sample bucket loaded in the cluster."
                 )
+                if self.lazy:
+                    # Fail this operation and let the next one retry
+                    raise
                 exit()
 
-            if not self.check_scope_exists():
-                print(
-                    "Inventory scope does not exist in the bucket. \nEnsure that you have the inventory scope in your travel-sample bucket."
-                )
-                exit()
+        if not self.provision_on_connect:
+            return
+        if self.lazy:
+            threading.Thread(
+                target=self.provision, name="provision", daemon=True
+            ).start()
+        elif not self.provision():
+            exit()
 
-            # get a reference to our scope
-            self.scope = self.bucket.scope(self.scope_name)
-            # Call the method to create the fts index if search service is enabled
-            if self.is_search_service_enabled():
-                self.create_search_index()
-            else:
-                print(
-                    "Search service is not enabled on this cluster. Skipping search index creation."
-                )
+    def close(self) -> None:
+        """Close the connection to the Couchbase cluster"""
+        with self._connect_lock:
+            if self.cluster:
+                self.cluster.close()
+                self.cluster = None
+                self.bucket = None
+                self.scope = None
+
+    def provision(self, force: bool = False) -> bool:
+        """Check the inventory scope and create the fts index if it changed"""
+        if not self.check_scope_exists():
+            print(
+                "Inventory scope does not exist in the bucket. \nEnsure that you have the inventory scope in your travel-sample bucket."
+            )
+            return False
+
+        # Call the method to create the fts index if search service is enabled
+        if self.is_search_service_enabled():
+            self.create_search_index(force=force)
+        else:
+            print(
+                "Search service is not enabled on this cluster. Skipping search index creation."
+            )
+        return True
 
     def check_scope_exists(self) -> bool:
         """Check if the scope exists in the bucket"""
@@ -105,45 +286,431 @@ class CouchbaseClient(object):
             )
             return False
 
-    def create_search_index(self) -> None:
-        """Upsert a fts index in the Couchbase cluster"""
+    def create_search_index(self, force: bool = False) -> None:
+        """Upsert a fts index in the Couchbase cluster
+
+        The upsert is skipped when the index on the cluster already has the
+        source, params and plan params of the local definition.
+        """
         try:
             scope_index_manager = self.bucket.scope(self.scope_name).search_indexes()
             with open(f"{self.index_name}_index.json", "r") as f:
-                index_definition = json.load(f)
+                index = SearchIndex.from_json(json.load(f))
+            try:
+                existing = scope_index_manager.get_index(index.name)
+            except SearchIndexNotFoundException:
+                existing = None
+            if not force and existing is not None and index_applied(index, existing):
+                print(f"Index '{self.index_name}' is up to date.")
+                return
 
-            # Upsert the index
-            scope_index_manager.upsert_index(SearchIndex.from_json(index_definition))
+            # Updating an existing index requires its current uuid
+            if existing is not None:
+                index.uuid = existing.uuid
+            scope_index_manager.upsert_index(index)
             print(f"Index '{self.index_name}' created or updated successfully.")
         except QueryIndexAlreadyExistsException:
             print(f"Index with name '{self.index_name}' already exists")
         except Exception as e:
             print(f"Error upserting index '{self.index_name}': {e}")
 
+    def enable_cache(self, max_size: int, default_ttl: float, ttls: dict = None):
+        """Enable the read-through cache for KV gets
+
+        Documents are cached for `ttls[collection_name]` seconds, or `default_ttl`
+        for collections without their own TTL. A TTL of 0 disables caching for
+        that collection. Writes through this client invalidate the cached key.
+        """
+        self.cache = LRUCache(max_size)
+        self.cache_default_ttl = default_ttl
+        self.cache_ttls = ttls or {}
+
+    def cache_stats(self) -> dict:
+        """Hit/miss/eviction counters of the read-through cache and coalesced reads"""
+        stats = {
+            "enabled": self.cache is not None,
+            "reads": self.kv_flight.calls,
+            "coalesced": self.kv_flight.coalesced,
+        }
+        if self.cache is not None:
+            stats.update(self.cache.stats())
+        return stats
+
+    def enable_metrics(self, operations) -> None:
+        """Record the latency of every KV, SQL++ and FTS operation in a Histogram
+
+        Series are labeled by operation, the collection, statement name or index
+        used, and whether the operation succeeded.
+        """
+        self.operations = operations
+
+    def enable_tracing(self, tracer) -> None:
+        """Record every KV, SQL++ and FTS operation as a span of the current trace"""
+        self.tracer = tracer
+
+    def enable_read_replica(self, replica) -> None:
+        """Answer KV gets and the airline and airport lists from a ReadReplica
+
+        Until the replica is ready they go to the cluster. Writes still go to
+        the cluster and are then applied to the replica.
+        """
+        self.replica = replica
+
+    def _replicate(self, collection_name: str, docs: dict, mutations: dict) -> None:
+        """Apply the successful writes of docs (None for a delete) to the replica"""
+        if self.replica is None:
+            return
+        changes = []
+        for key, doc in docs.items():
+            mutation = mutations.get(key)
+            if mutation is not None and not isinstance(mutation, Exception):
+                changes.append((key, doc, mutation.cas))
+        if changes:
+            self.replica.apply(collection_name, changes)
+
+    def _observe(self, operation: str, target: str, status: str, started: float):
+        finished = time.perf_counter()
+        if self.operations is not None:
+            self.operations.observe((operation, target, status), finished - started)
+        if self.tracer is not None:
+            self.tracer.record(
+                f"couchbase.{operation}",
+                started,
+                finished,
+                {"target": target, "status": status},
+            )
+
+    def _timed(self, operation: str, target: str, function, *args):
+        """Call function(*args), recording its latency as operation on target"""
+        if self.operations is None and self.tracer is None:
+            return function(*args)
+        started = time.perf_counter()
+        status = "error"
+        try:
+            result = function(*args)
+            status = "ok"
+            return result
+        finally:
+            self._observe(operation, target, status, started)
+
+    def _timed_rows(self, target: str, rows, operation: str = "query"):
+        """Yield the rows of a SQL++ query, timing it until the last row is read"""
+        if self.operations is None and self.tracer is None:
+            yield from rows
+            return
+        started = time.perf_counter()
+        status = "error"
+        try:
+            yield from rows
+            status = "ok"
+        except GeneratorExit:
+            # The caller stopped reading, for example after a page of rows
+            status = "ok"
+            raise
+        finally:
+            self._observe(operation, target, status, started)
+
+    def enable_slow_log(self, threshold: float, max_size: int) -> None:
+        """Keep the last max_size SQL++ and FTS operations taking threshold seconds or more
+
+        Queries then request metrics from the query service, so each entry has
+        the elapsed and execution time and the result count and size reported
+        by the cluster. Searches record the took time and total hits.
+        """
+        self.slow_log = SlowOperationLog(threshold, max_size)
+
+    def slow_operations(self) -> list:
+        """The logged slow operations, newest first"""
+        if self.slow_log is None:
+            return []
+        return self.slow_log.entries()
+
+    def _log_slow(self, operation: str, name: str, parameters: dict, started: float):
+        """Return the slow log entry for an operation started at started, or None"""
+        duration = time.perf_counter() - started
+        if self.slow_log is None or duration < self.slow_log.threshold:
+            return None
+        entry = {
+            "operation": operation,
+            "name": name,
+            "parameters": parameters,
+            "finished_at": time.time(),
+            "duration_ms": duration * 1000,
+        }
+        self.slow_log.record(entry)
+        return entry
+
+    def _query_rows(self, name: str, sql: str, *options, **params):
+        """Yield the rows of a SQL++ query, logging it with its metrics if it is slow"""
+        if self.slow_log is None:
+            yield from self.scope.query(sql, *options, **params)
+            return
+        started = time.perf_counter()
+        result = self.scope.query(sql, *options, metrics=True, **params)
+        complete = False
+        try:
+            yield from result
+            complete = True
+        finally:
+            entry = self._log_slow("query", name, params, started)
+            # The metrics arrive after the last row, so abandoned queries have none
+            metrics = result.metadata().metrics() if entry and complete else None
+            if metrics is not None:
+                entry["elapsed_ms"] = metrics.elapsed_time().total_seconds() * 1000
+                entry["execution_ms"] = metrics.execution_time().total_seconds() * 1000
+                entry["result_count"] = metrics.result_count()
+                entry["result_size"] = metrics.result_size()
+
+    def _log_slow_search(self, parameters: dict, result, started: float) -> None:
+        entry = self._log_slow("search", self.index_name, parameters, started)
+        metrics = result.metadata().metrics() if entry else None
+        if metrics is not None:
+            entry["took_ms"] = metrics.took().total_seconds() * 1000
+            entry["total_hits"] = metrics.total_rows()
+
+    def _cache_ttl(self, collection_name: str) -> float:
+        return self.cache_ttls.get(collection_name, self.cache_default_ttl)
+
+    def _invalidate(self, collection_name: str, keys) -> None:
+        for key in keys:
+            # Reads started before the write must not be joined by later readers
+            self.kv_flight.forget((collection_name, key))
+            if self.cache is not None:
+                self.cache.invalidate((collection_name, key))
+
     def get_document(self, collection_name: str, key: str):
-        """Get document by key using KV operation"""
-        return self.scope.collection(collection_name).get(key)
+        """Get document by key using KV operation
+
+        Concurrent gets of the same key share one KV read and all receive its
+        result or exception.
+        """
+        if self.cache is None or self._cache_ttl(collection_name) <= 0:
+            return self._read_document(collection_name, key)
+
+        result = self.cache.get((collection_name, key))
+        if result is MISSING:
+            generation = self.cache.generation
+            result = CachedDocument.from_result(
+                self._read_document(collection_name, key)
+            )
+            self.cache.set(
+                (collection_name, key),
+                result,
+                self._cache_ttl(collection_name),
+                generation,
+            )
+        return result
+
+    def _read_document(self, collection_name: str, key: str):
+        if self.replica is not None and self.replica.serves(collection_name):
+            return self._timed(
+                "replica_get", collection_name, self.replica.get, collection_name, key
+            )
+        return self.kv_flight.do(
+            (collection_name, key),
+            lambda: self._timed(
+                "kv_get",
+                collection_name,
+                self.scope.collection(collection_name).get,
+                key,
+            ),
+        )
+
+    def get_documents(self, collection_name: str, keys: list) -> dict:
+        """Get multiple documents by key using a single pipelined KV multi-get
+
+        Returns a dict mapping each key to its GetResult, or to the exception
+        raised for that key (for example DocumentNotFoundException).
+        """
+        documents = {}
+        use_cache = self.cache is not None and self._cache_ttl(collection_name) > 0
+        if use_cache:
+            for key in keys:
+                result = self.cache.get((collection_name, key))
+                if result is not MISSING:
+                    documents[key] = result
+            keys = [key for key in keys if key not in documents]
+        if not keys:
+            return documents
+
+        generation = self.cache.generation if use_cache else None
+        if self.replica is not None and self.replica.serves(collection_name):
+            result = self._timed(
+                "replica_get_multi",
+                collection_name,
+                self.replica.get_multi,
+                collection_name,
+                keys,
+            )
+        else:
+            result = self._timed(
+                "kv_get_multi",
+                collection_name,
+                self.scope.collection(collection_name).get_multi,
+                keys,
+                GetMultiOptions(return_exceptions=True),
+            )
+        documents.update(result.exceptions)
+        if not use_cache:
+            documents.update(result.results)
+            return documents
+        ttl = self._cache_ttl(collection_name)
+        for key, document in result.results.items():
+            document = documents[key] = CachedDocument.from_result(document)
+            self.cache.set((collection_name, key), document, ttl, generation)
+        return documents
 
     def insert_document(self, collection_name: str, key: str, doc: dict):
         """Insert document using KV operation"""
-        return self.scope.collection(collection_name).insert(key, doc)
+        try:
+            result = self._timed(
+                "kv_insert",
+                collection_name,
+                self.scope.collection(collection_name).insert,
+                key,
+                doc,
+            )
+            self._replicate(collection_name, {key: doc}, {key: result})
+            return result
+        finally:
+            self._invalidate(collection_name, [key])
 
     def delete_document(self, collection_name: str, key: str):
         """Delete document using KV operation"""
-        return self.scope.collection(collection_name).remove(key)
+        try:
+            result = self._timed(
+                "kv_remove",
+                collection_name,
+                self.scope.collection(collection_name).remove,
+                key,
+            )
+            self._replicate(collection_name, {key: None}, {key: result})
+            return result
+        finally:
+            self._invalidate(collection_name, [key])
 
     def upsert_document(self, collection_name: str, key: str, doc: dict):
         """Upsert document using KV operation"""
-        return self.scope.collection(collection_name).upsert(key, doc)
+        try:
+            result = self._timed(
+                "kv_upsert",
+                collection_name,
+                self.scope.collection(collection_name).upsert,
+                key,
+                doc,
+            )
+            self._replicate(collection_name, {key: doc}, {key: result})
+            return result
+        finally:
+            self._invalidate(collection_name, [key])
+
+    def insert_documents(self, collection_name: str, docs: dict) -> dict:
+        """Insert multiple documents using a single pipelined KV multi-insert
+
+        Returns a dict mapping each key to its MutationResult, or to the
+        exception raised for that key (for example DocumentExistsException).
+        """
+        if not docs:
+            return {}
+        try:
+            result = self._timed(
+                "kv_insert_multi",
+                collection_name,
+                self.scope.collection(collection_name).insert_multi,
+                docs,
+                InsertMultiOptions(return_exceptions=True),
+            )
+        finally:
+            self._invalidate(collection_name, docs)
+        mutations = dict(result.exceptions)
+        mutations.update(result.results)
+        self._replicate(collection_name, docs, mutations)
+        return mutations
+
+    def upsert_documents(self, collection_name: str, docs: dict) -> dict:
+        """Upsert multiple documents using a single pipelined KV multi-upsert
+
+        Returns a dict mapping each key to its MutationResult, or to the
+        exception raised for that key.
+        """
+        if not docs:
+            return {}
+        try:
+            result = self._timed(
+                "kv_upsert_multi",
+                collection_name,
+                self.scope.collection(collection_name).upsert_multi,
+                docs,
+                UpsertMultiOptions(return_exceptions=True),
+            )
+        finally:
+            self._invalidate(collection_name, docs)
+        mutations = dict(result.exceptions)
+        mutations.update(result.results)
+        self._replicate(collection_name, docs, mutations)
+        return mutations
 
     def query(self, sql_query, *options, **kwargs):
         """Query Couchbase using SQL++"""
         # options are used for positional parameters
         # kwargs are used for named parameters
-        return self.scope.query(sql_query, *options, **kwargs)
+        return self._timed_rows(
+            "adhoc",
+            self._query_rows(
+                " ".join(sql_query.split()), sql_query, *options, **kwargs
+            ),
+        )
+
+    def register_statement(self, name: str, sql: str) -> None:
+        """Register a fixed SQL++ statement to be run by name with query_statement"""
+        self.statements[name] = Statement(name, sql)
+
+    def enable_prepared_statements(self) -> None:
+        """Run registered statements as prepared statements (adhoc=False)
+
+        The query service then parses and plans each statement once per node
+        and reuses the plan for every later execution.
+        """
+        self.prepared_statements = True
+
+    def statement_stats(self) -> list:
+        """Run and failure counters of the registered statements"""
+        with self._statements_lock:
+            return [
+                statement.stats(self.prepared_statements)
+                for statement in self.statements.values()
+            ]
+
+    def query_statement(self, name: str, **params):
+        """Run a registered SQL++ statement with named parameters, yielding its rows
+
+        The airline and airport list statements are answered by the read
+        replica instead, when it is enabled and ready.
+        """
+        if self.replica is not None and self.replica.serves_statement(name):
+            return self._timed_rows(
+                name, self.replica.query_statement(name, **params), "replica_query"
+            )
+        return self._timed_rows(name, self._query_statement(name, **params))
+
+    def _query_statement(self, name: str, **params):
+        statement = self.statements[name]
+        # The SDK prepares a statement run with adhoc=False on first use, and
+        # prepares it again by itself if the query service drops the plan
+        options = (QueryOptions(adhoc=False),) if self.prepared_statements else ()
+        with self._statements_lock:
+            statement.executions += 1
+        try:
+            yield from self._query_rows(name, statement.sql, *options, **params)
+        except CouchbaseException:
+            with self._statements_lock:
+                statement.errors += 1
+            raise
 
     def search_by_name(self, name):
         """Perform a full-text search for hotel names using the given name"""
+        started = time.perf_counter()
+        status = "error"
         try:
             searchQuery = search.SearchRequest.create(
                 search.MatchQuery(name, field="name")
@@ -155,35 +722,117 @@ class CouchbaseClient(object):
             for row in searchResult.rows():
                 hotel = row.fields
                 names.append(hotel.get("name", ""))
+            status = "ok"
+            if self.slow_log is not None:
+                self._log_slow_search({"name": name}, searchResult, started)
         except Exception as e:
             print("Error while performing fts search", {e})
+        self._observe("search", self.index_name, status, started)
         return names
 
+    def enable_filter_cache(self, max_size: int, ttl: float) -> None:
+        """Cache hotel filter search results for ttl seconds"""
+        self.filter_cache = LRUCache(max_size)
+        self.filter_cache_ttl = ttl
+
+    def filter_cache_stats(self) -> dict:
+        """Hit/miss counters of the filter cache and coalesced searches"""
+        stats = {
+            "enabled": self.filter_cache is not None,
+            "searches": self.filter_flight.calls,
+            "coalesced": self.filter_flight.coalesced,
+        }
+        if self.filter_cache is not None:
+            stats.update(self.filter_cache.stats())
+        return stats
+
     def filter(self, filter, limit, offset):
-        """Perform a full-text search with filters and pagination"""
-        try:
-            conjuncts = []
+        """Perform a full-text search with filters and pagination
 
-            match_query_terms = ["description", "name", "title"]
-            conjuncts.extend(
-                [
-                    MatchQuery(filter[t], field=t)
-                    for t in match_query_terms
-                    if t in filter
-                ]
+        Identical concurrent searches share one FTS request, and results are
+        served from the filter cache when it is enabled.
+        """
+        hotels = []
+        try:
+            key = filter_cache_key(filter, limit, offset)
+            if self.filter_cache is not None:
+                cached = self.filter_cache.get(key)
+                if cached is not MISSING:
+                    return list(cached)
+            hotels = self.filter_flight.do(
+                key, lambda: self._search_filter(key, filter, limit, offset)
             )
-            term_query_terms = ["city", "country", "state"]
-            conjuncts.extend(
-                [TermQuery(filter[t], field=t) for t in term_query_terms if t in filter]
+            hotels = list(hotels)
+        except Exception as e:
+            print("Error while performing fts search", {e})
+        return hotels
+
+    def search_near(self, lat, lon, radius, limit, offset) -> list:
+        """Hotels within radius km of a point, nearest first, with their distance
+
+        A single FTS geo-distance query on the `geo` geopoint field, sorted by
+        distance and then ID so pages are stable.
+        """
+        # FTS takes locations as [lon, lat]
+        location = (lon, lat)
+        query = search.GeoDistanceQuery(f"{radius}km", location, field="geo")
+        options = SearchOptions(
+            fields=["*"],
+            limit=limit,
+            skip=offset,
+            sort=[
+                search.SortGeoDistance(location, "geo", unit="km"),
+                search.SortID(),
+            ],
+        )
+
+        started = time.perf_counter()
+        status = "error"
+        try:
+            result = self.scope.search(
+                self.index_name, search.SearchRequest.create(query), options
             )
+            hotels = [dict(row.fields, id=row.id) for row in result.rows()]
+            status = "ok"
+            if self.slow_log is not None:
+                self._log_slow_search(
+                    dict(lat=lat, lon=lon, radius=radius, limit=limit, offset=offset),
+                    result,
+                    started,
+                )
+        finally:
+            self._observe("search", self.index_name, status, started)
+
+        # Sort values of geo-distance sorts are encoded, so the distance of
+        # each hotel is computed from its stored geopoint
+        points = [geo_point(hotel.get("geo")) for hotel in hotels]
+        located = [point for point in points if point is not None]
+        distances = iter(
+            haversine_km(
+                math.radians(lat),
+                math.radians(lon),
+                np.radians([point[0] for point in located]),
+                np.radians([point[1] for point in located]),
+            ).tolist()
+        )
+        for hotel, point in zip(hotels, points):
+            if point is None:
+                hotel["distance"] = None
+                continue
+            hotel["geo"] = {"lat": point[0], "lon": point[1]}
+            hotel["distance"] = next(distances)
+        return hotels
 
-            if conjuncts:
-                query = ConjunctionQuery(*conjuncts)
-            else:
-                return []
+    def _search_filter(self, key, filter, limit, offset) -> list:
+        query = build_filter_query(filter)
+        if query is None:
+            return []
 
-            options = SearchOptions(fields=["*"], limit=limit, skip=offset)
+        options = SearchOptions(fields=["*"], limit=limit, skip=offset)
 
+        started = time.perf_counter()
+        status = "error"
+        try:
             result = self.scope.search(
                 self.index_name, search.SearchRequest.create(query), options
             )
@@ -191,6 +840,13 @@ class CouchbaseClient(object):
             for row in result.rows():
                 hotel = row.fields
                 hotels.append(hotel)
-        except Exception as e:
-            print("Error while performing fts search", {e})
+            status = "ok"
+            if self.slow_log is not None:
+                self._log_slow_search(
+                    dict(filter, limit=limit, offset=offset), result, started
+                )
+        finally:
+            self._observe("search", self.index_name, status, started)
+        if self.filter_cache is not None:
+            self.filter_cache.set(key, hotels, self.filter_cache_ttl)
         return hotels
@@ -1,4 +1,36 @@
 from db import CouchbaseClient
+from async_db import AsyncCouchbaseClient
+from route_index import RouteIndex
+from route_snapshot import RouteSnapshot
+from airport_geo_index import AirportGeoIndex
+from hotel_index import HotelNameIndex
+from read_replica import ReadReplica
+from metrics import Metrics
+from tracing import Tracer
 
 # Couchbase client object shared by all routes
 couchbase_db = CouchbaseClient()
+
+# Couchbase client object shared by the ASGI handlers in asgi.py
+async_couchbase_db = AsyncCouchbaseClient()
+
+# In-memory route network answering route lookups without SQL++
+route_index = RouteIndex()
+
+# Columnar NumPy snapshot of the route collection for vectorised analytics
+route_snapshot = RouteSnapshot()
+
+# In-memory grid of airport coordinates answering nearest-airport lookups
+airport_geo_index = AirportGeoIndex()
+
+# In-memory word-prefix index answering hotel autocomplete without FTS
+hotel_index = HotelNameIndex()
+
+# Local SQLite copy of the inventory scope, if enabled in app.py
+read_replica = ReadReplica()
+
+# Request and Couchbase operation latency histograms exposed for Prometheus
+metrics = Metrics()
+
+# Request tracer, sampling and exporting as configured in app.py
+tracer = Tracer()
@@ -0,0 +1,63 @@
+"""gunicorn settings for serving the Flask application in production
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+The application is loaded once in the master process (preload_app) without
+connecting to the cluster. The cluster is provisioned once, in a separate
+process, before the workers are forked. Every worker then opens its own
+connection after fork, since an SDK connection must not be shared between
+processes, and closes it when it exits.
+"""
+
+import os
+import subprocess
+import sys
+from dotenv import load_dotenv
+
+load_dotenv()
+
+bind = f"0.0.0.0:{os.getenv('PORT', 8080)}"
+
+# One worker process by default, serving requests from a pool of threads while
+# their KV and SQL++ calls wait on the network. Every worker keeps its own
+# in-memory indexes and caches, and a write only updates those of the worker
+# handling it until the others reload them.
+workers = int(os.getenv("WEB_CONCURRENCY", 1))
+threads = int(os.getenv("GUNICORN_THREADS", 8))
+worker_class = "gthread"
+
+preload_app = True
+
+# Requests still running on shutdown get this long to complete
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", 30))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", 60))
+keepalive = 5
+
+accesslog = "-"
+
+
+def on_starting(server):
+    """Check the scope and create the search index once for all workers"""
+    if os.getenv("DB_PROVISION", "true").lower() != "true":
+        return
+    # A separate process keeps the SDK connection out of the master
+    result = subprocess.run(
+        [sys.executable, "provision.py"], cwd=os.path.dirname(__file__) or "."
+    )
+    if result.returncode != 0:
+        server.log.error("Provisioning the cluster failed")
+        sys.exit(1)
+
+
+def post_worker_init(worker):
+    """Connect this worker to the cluster and start its in-memory indexes"""
+    from app import start_app
+
+    start_app(worker.wsgi, provision=False)
+
+
+def worker_exit(server, worker):
+    """Close this worker's cluster connection on shutdown"""
+    from extensions import couchbase_db
+
+    couchbase_db.close()
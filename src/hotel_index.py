@@ -0,0 +1,90 @@
+import re
+import threading
+import time
+from bisect import bisect_left
+from background_index import BackgroundIndex
+
+HOTEL_INDEX_QUERY = """
+    SELECT META(hotel).id, hotel.name
+    FROM hotel AS hotel
+    WHERE hotel.name IS VALUED
+"""
+
+WORD = re.compile(r"\w+")
+
+
+def words(text: str) -> list:
+    return WORD.findall(text.lower())
+
+
+class HotelNameIndex(BackgroundIndex):
+    """Word-prefix index over hotel names for autocomplete
+
+    Every word of every hotel name is kept in one sorted array together with the
+    number of the hotel it belongs to, so the hotels having a word that starts
+    with a prefix are found with a binary search. The hotel API has no write
+    endpoints, so the index is reloaded on a schedule rather than on writes.
+    """
+
+    name = "hotel"
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._names = []
+        self._name_words = []
+        self._words = []
+        self._hotels = []
+        self._lock = threading.Lock()
+
+    def load(self, client) -> None:
+        """Read all hotel names and replace the index with them"""
+        started = time.monotonic()
+        names = sorted(
+            row["name"]
+            for row in client.query(HOTEL_INDEX_QUERY)
+            if isinstance(row.get("name"), str)
+        )
+        name_words = [words(name) for name in names]
+        entries = sorted(
+            (word, hotel)
+            for hotel, hotel_words in enumerate(name_words)
+            for word in set(hotel_words)
+        )
+        with self._lock:
+            self._names = names
+            self._name_words = name_words
+            self._words = [word for word, _ in entries]
+            self._hotels = [hotel for _, hotel in entries]
+            self.loaded(started)
+
+    def search(self, text: str, limit: int) -> list:
+        """Names of hotels having a word starting with each word of text
+
+        Names starting with the text come first, then shorter names.
+        """
+        query_words = words(text)
+        if not query_words:
+            return []
+        with self._lock:
+            # The longest word has the fewest candidates
+            prefix = max(query_words, key=len)
+            start = bisect_left(self._words, prefix)
+            end = bisect_left(self._words, prefix + "\uffff", start)
+            candidates = set(self._hotels[start:end])
+            matches = [
+                self._names[hotel]
+                for hotel in candidates
+                if all(
+                    any(word.startswith(query_word) for word in self._name_words[hotel])
+                    for query_word in query_words
+                )
+            ]
+        text = text.lower().strip()
+        matches.sort(
+            key=lambda name: (not name.lower().startswith(text), len(name), name)
+        )
+        return matches[:limit]
+
+    def size(self) -> int:
+        with self._lock:
+            return len(self._names)
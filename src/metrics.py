@@ -0,0 +1,153 @@
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+from flask import Flask, request
+
+# Upper bounds in seconds, from a cached KV get to a slow SQL++ query
+DEFAULT_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+
+def escape(value: str) -> str:
+    """Escape a label value for the Prometheus text format"""
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class Histogram(object):
+    """Thread-safe latency histogram with one series per combination of labels
+
+    `observe` only finds the bucket and bumps two numbers under a lock, so
+    recording costs about a microsecond. The cumulative bucket counts, sum and
+    count of each series are only computed when the metrics are exposed.
+    """
+
+    def __init__(
+        self, name: str, documentation: str, labels: tuple, buckets=DEFAULT_BUCKETS
+    ) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        # label values -> [count per bucket, with +Inf last], sum]
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels: tuple, value: float) -> None:
+        """Record a value for the series with these label values"""
+        bucket = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][bucket] += 1
+            series[1] += value
+
+    def collect(self) -> dict:
+        """Snapshot of the series as {label values: (bucket counts, sum)}"""
+        with self._lock:
+            return {
+                labels: (list(counts), total)
+                for labels, (counts, total) in self._series.items()
+            }
+
+    def expose(self) -> list:
+        """Lines of the histogram in the Prometheus text format"""
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} histogram",
+        ]
+        for labels, (counts, total) in sorted(self.collect().items()):
+            label_text = ",".join(
+                f'{name}="{escape(value)}"' for name, value in zip(self.labels, labels)
+            )
+            prefix = label_text + "," if label_text else ""
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{prefix}le="{bound}"}} {cumulative}')
+            lines.append(f"{self.name}_sum{{{label_text}}} {total}")
+            lines.append(f"{self.name}_count{{{label_text}}} {cumulative}")
+        return lines
+
+
+class Metrics(object):
+    """Registry of the application's histograms"""
+
+    def __init__(self) -> None:
+        self.requests = Histogram(
+            "http_request_duration_seconds",
+            "Time to handle an HTTP request, by route template and status code",
+            ("method", "route", "status"),
+        )
+        self.operations = Histogram(
+            "couchbase_operation_duration_seconds",
+            "Time of a Couchbase operation, by collection (KV), statement (SQL++) or index (FTS)",
+            ("operation", "target", "status"),
+        )
+
+    def instrument(self, app: Flask) -> None:
+        """Record the latency of every request handled by the app"""
+        requests = self.requests
+
+        @app.before_request
+        def start_timer():
+            request.environ["metrics.started"] = time.perf_counter()
+
+        @app.after_request
+        def record_request(response):
+            # Resolve the request proxy once, each access costs a context lookup
+            current = request._get_current_object()
+            started = current.environ.get("metrics.started")
+            if started is not None:
+                rule = current.url_rule
+                requests.observe(
+                    (
+                        current.method,
+                        rule.rule if rule is not None else "<unmatched>",
+                        str(response.status_code),
+                    ),
+                    time.perf_counter() - started,
+                )
+            return response
+
+    def expose(self) -> str:
+        """All metrics in the Prometheus text exposition format"""
+        lines = self.requests.expose() + self.operations.expose()
+        return "\n".join(lines) + "\n"
+
+
+class SlowOperationLog(object):
+    """Bounded ring buffer of the operations that took at least `threshold` seconds
+
+    Once `max_size` entries are kept, every new entry drops the oldest one.
+    """
+
+    def __init__(self, threshold: float, max_size: int) -> None:
+        self.threshold = threshold
+        self.max_size = max_size
+        self._entries = deque(maxlen=max_size)
+        self._lock = threading.Lock()
+
+    def record(self, entry: dict) -> None:
+        with self._lock:
+            self._entries.append(entry)
+
+    def entries(self) -> list:
+        """The kept entries, newest first"""
+        with self._lock:
+            return list(reversed(self._entries))
@@ -0,0 +1,45 @@
+"""Provision the cluster for the application without starting it.
+
+Checks that the inventory scope exists and creates or updates the hotel_search
+FTS index when the cluster does not have its definition yet. With
+READ_REPLICA=true it also creates the CAS indexes the read replica refreshes
+with. Run it once per deployment and start the application with
+DB_PROVISION=false to keep these steps out of startup:
+
+    python provision.py [--force]
+"""
+
+import argparse
+import os
+import sys
+from dotenv import load_dotenv
+from db import CouchbaseClient
+from read_replica import create_cas_indexes
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="upsert the search index even if the cluster already has its definition",
+    )
+    args = parser.parse_args()
+
+    load_dotenv()
+    client = CouchbaseClient()
+    client.init_app(
+        os.getenv("DB_CONN_STR"),
+        os.getenv("DB_USERNAME"),
+        os.getenv("DB_PASSWORD"),
+        None,
+        provision=False,
+    )
+    provisioned = client.provision(force=args.force)
+    if provisioned and os.getenv("READ_REPLICA", "false").lower() == "true":
+        provisioned = create_cas_indexes(client)
+    return 0 if provisioned else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
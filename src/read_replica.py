@@ -0,0 +1,374 @@
+import json
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+from couchbase.exceptions import CouchbaseException, DocumentNotFoundException
+from background_index import BackgroundIndex
+
+REPLICA_COLLECTIONS = ("airline", "airport", "route", "hotel")
+
+# Index of each collection on the CAS, so the changes query only reads the
+# documents changed since the last refresh instead of scanning the primary index
+# and fetching every document of the collection
+REPLICA_CAS_INDEX = """
+    CREATE INDEX IF NOT EXISTS `replica_cas` ON `{collection}`(META().cas)
+"""
+
+# Documents of a collection changed at or after a CAS, and the IDs of all of them.
+# The IDs are read from an index without fetching the documents
+REPLICA_CHANGES_QUERY = """
+    SELECT META(c).id, META(c).cas, c AS document
+    FROM `{collection}` AS c
+    WHERE META(c).cas >= $since
+"""
+
+REPLICA_IDS_QUERY = """
+    SELECT RAW META(c).id
+    FROM `{collection}` AS c
+"""
+
+# CAS values are nanosecond hybrid logical clocks. Changes are read again from
+# a second before the highest CAS seen, so a CAS rounded by the query service
+# or a mutation committed late cannot be missed
+CAS_OVERLAP = 10**9
+
+# Field the list statements of a collection sort by
+SORT_FIELDS = {"airline": "name", "airport": "airportname"}
+
+AIRLINE_LIST_FIELDS = ("callsign", "country", "iata", "icao", "name")
+AIRPORT_LIST_FIELDS = ("airportname", "city", "country", "faa", "geo", "icao", "tz")
+
+# Registered statements answered from the replica:
+# name -> (collection, projected fields, filtered by country, seeks past a cursor)
+REPLICA_STATEMENTS = {
+    "airline_list": ("airline", AIRLINE_LIST_FIELDS, False, False),
+    "airline_list_by_country": ("airline", AIRLINE_LIST_FIELDS, True, False),
+    "airline_list_after": ("airline", AIRLINE_LIST_FIELDS, False, True),
+    "airline_list_by_country_after": ("airline", AIRLINE_LIST_FIELDS, True, True),
+    "airline_list_after_unnamed": ("airline", AIRLINE_LIST_FIELDS, False, True),
+    "airline_list_by_country_after_unnamed": (
+        "airline",
+        AIRLINE_LIST_FIELDS,
+        True,
+        True,
+    ),
+    "airport_list": ("airport", AIRPORT_LIST_FIELDS, False, False),
+    "airport_list_by_country": ("airport", AIRPORT_LIST_FIELDS, True, False),
+    "airport_list_after": ("airport", AIRPORT_LIST_FIELDS, False, True),
+    "airport_list_by_country_after": ("airport", AIRPORT_LIST_FIELDS, True, True),
+    "airport_list_after_unnamed": ("airport", AIRPORT_LIST_FIELDS, False, True),
+    "airport_list_by_country_after_unnamed": (
+        "airport",
+        AIRPORT_LIST_FIELDS,
+        True,
+        True,
+    ),
+}
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS documents (
+        collection TEXT NOT NULL,
+        id TEXT NOT NULL,
+        cas INTEGER NOT NULL,
+        document TEXT NOT NULL,
+        sort_name TEXT,
+        country TEXT,
+        PRIMARY KEY (collection, id)
+    ) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS documents_by_name
+        ON documents (collection, sort_name, id);
+    CREATE INDEX IF NOT EXISTS documents_by_country
+        ON documents (collection, country, sort_name, id);
+    CREATE TABLE IF NOT EXISTS collections (
+        collection TEXT PRIMARY KEY,
+        source TEXT NOT NULL,
+        since INTEGER NOT NULL,
+        refreshed_at REAL NOT NULL
+    );
+"""
+
+# A refresh may have read a document before it was written through this
+# application, so an older version never replaces a newer one
+UPSERT = """
+    INSERT INTO documents (collection, id, cas, document, sort_name, country)
+    VALUES (?, ?, ?, ?, ?, ?)
+    ON CONFLICT (collection, id) DO UPDATE SET
+        cas = excluded.cas,
+        document = excluded.document,
+        sort_name = excluded.sort_name,
+        country = excluded.country
+    WHERE excluded.cas >= documents.cas
+"""
+
+MultiGetResult = namedtuple("MultiGetResult", ["results", "exceptions"])
+
+
+def create_cas_indexes(client) -> bool:
+    """Create the CAS index of every replicated collection that does not have it
+
+    Returns False if an index could not be created. The refresh then still
+    works, but reads every document of the collection through its primary index.
+    """
+    try:
+        for collection in REPLICA_COLLECTIONS:
+            list(client.query(REPLICA_CAS_INDEX.format(collection=collection)))
+        print("Read replica CAS indexes created or already present.")
+        return True
+    except CouchbaseException as e:
+        print(f"Error creating the read replica CAS indexes: {e}")
+        return False
+
+
+class ReplicaContent(object):
+    """Decodes the document on access, like the SDK's `result.content_as`"""
+
+    __slots__ = ("value",)
+
+    def __init__(self, value: str) -> None:
+        self.value = value
+
+    def __getitem__(self, type_):
+        return type_(json.loads(self.value))
+
+
+class ReplicaDocument(object):
+    """A document read from the replica, used like the SDK's GetResult"""
+
+    __slots__ = ("key", "cas", "content_as")
+
+    def __init__(self, key: str, cas: int, value: str) -> None:
+        self.key = key
+        self.cas = cas
+        self.content_as = ReplicaContent(value)
+
+
+def document_row(collection: str, key: str, cas: int, document: dict) -> tuple:
+    """Parameters of UPSERT for a document"""
+    name = document.get(SORT_FIELDS.get(collection))
+    country = document.get("country")
+    return (
+        collection,
+        key,
+        cas,
+        json.dumps(document),
+        name if isinstance(name, str) else None,
+        country if isinstance(country, str) else None,
+    )
+
+
+class ReadReplica(BackgroundIndex):
+    """Local SQLite copy of the inventory scope answering KV gets and list queries
+
+    The first load copies every document of REPLICA_COLLECTIONS. Later loads
+    only read the documents whose CAS changed since the previous one, through
+    the REPLICA_CAS_INDEX of the collection, and all the IDs of the collection
+    to find deleted documents. Reading the IDs scans every key of the primary
+    index, but fetches no document. Writes made through this
+    application are applied to the replica as soon as they succeed, so it reads
+    its own writes; writes made elsewhere show up after the next refresh.
+
+    The file survives restarts: a replica of the same cluster only catches up
+    on the changes made since it last ran, and is ready once it did.
+    Each thread reads through its own connection, and the file is in WAL mode
+    so reads are not blocked by a refresh in progress.
+    """
+
+    name = "replica"
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.path = None
+        self.source = None
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        self._create_indexes = False
+
+    def open(self, path: str, source: str, create_indexes: bool = False) -> None:
+        """Use the replica file at path, holding a copy of the source cluster scope
+
+        The replica is not ready until the first load: a copy left by an
+        earlier run may lack the writes made since. With create_indexes the
+        first load creates the CAS indexes the refresh needs.
+        """
+        self.path = path
+        self.source = source
+        self._create_indexes = create_indexes
+        connection = self._connection()
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.executescript(SCHEMA)
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def load(self, client) -> None:
+        """Copy the documents changed since the last load and drop deleted ones"""
+        started = time.monotonic()
+        if self._create_indexes:
+            create_cas_indexes(client)
+            self._create_indexes = False
+        for collection in REPLICA_COLLECTIONS:
+            self._refresh(client, collection)
+        self.loaded(started)
+
+    def _refresh(self, client, collection: str) -> None:
+        connection = self._connection()
+        state = connection.execute(
+            "SELECT source, since FROM collections WHERE collection = ?",
+            (collection,),
+        ).fetchone()
+        since = state[1] if state is not None and state[0] == self.source else 0
+
+        # Changes first: a document created between the two queries is then
+        # kept, and one deleted between them is read but then dropped
+        rows = client.query(
+            REPLICA_CHANGES_QUERY.format(collection=collection),
+            since=max(0, since - CAS_OVERLAP),
+        )
+        highest = since
+        changes = []
+        for row in rows:
+            highest = max(highest, row["cas"])
+            changes.append(
+                document_row(collection, row["id"], row["cas"], row["document"])
+            )
+        ids = set(client.query(REPLICA_IDS_QUERY.format(collection=collection)))
+
+        with self._write_lock:
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                connection.executemany(UPSERT, changes)
+                # Documents written by this application after the IDs were read
+                # have a newer CAS and are kept until the next refresh. After a
+                # first copy this also drops what is left of another cluster
+                stale = [
+                    (collection, id)
+                    for (id,) in connection.execute(
+                        "SELECT id FROM documents WHERE collection = ? AND cas < ?",
+                        (collection, highest - CAS_OVERLAP),
+                    )
+                    if id not in ids
+                ]
+                connection.executemany(
+                    "DELETE FROM documents WHERE collection = ? AND id = ?", stale
+                )
+                connection.execute(
+                    "INSERT OR REPLACE INTO collections VALUES (?, ?, ?, ?)",
+                    (collection, self.source, highest, time.time()),
+                )
+                connection.execute("COMMIT")
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+
+    def serves(self, collection: str) -> bool:
+        """Whether gets from the collection are answered by the replica"""
+        return self.ready and collection in REPLICA_COLLECTIONS
+
+    def serves_statement(self, name: str) -> bool:
+        """Whether the registered statement is answered by the replica"""
+        return self.ready and name in REPLICA_STATEMENTS
+
+    def get(self, collection: str, key: str) -> ReplicaDocument:
+        """Get a document, raising DocumentNotFoundException like a KV get"""
+        row = (
+            self._connection()
+            .execute(
+                "SELECT cas, document FROM documents WHERE collection = ? AND id = ?",
+                (collection, key),
+            )
+            .fetchone()
+        )
+        if row is None:
+            raise DocumentNotFoundException(
+                message=f"Document {key} not found in the {collection} replica"
+            )
+        return ReplicaDocument(key, row[0], row[1])
+
+    def get_multi(self, collection: str, keys: list) -> MultiGetResult:
+        """Get documents, with DocumentNotFoundException for the missing keys"""
+        placeholders = ",".join("?" * len(keys))
+        found = {
+            id: ReplicaDocument(id, cas, document)
+            for id, cas, document in self._connection().execute(
+                f"SELECT id, cas, document FROM documents "
+                f"WHERE collection = ? AND id IN ({placeholders})",
+                [collection, *keys],
+            )
+        }
+        missing = {
+            key: DocumentNotFoundException(
+                message=f"Document {key} not found in the {collection} replica"
+            )
+            for key in keys
+            if key not in found
+        }
+        return MultiGetResult(found, missing)
+
+    def query_statement(self, name: str, **params) -> list:
+        """Rows of a registered list statement, as the query service returns them"""
+        collection, fields, by_country, after = REPLICA_STATEMENTS[name]
+        # NULL names sort first, like missing names in SQL++
+        sql = "SELECT id, document FROM documents WHERE collection = ?"
+        arguments = [collection]
+        if by_country:
+            sql += " AND country = ?"
+            arguments.append(params.get("country"))
+        if after and params.get("after_name") is None:
+            # Past a row without a name; MISSING and NULL names are both NULL here
+            sql += " AND (sort_name IS NOT NULL OR id > ?)"
+            arguments.append(params.get("after_id"))
+        elif after:
+            sql += " AND sort_name >= ? AND (sort_name, id) > (?, ?)"
+            arguments += [params.get("after_name")] * 2 + [params.get("after_id")]
+        sql += " ORDER BY sort_name, id LIMIT ?"
+        arguments.append(params.get("limit"))
+        if not after:
+            sql += " OFFSET ?"
+            arguments.append(params.get("offset", 0))
+        rows = []
+        for id, value in self._connection().execute(sql, arguments):
+            document = json.loads(value)
+            row = {"id": id}
+            row.update({f: document[f] for f in fields if f in document})
+            rows.append(row)
+        return rows
+
+    def apply(self, collection: str, changes: list) -> None:
+        """Apply writes made through this application, as (key, document, cas)
+
+        A document of None means the key was deleted.
+        """
+        if self.path is None or collection not in REPLICA_COLLECTIONS:
+            return
+        connection = self._connection()
+        try:
+            with self._write_lock:
+                connection.execute("BEGIN IMMEDIATE")
+                for key, document, cas in changes:
+                    if document is None:
+                        connection.execute(
+                            "DELETE FROM documents WHERE collection = ? AND id = ?",
+                            (collection, key),
+                        )
+                    else:
+                        connection.execute(
+                            UPSERT, document_row(collection, key, cas, document)
+                        )
+                connection.execute("COMMIT")
+        except sqlite3.Error as e:
+            if connection.in_transaction:
+                connection.execute("ROLLBACK")
+            print(f"Error applying writes to the {collection} replica: {e}")
+
+    def size(self) -> int:
+        if self.path is None:
+            return 0
+        return (
+            self._connection().execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+        )
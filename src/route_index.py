@@ -0,0 +1,352 @@
+import heapq
+import threading
+import time
+from array import array
+from collections import namedtuple
+from background_index import BackgroundIndex
+
+# Every route and airport is read once to build the index
+ROUTE_INDEX_ROUTES_QUERY = """
+    SELECT META(route).id,
+        route.sourceairport,
+        route.destinationairport,
+        route.stops,
+        route.airlineid,
+        route.distance
+    FROM route AS route
+"""
+
+ROUTE_INDEX_AIRPORTS_QUERY = """
+    SELECT META(airport).id, airport.faa
+    FROM airport AS airport
+"""
+
+ROUTE_INDEX_AIRLINES_QUERY = """
+    SELECT META(airline).id, airline.name
+    FROM airline AS airline
+"""
+
+Route = namedtuple("Route", ["source", "destination", "stops", "airlineid", "distance"])
+
+
+Leg = namedtuple("Leg", ["source", "destination", "distance", "routes"])
+
+
+def airline_name(doc: dict) -> str:
+    """The name an airline is ordered by, "" if it has none"""
+    name = doc.get("name")
+    return name if isinstance(name, str) else ""
+
+
+def route_entry(doc: dict) -> Route:
+    """The fields of a route document kept by the index"""
+    return Route(
+        doc.get("sourceairport"),
+        doc.get("destinationairport"),
+        doc.get("stops"),
+        doc.get("airlineid"),
+        doc.get("distance"),
+    )
+
+
+class RouteGraph(object):
+    """Nonstop route network in compressed sparse row form
+
+    Airports are numbered 0..n-1. The flights out of airport i are the edges
+    offsets[i] to offsets[i + 1] - 1, with their destination in `targets` and
+    their distance in `distances`. Routes flown by several airlines between the
+    same airports share one edge, which keeps the shortest distance.
+    """
+
+    def __init__(self, routes: dict) -> None:
+        edges = {}
+        for id, route in routes.items():
+            if (
+                route.stops != 0
+                or route.source is None
+                or route.destination is None
+                or route.source == route.destination
+                or not isinstance(route.distance, (int, float))
+            ):
+                continue
+            edge = edges.setdefault((route.source, route.destination), [None, []])
+            if edge[0] is None or route.distance < edge[0]:
+                edge[0] = route.distance
+            edge[1].append(id)
+
+        self.airports = sorted({airport for pair in edges for airport in pair})
+        self.numbers = {airport: i for i, airport in enumerate(self.airports)}
+        self.offsets = array("l", [0] * (len(self.airports) + 1))
+        self.sources = array("l")
+        self.targets = array("l")
+        self.distances = array("d")
+        self.routes = []
+        for (source, destination), (distance, ids) in sorted(edges.items()):
+            self.offsets[self.numbers[source] + 1] += 1
+            self.sources.append(self.numbers[source])
+            self.targets.append(self.numbers[destination])
+            self.distances.append(distance)
+            self.routes.append(sorted(ids))
+        for i in range(len(self.airports)):
+            self.offsets[i + 1] += self.offsets[i]
+
+    def paths(self, source: str, destination: str, max_stops: int, limit: int):
+        """Up to `limit` itineraries ordered by total distance
+
+        A best-first search over (airport, legs flown) labels. Each label is
+        expanded at most `limit` times and no itinerary visits an airport twice,
+        so the search stays bounded however dense the network is.
+        """
+        start = self.numbers.get(source)
+        goal = self.numbers.get(destination)
+        if start is None or goal is None or start == goal:
+            return []
+        max_legs = max_stops + 1
+        heap = [(0.0, 0, start, ())]
+        expanded = {}
+        pushed = 0
+        itineraries = []
+        while heap and len(itineraries) < limit:
+            distance, _, airport, path = heapq.heappop(heap)
+            if airport == goal:
+                itineraries.append((distance, path))
+                continue
+            label = (airport, len(path))
+            if expanded.get(label, 0) >= limit:
+                continue
+            expanded[label] = expanded.get(label, 0) + 1
+            visited = {start}
+            visited.update(self.targets[edge] for edge in path)
+            last_leg = len(path) + 1 == max_legs
+            for edge in range(self.offsets[airport], self.offsets[airport + 1]):
+                target = self.targets[edge]
+                if target in visited or (last_leg and target != goal):
+                    continue
+                pushed += 1
+                heapq.heappush(
+                    heap,
+                    (distance + self.distances[edge], pushed, target, path + (edge,)),
+                )
+        return [
+            (distance, [self.leg(edge) for edge in path])
+            for distance, path in itineraries
+        ]
+
+    def leg(self, edge: int) -> Leg:
+        return Leg(
+            self.airports[self.sources[edge]],
+            self.airports[self.targets[edge]],
+            self.distances[edge],
+            self.routes[edge],
+        )
+
+
+class RouteIndex(BackgroundIndex):
+    """In-memory index of the route network built from the route collection
+
+    The index is loaded in a background thread and then kept up to date by the
+    route, airport and airline write endpoints. Airline names are kept so the
+    airlines flying to an airport can be paged in name order without reading
+    them all.
+    """
+
+    name = "route"
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._routes = {}
+        self._airports = {}
+        # FAA code -> number of airport documents with that code
+        self._faa = {}
+        # source FAA -> {destination FAA: number of nonstop routes}
+        self._nonstop = {}
+        # source FAA -> sorted destinations, rebuilt on first read after a change
+        self._sorted = {}
+        # destination FAA -> {airline ID: number of routes}
+        self._airlines = {}
+        # airline ID -> name of the airline documents
+        self._airline_names = {}
+        # destination FAA -> airline IDs ordered by name, rebuilt on first read
+        # after a change
+        self._airlines_sorted = {}
+        # Rebuilt on first path search after the routes change
+        self._graph = None
+        # Writes made while a load is running, applied on top of the loaded data
+        self._pending = None
+        self._lock = threading.Lock()
+
+    def load(self, client) -> None:
+        """Read all routes and airports and replace the index with them"""
+        started = time.monotonic()
+        with self._lock:
+            self._pending = {}
+        try:
+            routes = {
+                row["id"]: route_entry(row)
+                for row in client.query(ROUTE_INDEX_ROUTES_QUERY)
+            }
+            airports = {
+                row["id"]: row.get("faa")
+                for row in client.query(ROUTE_INDEX_AIRPORTS_QUERY)
+            }
+            airlines = {
+                row["id"]: airline_name(row)
+                for row in client.query(ROUTE_INDEX_AIRLINES_QUERY)
+            }
+        except Exception:
+            with self._lock:
+                self._pending = None
+            raise
+        with self._lock:
+            loaded = {"route": routes, "airport": airports, "airline": airlines}
+            for (kind, id), entry in self._pending.items():
+                target = loaded[kind]
+                if entry is None:
+                    target.pop(id, None)
+                else:
+                    target[id] = entry
+            self._pending = None
+            self._routes = routes
+            self._airports = airports
+            self._airline_names = airlines
+            self._rebuild()
+            self._graph = RouteGraph(self._routes)
+            self.loaded(started)
+
+    def _rebuild(self) -> None:
+        self._graph = None
+        self._faa = {}
+        self._nonstop = {}
+        self._sorted = {}
+        self._airlines = {}
+        self._airlines_sorted = {}
+        for faa in self._airports.values():
+            self._count_faa(faa, 1)
+        for route in self._routes.values():
+            self._link(route, 1)
+
+    def _count_faa(self, faa: str, count: int) -> None:
+        if faa is None:
+            return
+        self._faa[faa] = self._faa.get(faa, 0) + count
+        if self._faa[faa] <= 0:
+            del self._faa[faa]
+        self._sorted.pop(faa, None)
+
+    def _link(self, route: Route, count: int) -> None:
+        if route.destination is not None and route.airlineid is not None:
+            airlines = self._airlines.setdefault(route.destination, {})
+            airlines[route.airlineid] = airlines.get(route.airlineid, 0) + count
+            if airlines[route.airlineid] <= 0:
+                del airlines[route.airlineid]
+            self._airlines_sorted.pop(route.destination, None)
+        if route.stops != 0 or route.source is None or route.destination is None:
+            return
+        destinations = self._nonstop.setdefault(route.source, {})
+        destinations[route.destination] = destinations.get(route.destination, 0) + count
+        if destinations[route.destination] <= 0:
+            del destinations[route.destination]
+        self._sorted.pop(route.source, None)
+
+    def _record(self, kind: str, id: str, entry) -> None:
+        if self._pending is not None:
+            self._pending[(kind, id)] = entry
+
+    def put_route(self, id: str, doc: dict) -> None:
+        """Add or replace a route after it was written"""
+        route = route_entry(doc)
+        with self._lock:
+            self._record("route", id, route)
+            previous = self._routes.get(id)
+            if previous is not None:
+                self._link(previous, -1)
+            self._routes[id] = route
+            self._link(route, 1)
+            self._graph = None
+
+    def remove_route(self, id: str) -> None:
+        """Drop a route after it was deleted"""
+        with self._lock:
+            self._record("route", id, None)
+            previous = self._routes.pop(id, None)
+            if previous is not None:
+                self._link(previous, -1)
+                self._graph = None
+
+    def put_airport(self, id: str, doc: dict) -> None:
+        """Add or replace an airport after it was written"""
+        faa = doc.get("faa")
+        with self._lock:
+            self._record("airport", id, faa)
+            self._count_faa(self._airports.get(id), -1)
+            self._airports[id] = faa
+            self._count_faa(faa, 1)
+
+    def remove_airport(self, id: str) -> None:
+        """Drop an airport after it was deleted"""
+        with self._lock:
+            self._record("airport", id, None)
+            self._count_faa(self._airports.pop(id, None), -1)
+
+    def put_airline(self, id: str, doc: dict) -> None:
+        """Add or rename an airline after it was written"""
+        name = airline_name(doc)
+        with self._lock:
+            self._record("airline", id, name)
+            if self._airline_names.get(id) != name:
+                self._airline_names[id] = name
+                self._airlines_sorted = {}
+
+    def remove_airline(self, id: str) -> None:
+        """Drop an airline after it was deleted"""
+        with self._lock:
+            self._record("airline", id, None)
+            if self._airline_names.pop(id, None) is not None:
+                self._airlines_sorted = {}
+
+    def direct_connections(self, airport: str) -> list:
+        """Sorted, distinct nonstop destinations from an airport
+
+        Like DIRECT_CONNECTIONS_QUERY, only airports that exist in the airport
+        collection have connections.
+        """
+        with self._lock:
+            if airport not in self._faa:
+                return []
+            destinations = self._sorted.get(airport)
+            if destinations is None:
+                destinations = sorted(self._nonstop.get(airport, ()))
+                self._sorted[airport] = destinations
+            return destinations
+
+    def airlines_to(self, airport: str, limit: int, offset: int) -> list:
+        """IDs of a page of the airlines flying any route into an airport
+
+        Like AIRLINES_TO_AIRPORT_QUERY, only airlines that exist in the airline
+        collection are listed, ordered by name and then by ID.
+        """
+        with self._lock:
+            airlines = self._airlines_sorted.get(airport)
+            if airlines is None:
+                airlines = sorted(
+                    (
+                        id
+                        for id in self._airlines.get(airport, ())
+                        if id in self._airline_names
+                    ),
+                    key=lambda id: (self._airline_names[id], id),
+                )
+                self._airlines_sorted[airport] = airlines
+            return airlines[offset : offset + limit]
+
+    def paths(self, source: str, destination: str, max_stops: int, limit: int):
+        """Shortest itineraries by distance between two airports, see RouteGraph"""
+        with self._lock:
+            if self._graph is None:
+                self._graph = RouteGraph(self._routes)
+            graph = self._graph
+        return graph.paths(source, destination, max_stops, limit)
+
+    def size(self) -> int:
+        with self._lock:
+            return len(self._routes)
@@ -0,0 +1,484 @@
+import math
+import threading
+import time
+from array import array
+from collections import namedtuple
+from functools import lru_cache
+import numpy as np
+from background_index import BackgroundIndex
+
+# Every route is read once to build the snapshot
+ROUTE_SNAPSHOT_QUERY = """
+    SELECT META(route).id,
+        route.airline,
+        route.airlineid,
+        route.sourceairport,
+        route.destinationairport,
+        route.stops,
+        route.equipment,
+        route.distance,
+        route.schedule
+    FROM route AS route
+"""
+
+# Code of a missing string and value of a missing integer in the columns.
+# Missing distances are NaN
+MISSING = -1
+
+# Column name -> dtype of the three tables. Strings are stored as codes into
+# the interned values of CODE_TABLES
+ROUTE_COLUMNS = {
+    "airline": np.int32,
+    "airlineid": np.int32,
+    "source": np.int32,
+    "destination": np.int32,
+    "stops": np.int16,
+    "distance": np.float64,
+}
+SCHEDULE_COLUMNS = {
+    "route": np.int32,
+    "day": np.int8,
+    "flight": np.int32,
+    "utc": np.int32,
+}
+EQUIPMENT_COLUMNS = {
+    "route": np.int32,
+    "equipment": np.int32,
+}
+
+# Column -> interned values its codes refer to
+CODE_TABLES = {
+    "airline": "airlines",
+    "airlineid": "airline_ids",
+    "source": "airports",
+    "destination": "airports",
+    "flight": "flights",
+    "equipment": "equipment",
+}
+
+# Rows of replaced and deleted routes are dropped once they outnumber the live
+# ones and there are at least this many of them
+COMPACT_MIN_DEAD = 1024
+
+Snapshot = namedtuple("Snapshot", ["ids", "codes", "routes", "schedule", "equipment"])
+
+
+class Codes(object):
+    """Interned strings, numbered in the order they were first seen"""
+
+    def __init__(self) -> None:
+        self.values = []
+        self.numbers = {}
+
+    def code(self, value) -> int:
+        if not isinstance(value, str):
+            return MISSING
+        number = self.numbers.get(value)
+        if number is None:
+            number = self.numbers[value] = len(self.values)
+            self.values.append(value)
+        return number
+
+
+class Table(object):
+    """Columns of the same length in NumPy arrays, with spare capacity to append
+
+    Only the first `length` rows are used. A full table is copied to arrays of
+    twice the size, so appending never changes the rows of an earlier view.
+    """
+
+    def __init__(self, columns: dict) -> None:
+        self.columns = columns
+        self.length = len(next(iter(columns.values())))
+
+    @classmethod
+    def from_arrays(cls, dtypes: dict, values: dict) -> "Table":
+        """Table over the typed arrays made by `builders`, without copying them"""
+        return cls(
+            {
+                name: np.frombuffer(values[name], dtype=dtype)
+                for name, dtype in dtypes.items()
+            }
+        )
+
+    @staticmethod
+    def builders(dtypes: dict) -> dict:
+        """Empty typed arrays to accumulate the columns of a table in"""
+        return {name: array(np.dtype(dtype).char) for name, dtype in dtypes.items()}
+
+    def append(self, row: tuple) -> int:
+        """Append a row with a value for each column, returning its number"""
+        if self.length == len(next(iter(self.columns.values()))):
+            capacity = max(16, 2 * self.length)
+            for name, column in self.columns.items():
+                grown = np.empty(capacity, dtype=column.dtype)
+                grown[: self.length] = column[: self.length]
+                self.columns[name] = grown
+        for column, value in zip(self.columns.values(), row):
+            column[self.length] = value
+        self.length += 1
+        return self.length - 1
+
+    def take(self, rows: np.ndarray) -> "Table":
+        """A new table of the rows selected by a boolean mask"""
+        return Table(
+            {name: column[: self.length][rows] for name, column in self.columns.items()}
+        )
+
+    def view(self) -> dict:
+        return {name: column[: self.length] for name, column in self.columns.items()}
+
+
+def utc_seconds(value) -> int:
+    """Seconds since midnight of a schedule time like 14:05:00"""
+    return parse_utc(value) if isinstance(value, str) else MISSING
+
+
+# Schedules repeat the same few thousand departure times
+@lru_cache(maxsize=2**16)
+def parse_utc(value: str) -> int:
+    try:
+        hours, minutes, seconds = (int(part) for part in value.split(":"))
+    except ValueError:
+        return MISSING
+    return hours * 3600 + minutes * 60 + seconds
+
+
+def integer(value, bound: int) -> int:
+    """An integer from 0 to bound - 1, or MISSING"""
+    if isinstance(value, int) and not isinstance(value, bool) and 0 <= value < bound:
+        return value
+    return MISSING
+
+
+def route_rows(doc: dict, codes: dict) -> tuple:
+    """The route row and its schedule and equipment rows, without the route number"""
+    distance = doc.get("distance")
+    route = (
+        codes["airlines"].code(doc.get("airline")),
+        codes["airline_ids"].code(doc.get("airlineid")),
+        codes["airports"].code(doc.get("sourceairport")),
+        codes["airports"].code(doc.get("destinationairport")),
+        integer(doc.get("stops"), 2**15),
+        (
+            float(distance)
+            if isinstance(distance, (int, float)) and not isinstance(distance, bool)
+            else math.nan
+        ),
+    )
+    schedule = [
+        (
+            integer(flight.get("day"), 7),
+            codes["flights"].code(flight.get("flight")),
+            utc_seconds(flight.get("utc")),
+        )
+        for flight in doc.get("schedule") or ()
+        if isinstance(flight, dict)
+    ]
+    equipment = doc.get("equipment")
+    equipment = [
+        codes["equipment"].code(aircraft)
+        for aircraft in (equipment.split() if isinstance(equipment, str) else ())
+    ]
+    return route, schedule, equipment
+
+
+class RouteColumns(object):
+    """The route collection as columns, with one row per route document
+
+    A write appends a new row for the route and marks its previous row dead in
+    `live`; the schedule and equipment rows of a dead route stay until the
+    tables are compacted. Interned codes are never removed, so a code stays
+    valid in the views handed out before a compaction.
+    """
+
+    def __init__(self, ids: list, codes: dict, routes, schedule, equipment) -> None:
+        self.ids = ids
+        self.rows = {id: row for row, id in enumerate(ids)}
+        self.codes = codes
+        self.routes = routes
+        self.schedule = schedule
+        self.equipment = equipment
+        self.live = np.ones(routes.length, dtype=bool)
+        self.dead = len(ids) - len(self.rows)
+        # A document listed twice keeps its last row, like a write would
+        for row, id in enumerate(ids):
+            if self.rows[id] != row:
+                self.live[row] = False
+
+    @classmethod
+    def build(cls, docs) -> "RouteColumns":
+        """Build the columns from rows of ROUTE_SNAPSHOT_QUERY"""
+        ids = []
+        codes = {name: Codes() for name in sorted(set(CODE_TABLES.values()))}
+        routes = Table.builders(ROUTE_COLUMNS)
+        schedule = Table.builders(SCHEDULE_COLUMNS)
+        equipment = Table.builders(EQUIPMENT_COLUMNS)
+        for doc in docs:
+            number = len(ids)
+            ids.append(doc["id"])
+            route, flights, aircraft = route_rows(doc, codes)
+            for column, value in zip(routes.values(), route):
+                column.append(value)
+            for day, flight, utc in flights:
+                schedule["route"].append(number)
+                schedule["day"].append(day)
+                schedule["flight"].append(flight)
+                schedule["utc"].append(utc)
+            for code in aircraft:
+                equipment["route"].append(number)
+                equipment["equipment"].append(code)
+        return cls(
+            ids,
+            codes,
+            Table.from_arrays(ROUTE_COLUMNS, routes),
+            Table.from_arrays(SCHEDULE_COLUMNS, schedule),
+            Table.from_arrays(EQUIPMENT_COLUMNS, equipment),
+        )
+
+    def put(self, id: str, doc: dict) -> None:
+        self.remove(id)
+        route, flights, aircraft = route_rows(doc, self.codes)
+        number = self.routes.append(route)
+        self.ids.append(id)
+        self.rows[id] = number
+        if self.live.shape[0] < self.routes.length:
+            grown = np.zeros(len(self.routes.columns["airline"]), dtype=bool)
+            grown[: self.live.shape[0]] = self.live
+            self.live = grown
+        self.live[number] = True
+        for flight in flights:
+            self.schedule.append((number, *flight))
+        for code in aircraft:
+            self.equipment.append((number, code))
+
+    def remove(self, id: str) -> None:
+        number = self.rows.pop(id, None)
+        if number is None:
+            return
+        self.live[number] = False
+        self.dead += 1
+        if self.dead >= COMPACT_MIN_DEAD and self.dead > len(self.rows):
+            self.compact()
+
+    def compact(self) -> None:
+        """Drop the rows of replaced and deleted routes and renumber the rest"""
+        live = self.live[: self.routes.length]
+        numbers = (np.cumsum(live) - 1).astype(np.int32)
+        tables = []
+        for table in (self.schedule, self.equipment):
+            routes = table.columns["route"][: table.length]
+            kept = table.take(live[routes])
+            kept.columns["route"] = numbers[kept.columns["route"]]
+            tables.append(kept)
+        self.schedule, self.equipment = tables
+        self.routes = self.routes.take(live)
+        self.ids = [id for id, kept in zip(self.ids, live) if kept]
+        self.rows = {id: row for row, id in enumerate(self.ids)}
+        self.live = np.ones(len(self.ids), dtype=bool)
+        self.dead = 0
+
+    def view(self) -> Snapshot:
+        routes = self.routes.view()
+        routes["live"] = self.live[: self.routes.length].copy()
+        # Route IDs and interned values are only ever appended to, so the lists
+        # are shared with the view rather than copied
+        return Snapshot(
+            self.ids,
+            {name: codes.values for name, codes in self.codes.items()},
+            routes,
+            self.schedule.view(),
+            self.equipment.view(),
+        )
+
+    def nbytes(self) -> int:
+        return self.live.nbytes + sum(
+            column.nbytes
+            for table in (self.routes, self.schedule, self.equipment)
+            for column in table.columns.values()
+        )
+
+
+class RouteSnapshot(BackgroundIndex):
+    """Columnar snapshot of the route collection for vectorised analytics
+
+    Routes are held in NumPy columns with interned airport, airline, aircraft
+    and flight codes, and their schedules in a flattened table with one row per
+    flight, instead of one dict per document. The snapshot is loaded from a
+    single scan in a background thread and then kept up to date by the route
+    write endpoints.
+    """
+
+    name = "route_snapshot"
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._columns = RouteColumns.build(())
+        # Writes made while a load is running, applied on top of the loaded data
+        self._pending = None
+        self._lock = threading.Lock()
+
+    def load(self, client) -> None:
+        """Read all routes and replace the snapshot with them"""
+        started = time.monotonic()
+        with self._lock:
+            self._pending = {}
+        try:
+            columns = RouteColumns.build(client.query(ROUTE_SNAPSHOT_QUERY))
+        except Exception:
+            with self._lock:
+                self._pending = None
+            raise
+        with self._lock:
+            for id, doc in self._pending.items():
+                if doc is None:
+                    columns.remove(id)
+                else:
+                    columns.put(id, doc)
+            self._pending = None
+            self._columns = columns
+            self.loaded(started)
+
+    def put_route(self, id: str, doc: dict) -> None:
+        """Add or replace a route after it was written"""
+        with self._lock:
+            if self._pending is not None:
+                self._pending[id] = doc
+            self._columns.put(id, doc)
+
+    def remove_route(self, id: str) -> None:
+        """Drop a route after it was deleted"""
+        with self._lock:
+            if self._pending is not None:
+                self._pending[id] = None
+            self._columns.remove(id)
+
+    def view(self) -> Snapshot:
+        """A consistent view of the columns, unaffected by later writes
+
+        Only the rows where `routes["live"]` is set are current routes. The
+        schedule and equipment rows refer to routes by their row number.
+        """
+        with self._lock:
+            return self._columns.view()
+
+    def nbytes(self) -> int:
+        """Memory held by the NumPy columns"""
+        with self._lock:
+            return self._columns.nbytes()
+
+    def size(self) -> int:
+        with self._lock:
+            return len(self._columns.rows)
+
+
+# Fields routes can be grouped by -> their column, or None for the equipment
+# table, where a route counts once for each of its aircraft types
+STATS_GROUPS = {
+    "airline": "airline",
+    "airlineid": "airlineid",
+    "sourceairport": "source",
+    "destinationairport": "destination",
+    "stops": "stops",
+    "equipment": None,
+}
+
+# Per-route values that can be aggregated
+STATS_METRICS = ("distance", "stops", "flights")
+
+
+def metric_values(view: Snapshot, metric: str) -> np.ndarray:
+    """The metric of every route row as float64, NaN where it is missing"""
+    routes = view.routes
+    if metric == "distance":
+        return routes["distance"]
+    if metric == "stops":
+        stops = routes["stops"].astype(np.float64)
+        stops[routes["stops"] == MISSING] = math.nan
+        return stops
+    # Flights per week
+    return np.bincount(view.schedule["route"], minlength=len(routes["live"])).astype(
+        np.float64
+    )
+
+
+def group_stats(
+    view: Snapshot, group_by: str, metric: str, percentiles, limit: int
+) -> dict:
+    """Count, sum, mean, extremes and percentiles of a metric per group of routes
+
+    The rows are sorted by group and then value, so every group is a slice with
+    its values in order and its missing (NaN) values last. The aggregates of all
+    groups are then computed at once from the slice boundaries. Percentiles are
+    interpolated linearly, like numpy.percentile. Routes without the grouped
+    field are left out. The `limit` largest groups are returned, by decreasing
+    count, with the number of routes and groups counted.
+    """
+    live = view.routes["live"]
+    column = STATS_GROUPS[group_by]
+    if column is None:
+        rows = view.equipment["route"]
+        kept = live[rows]
+        rows = rows[kept]
+        groups = view.equipment["equipment"][kept]
+        names = view.codes["equipment"]
+    else:
+        rows = np.flatnonzero(live)
+        groups = view.routes[column][rows].astype(np.int32)
+        names = view.codes[CODE_TABLES[column]] if column in CODE_TABLES else None
+    kept = groups != MISSING
+    rows = rows[kept]
+    groups = groups[kept]
+    if len(rows) == 0:
+        return {"routes": 0, "groups": 0, "stats": []}
+
+    routes = len(rows) if column is not None else np.count_nonzero(np.bincount(rows))
+    values = metric_values(view, metric)[rows]
+    # Stable sorts: by value, then by group keeping the values in order
+    order = np.argsort(values, kind="stable")
+    order = order[np.argsort(groups[order], kind="stable")]
+    groups = groups[order]
+    values = values[order]
+    starts = np.flatnonzero(np.diff(groups, prepend=MISSING))
+    codes = groups[starts]
+    counts = np.diff(starts, append=len(groups))
+    present = ~np.isnan(values)
+    valid = np.add.reduceat(present.astype(np.int64), starts)
+    sums = np.add.reduceat(np.where(present, values, 0.0), starts)
+    has_values = valid > 0
+    ends = starts + np.maximum(valid, 1) - 1
+    with np.errstate(invalid="ignore", divide="ignore"):
+        means = sums / valid
+    quantiles = {}
+    for percentile in percentiles:
+        position = starts + (np.maximum(valid, 1) - 1) * (percentile / 100)
+        low = np.floor(position).astype(np.int64)
+        high = np.ceil(position).astype(np.int64)
+        quantiles[f"{percentile:g}"] = values[low] + (values[high] - values[low]) * (
+            position - low
+        )
+
+    stats = []
+    for i in np.lexsort((codes, -counts))[:limit]:
+        if not has_values[i]:
+            summary = {"sum": 0.0, "mean": None, "min": None, "max": None}
+            summary["percentiles"] = {key: None for key in quantiles}
+        else:
+            summary = {
+                "sum": float(sums[i]),
+                "mean": float(means[i]),
+                "min": float(values[starts[i]]),
+                "max": float(values[ends[i]]),
+                "percentiles": {
+                    key: float(quantile[i]) for key, quantile in quantiles.items()
+                },
+            }
+        stats.append(
+            {
+                "group": names[codes[i]] if names is not None else int(codes[i]),
+                "count": int(counts[i]),
+                "values": int(valid[i]),
+                **summary,
+            }
+        )
+    return {"routes": routes, "groups": len(codes), "stats": stats}
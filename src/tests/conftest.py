@@ -1,5 +1,6 @@
 import pytest
 import os
+import requests
 import sys
 from couchbase.exceptions import DocumentNotFoundException
 
@@ -61,6 +62,15 @@ def hotel_api():
     return f"{BASE_URI}/hotel"
 
 
+@pytest.fixture(scope="module")
+def admin_api():
+    """The admin endpoints, skipping the test unless the app runs with ADMIN_API=true"""
+    admin_api = f"{BASE_URI}/admin"
+    if requests.get(url=f"{admin_api}/indexes").status_code == 404:
+        pytest.skip("Admin endpoints are disabled")
+    return admin_api
+
+
 class Helpers:
     @staticmethod
     def delete_existing_document(couchbase_client, collection, key):
@@ -0,0 +1,27 @@
+import pytest
+
+
+@pytest.fixture
+def create_app(monkeypatch):
+    monkeypatch.setenv("DB_CONN_STR", "couchbase://in-memory")
+    monkeypatch.setenv("DB_USERNAME", "test")
+    monkeypatch.setenv("DB_PASSWORD", "test")
+    from app import create_app
+
+    return create_app
+
+
+class TestAdminApi:
+    def test_disabled_by_default(self, create_app, monkeypatch):
+        """Test that the admin endpoints are not served unless enabled"""
+        monkeypatch.delenv("ADMIN_API", raising=False)
+        client = create_app(start=False).test_client()
+        for endpoint in ("indexes", "slow-operations", "traces", "metrics"):
+            assert client.get(f"/api/v1/admin/{endpoint}").status_code == 404
+
+    def test_enabled(self, create_app, monkeypatch):
+        """Test that ADMIN_API=true serves the admin endpoints"""
+        monkeypatch.setenv("ADMIN_API", "true")
+        client = create_app(start=False).test_client()
+        assert client.get("/api/v1/admin/indexes").status_code == 200
+        assert client.get("/api/v1/admin/traces").status_code == 200
@@ -1,6 +1,9 @@
+import json
 import requests
+from concurrent.futures import ThreadPoolExecutor
 import pytest
 from couchbase.exceptions import DocumentNotFoundException
+from src.api.pagination import encode_cursor
 
 
 class TestAirline:
@@ -97,6 +100,60 @@ class TestAirline:
 
         couchbase_client.delete_document(airline_collection, key=document_id)
 
+    def test_read_airline_concurrently(
+        self, couchbase_client, airline_api, airline_collection, helpers
+    ):
+        """Test concurrent reads of the same airline, which share one KV get"""
+        airline_data = {
+            "name": "Sample Airline",
+            "iata": "SAL",
+            "icao": "SALL",
+            "callsign": "SAM",
+            "country": "Sample Country",
+        }
+        document_id = "airline_test_read_concurrently"
+        helpers.delete_existing_document(
+            couchbase_client, airline_collection, document_id
+        )
+        couchbase_client.insert_document(
+            airline_collection, key=document_id, doc=airline_data
+        )
+
+        with ThreadPoolExecutor(max_workers=20) as executor:
+            responses = list(
+                executor.map(
+                    lambda _: requests.get(url=f"{airline_api}/{document_id}"),
+                    range(20),
+                )
+            )
+        assert all(response.status_code == 200 for response in responses)
+        assert all(response.json() == airline_data for response in responses)
+
+        couchbase_client.delete_document(airline_collection, key=document_id)
+        with ThreadPoolExecutor(max_workers=20) as executor:
+            responses = list(
+                executor.map(
+                    lambda _: requests.get(url=f"{airline_api}/{document_id}"),
+                    range(20),
+                )
+            )
+        assert all(response.status_code == 404 for response in responses)
+
+    def test_read_airline_recorded_in_metrics(self, airline_api, admin_api):
+        """Test that reading an airline is recorded in the request histogram"""
+        response = requests.get(url=f"{airline_api}/airline_10")
+        assert response.status_code == 200
+
+        # No KV get is asserted: the document cache or the read replica may
+        # answer the read without one
+        response = requests.get(url=f"{admin_api}/metrics")
+        assert response.status_code == 200
+        assert response.headers["Content-Type"].startswith("text/plain")
+        assert (
+            'http_request_duration_seconds_count{method="GET",route="/api/v1/airline/<id>",status="200"}'
+            in response.text
+        )
+
     def test_read_invalid_airline(
         self, couchbase_client, airline_api, airline_collection, helpers
     ):
@@ -210,6 +267,45 @@ class TestAirline:
         response = requests.delete(url=f"{airline_api}/{document_id}")
         assert response.status_code == 404
 
+    def test_batch_get_airlines(
+        self, couchbase_client, airline_api, airline_collection, helpers
+    ):
+        """Test fetching existing and missing airlines in one request"""
+        airline_data = {
+            "name": "Sample Airline",
+            "iata": "SAL",
+            "icao": "SALL",
+            "callsign": "SAM",
+            "country": "Sample Country",
+        }
+        document_id = "airline_test_batch_get"
+        missing_id = "airline_test_batch_get_missing"
+        helpers.delete_existing_document(
+            couchbase_client, airline_collection, document_id
+        )
+        helpers.delete_existing_document(
+            couchbase_client, airline_collection, missing_id
+        )
+        couchbase_client.insert_document(
+            airline_collection, key=document_id, doc=airline_data
+        )
+
+        response = requests.post(
+            url=f"{airline_api}/batch-get", json={"ids": [document_id, missing_id]}
+        )
+        assert response.status_code == 200
+        assert response.json() == [
+            {"id": document_id, "found": True, "document": airline_data},
+            {"id": missing_id, "found": False},
+        ]
+
+        couchbase_client.delete_document(airline_collection, key=document_id)
+
+    def test_batch_get_without_ids(self, airline_api):
+        """Test the batch get of airlines with an empty list of IDs"""
+        response = requests.post(url=f"{airline_api}/batch-get", json={"ids": []})
+        assert response.status_code == 400
+
     def test_list_airlines(self, airline_api):
         """Test listing airlines without specifying a country"""
         response = requests.get(url=f"{airline_api}/list")
@@ -246,6 +342,94 @@ class TestAirline:
                 assert data["country"] == country
         assert len(airlines_list) == page_size * iterations
 
+    def test_list_airlines_with_cursor(self, airline_api):
+        """Test that cursor pagination returns the same pages as offset pagination"""
+        country = "United Kingdom"
+        page_size = 3
+        iterations = 3
+        cursor = None
+
+        for i in range(iterations):
+            offset_response = requests.get(
+                url=f"{airline_api}/list?country={country}&limit={page_size}&offset={page_size*i}"
+            )
+            params = {"country": country, "limit": page_size}
+            if cursor:
+                params["cursor"] = cursor
+            response = requests.get(url=f"{airline_api}/list", params=params)
+            assert response.status_code == 200
+            assert response.json() == offset_response.json()
+            cursor = response.headers["X-Next-Cursor"]
+
+    def test_list_airlines_with_invalid_cursor(self, airline_api):
+        """Test listing airlines with a cursor that cannot be decoded"""
+        response = requests.get(url=f"{airline_api}/list?cursor=invalid")
+        assert response.status_code == 400
+
+    def test_list_airlines_after_unnamed_airline(self, airline_api):
+        """Test cursor pagination past airlines with a MISSING or NULL name"""
+        first_page = requests.get(url=f"{airline_api}/list?limit=5").json()
+        assert len(first_page) == 5
+        # Airlines without a name sort first, MISSING before NULL, then by ID
+        for values, expected in (([None, "", True], first_page), ([None, ""], None)):
+            response = requests.get(
+                url=f"{airline_api}/list",
+                params={"limit": 5, "cursor": encode_cursor(*values)},
+            )
+            assert response.status_code == 200
+            assert len(response.json()) == 5
+            if expected is not None:
+                assert response.json() == expected
+
+    def test_list_airlines_streamed(self, airline_api):
+        """Test that streamed list responses match the regular responses"""
+        url = f"{airline_api}/list?country=United Kingdom&limit=50"
+        expected = requests.get(url=url).json()
+
+        response = requests.get(url=f"{url}&stream=json")
+        assert response.status_code == 200
+        assert response.json() == expected
+
+        response = requests.get(url=f"{url}&stream=ndjson")
+        assert response.status_code == 200
+        assert response.headers["Content-Type"] == "application/x-ndjson"
+        assert [json.loads(line) for line in response.text.splitlines()] == expected
+
+    def test_list_airlines_reads_own_writes(
+        self, couchbase_client, airline_api, admin_api, airline_collection, helpers
+    ):
+        """Test that the list answered by READ_REPLICA reflects writes made through the API"""
+        # The query service only sees a write once its index caught up
+        indexes = requests.get(url=f"{admin_api}/indexes").json()
+        if not any(index["name"] == "replica" and index["ready"] for index in indexes):
+            pytest.skip("Read replica is not enabled")
+        country = "Sample Replica Country"
+        airline_data = {
+            "name": "Sample Airline",
+            "callsign": "SAM",
+            "country": country,
+        }
+        document_id = "airline_test_replica"
+        helpers.delete_existing_document(
+            couchbase_client, airline_collection, document_id
+        )
+        url = f"{airline_api}/list?country={country}"
+
+        response = requests.post(url=f"{airline_api}/{document_id}", json=airline_data)
+        assert response.status_code == 201
+        assert [a["id"] for a in requests.get(url=url).json()] == [document_id]
+
+        airline_data["name"] = "Updated Sample Airline"
+        response = requests.put(url=f"{airline_api}/{document_id}", json=airline_data)
+        assert response.status_code == 200
+        assert requests.get(url=url).json()[0]["name"] == "Updated Sample Airline"
+        response = requests.get(url=f"{airline_api}/{document_id}")
+        assert response.json() == airline_data
+
+        response = requests.delete(url=f"{airline_api}/{document_id}")
+        assert response.status_code == 204
+        assert requests.get(url=url).json() == []
+
     def test_list_airlines_in_invalid_country(self, airline_api):
         """Test listing airlines in an invalid country"""
         response = requests.get(url=f"{airline_api}/list?country=invalid")
@@ -278,6 +462,17 @@ class TestAirline:
             assert item["callsign"] in db_airlines
         assert response.status_code == 200
 
+    def test_to_airport_connections_ordered_by_name(self, airline_api):
+        """Test that airlines to an airport are ordered by name across pages"""
+        url = f"{airline_api}/to-airport?airport=JFK"
+        airlines = requests.get(url=f"{url}&limit=10").json()
+        names = [airline["name"] for airline in airlines]
+        assert names == sorted(names)
+
+        first_page = requests.get(url=f"{url}&limit=5&offset=0").json()
+        second_page = requests.get(url=f"{url}&limit=5&offset=5").json()
+        assert first_page + second_page == airlines
+
     def test_to_airport_connections_invalid_airport(self, airline_api):
         """Test the direct connections from an invalid airline"""
         airport = "invalid"
@@ -1,6 +1,8 @@
+import json
 import requests
 import pytest
 from couchbase.exceptions import DocumentNotFoundException
+from src.api.pagination import encode_cursor
 
 
 class TestAirport:
@@ -228,6 +230,47 @@ class TestAirport:
         response = requests.delete(url=f"{airport_api}/{document_id}")
         assert response.status_code == 404
 
+    def test_batch_get_airports(
+        self, couchbase_client, airport_api, airport_collection, helpers
+    ):
+        """Test fetching existing and missing airports in one request"""
+        airport_data = {
+            "airportname": "Test Airport",
+            "city": "Test City",
+            "country": "Test Country",
+            "faa": "TAA",
+            "icao": "TAAS",
+            "tz": "Europe/Berlin",
+            "geo": {"lat": 40, "lon": 42, "alt": 100},
+        }
+        document_id = "airport_test_batch_get"
+        missing_id = "airport_test_batch_get_missing"
+        helpers.delete_existing_document(
+            couchbase_client, airport_collection, document_id
+        )
+        helpers.delete_existing_document(
+            couchbase_client, airport_collection, missing_id
+        )
+        couchbase_client.insert_document(
+            airport_collection, key=document_id, doc=airport_data
+        )
+
+        response = requests.post(
+            url=f"{airport_api}/batch-get", json={"ids": [document_id, missing_id]}
+        )
+        assert response.status_code == 200
+        assert response.json() == [
+            {"id": document_id, "found": True, "document": airport_data},
+            {"id": missing_id, "found": False},
+        ]
+
+        couchbase_client.delete_document(airport_collection, key=document_id)
+
+    def test_batch_get_without_ids(self, airport_api):
+        """Test the batch get of airports with an empty list of IDs"""
+        response = requests.post(url=f"{airport_api}/batch-get", json={"ids": []})
+        assert response.status_code == 400
+
     def test_list_airports(self, airport_api):
         """Test listing airports without specifying a country"""
         response = requests.get(url=f"{airport_api}/list")
@@ -245,6 +288,22 @@ class TestAirport:
         for data in response_data:
             assert data["country"] == country
 
+    def test_slow_operations(self, airport_api, admin_api):
+        """Test that logged slow operations have a name, parameters and duration"""
+        response = requests.get(url=f"{airport_api}/list?country=France")
+        assert response.status_code == 200
+
+        response = requests.get(url=f"{admin_api}/slow-operations")
+        if response.status_code == 404:
+            pytest.skip("Slow operation log is disabled")
+        assert response.status_code == 200
+        for operation in response.json():
+            assert operation["operation"] in ("query", "search")
+            assert operation["name"]
+            # Queries without parameters have none in the entry
+            assert isinstance(operation.get("parameters", {}), dict)
+            assert operation["duration_ms"] >= 0
+
     def test_list_airports_in_country_with_pagination(self, airport_api):
         """Test listing airports in a country with pagination"""
         country = "France"
@@ -264,6 +323,59 @@ class TestAirport:
                 assert data["country"] == country
         assert len(airports_list) == page_size * iterations
 
+    def test_list_airports_with_cursor(self, airport_api):
+        """Test that cursor pagination returns the same pages as offset pagination"""
+        country = "France"
+        page_size = 3
+        iterations = 3
+        cursor = None
+
+        for i in range(iterations):
+            offset_response = requests.get(
+                url=f"{airport_api}/list?country={country}&limit={page_size}&offset={page_size*i}"
+            )
+            params = {"country": country, "limit": page_size}
+            if cursor:
+                params["cursor"] = cursor
+            response = requests.get(url=f"{airport_api}/list", params=params)
+            assert response.status_code == 200
+            assert response.json() == offset_response.json()
+            cursor = response.headers["X-Next-Cursor"]
+
+    def test_list_airports_after_unnamed_airport(self, airport_api):
+        """Test cursor pagination past airports with a MISSING or NULL name"""
+        first_page = requests.get(url=f"{airport_api}/list?limit=5").json()
+        assert len(first_page) == 5
+        # Airports without a name sort first, MISSING before NULL, then by ID
+        for values, expected in (([None, "", True], first_page), ([None, ""], None)):
+            response = requests.get(
+                url=f"{airport_api}/list",
+                params={"limit": 5, "cursor": encode_cursor(*values)},
+            )
+            assert response.status_code == 200
+            assert len(response.json()) == 5
+            if expected is not None:
+                assert response.json() == expected
+
+    def test_list_airports_with_invalid_cursor(self, airport_api):
+        """Test listing airports with a cursor that cannot be decoded"""
+        response = requests.get(url=f"{airport_api}/list?cursor=invalid")
+        assert response.status_code == 400
+
+    def test_list_airports_streamed(self, airport_api):
+        """Test that streamed list responses match the regular responses"""
+        url = f"{airport_api}/list?country=France&limit=50"
+        expected = requests.get(url=url).json()
+
+        response = requests.get(url=f"{url}&stream=json")
+        assert response.status_code == 200
+        assert response.json() == expected
+
+        response = requests.get(url=f"{url}&stream=ndjson")
+        assert response.status_code == 200
+        assert response.headers["Content-Type"] == "application/x-ndjson"
+        assert [json.loads(line) for line in response.text.splitlines()] == expected
+
     def test_list_airports_in_invalid_country(self, airport_api):
         """Test listing airports in an invalid country"""
         response = requests.get(url=f"{airport_api}/list?country=invalid")
@@ -301,3 +413,56 @@ class TestAirport:
         )
         assert response.status_code == 200
         assert len(response.json()) == 0
+
+    def test_nearest_airports(self, airport_api):
+        """Test finding the airports nearest to San Francisco International"""
+        response = requests.get(
+            url=f"{airport_api}/nearest",
+            params={"lat": 37.618972, "lon": -122.374889, "limit": 5},
+        )
+        if response.status_code == 503:
+            pytest.skip("Airport geo index is not loaded")
+        assert response.status_code == 200
+        airports = response.json()
+        assert len(airports) == 5
+        assert airports[0]["faa"] == "SFO"
+        assert airports[0]["distance"] < 1
+        distances = [airport["distance"] for airport in airports]
+        assert distances == sorted(distances)
+
+    def test_nearest_airports_follow_writes(
+        self, couchbase_client, airport_api, airport_collection, helpers
+    ):
+        """Test that airport writes are reflected by the nearest airport lookup"""
+        airport_data = {
+            "airportname": "Test Ocean Airport",
+            "city": "Test City",
+            "country": "Test Country",
+            "faa": "TOA",
+            "geo": {"lat": -60.5, "lon": -140.25, "alt": 0},
+        }
+        document_id = "airport_test_nearest"
+        helpers.delete_existing_document(
+            couchbase_client, airport_collection, document_id
+        )
+        url = f"{airport_api}/nearest?lat=-60.5&lon=-140.25&radius=1"
+        if requests.get(url=url).status_code == 503:
+            pytest.skip("Airport geo index is not loaded")
+
+        response = requests.post(url=f"{airport_api}/{document_id}", json=airport_data)
+        assert response.status_code == 201
+        airports = requests.get(url=url).json()
+        assert [airport["id"] for airport in airports] == [document_id]
+
+        response = requests.delete(url=f"{airport_api}/{document_id}")
+        assert response.status_code == 204
+        assert requests.get(url=url).json() == []
+
+    def test_nearest_airports_invalid_point(self, airport_api):
+        """Test the nearest airport lookup without a valid point"""
+        response = requests.get(url=f"{airport_api}/nearest", params={"lat": 10})
+        assert response.status_code == 400
+        response = requests.get(
+            url=f"{airport_api}/nearest", params={"lat": 95, "lon": 10}
+        )
+        assert response.status_code == 400
@@ -0,0 +1,267 @@
+import asyncio
+import json
+import pytest
+from benchmarks import dataset as synthetic
+from benchmarks.backend import InMemoryScope
+
+AIRLINE_PATH = "/api/v1/airline"
+
+
+class AsyncCollection(object):
+    """Awaitable KV operations over an in-memory collection, like acouchbase's"""
+
+    def __init__(self, collection) -> None:
+        self.collection = collection
+
+    def __getattr__(self, name):
+        operation = getattr(self.collection, name)
+
+        async def call(*args):
+            return operation(*args)
+
+        return call
+
+
+class AsyncResult(object):
+    """Rows of an in-memory query or search, iterated like acouchbase's"""
+
+    def __init__(self, result) -> None:
+        self.result = result
+
+    async def rows(self):
+        for row in self.result.rows():
+            yield row
+
+
+class AsyncScope(object):
+    def __init__(self, scope) -> None:
+        self.scope = scope
+
+    def collection(self, name: str) -> AsyncCollection:
+        return AsyncCollection(self.scope.collection(name))
+
+    def query(self, *args, **kwargs) -> AsyncResult:
+        return AsyncResult(self.scope.query(*args, **kwargs))
+
+    def search(self, *args, **kwargs) -> AsyncResult:
+        return AsyncResult(self.scope.search(*args, **kwargs))
+
+
+@pytest.fixture(scope="module")
+def apps():
+    """The Flask and ASGI apps, both served from one in-memory scope"""
+    import extensions
+
+    with pytest.MonkeyPatch.context() as patch:
+        patch.setenv("DB_CONN_STR", "couchbase://in-memory")
+        patch.setenv("DB_USERNAME", "test")
+        patch.setenv("DB_PASSWORD", "test")
+        from app import create_app
+        import asgi
+
+        flask_app = create_app(start=False)
+
+    data = synthetic.generate(airlines=5, airports=5, routes=5, hotels=5)
+    scope = InMemoryScope(extensions.couchbase_db, data)
+    saved = (
+        extensions.couchbase_db.scope,
+        extensions.couchbase_db.cluster,
+        extensions.async_couchbase_db.scope,
+    )
+    extensions.couchbase_db.scope = scope
+    extensions.couchbase_db.cluster = scope
+    extensions.async_couchbase_db.scope = AsyncScope(scope)
+    # Set by init_app, which would connect to a cluster
+    extensions.couchbase_db.index_name = "hotel_search"
+    extensions.async_couchbase_db.index_name = "hotel_search"
+    yield flask_app.test_client(), asgi.app, data
+    (
+        extensions.couchbase_db.scope,
+        extensions.couchbase_db.cluster,
+        extensions.async_couchbase_db.scope,
+    ) = saved
+
+
+def asgi_request(app, method: str, path: str, body=None):
+    """Send one HTTP request to an ASGI app, returning its status and JSON body"""
+    path, _, query = path.partition("?")
+    scope = {
+        "type": "http",
+        "method": method,
+        "path": path,
+        "query_string": query.encode("latin-1"),
+    }
+    messages = []
+
+    async def receive():
+        return {
+            "type": "http.request",
+            "body": b"" if body is None else json.dumps(body).encode("utf-8"),
+            "more_body": False,
+        }
+
+    async def send(message):
+        messages.append(message)
+
+    asyncio.run(app(scope, receive, send))
+    start, response = messages
+    return start["status"], json.loads(response["body"] or b"null")
+
+
+def flask_request(client, method: str, path: str, body=None):
+    response = client.open(path, method=method, json=body)
+    return response.status_code, response.get_json(silent=True)
+
+
+class TestAsgi:
+    def test_read_airline(self, apps):
+        """Test that both apps return the same airline"""
+        flask_client, asgi_app, _ = apps
+        path = f"{AIRLINE_PATH}/airline_10"
+        status, body = asgi_request(asgi_app, "GET", path)
+        assert status == 200
+        assert body["name"]
+        assert (status, body) == flask_request(flask_client, "GET", path)
+
+    def test_read_invalid_airline(self, apps):
+        """Test that both apps answer a missing airline alike"""
+        flask_client, asgi_app, _ = apps
+        path = f"{AIRLINE_PATH}/airline_asgi_invalid"
+        status, body = asgi_request(asgi_app, "GET", path)
+        assert status == 404
+        assert (status, body) == flask_request(flask_client, "GET", path)
+
+    def test_add_airline_without_required_fields(self, apps):
+        """Test that both apps reject an invalid airline with the same errors"""
+        flask_client, asgi_app, _ = apps
+        path = f"{AIRLINE_PATH}/airline_asgi_invalid_payload"
+        airline_data = {"iata": "SAL", "icao": "SALL", "country": "Sample Country"}
+        status, body = asgi_request(asgi_app, "POST", path, airline_data)
+        assert status == 400
+        assert body["message"] == "Input payload validation failed"
+        assert body["errors"]["name"] == "'name' is a required property"
+        assert (status, body) == flask_request(flask_client, "POST", path, airline_data)
+
+    def test_unknown_path(self, apps):
+        """Test that both apps answer 404 for a path without a route"""
+        flask_client, asgi_app, _ = apps
+        status, _ = asgi_request(asgi_app, "GET", "/api/v1/unknown")
+        assert status == 404
+        assert flask_client.get("/api/v1/unknown").status_code == 404
+
+
+# A request for every route the ASGI app serves; path parameters are filled
+# in from the dataset
+READS = {
+    ("GET", "/api/v1/airport/list"): ["?limit=3", "?country={airport[country]}"],
+    ("GET", "/api/v1/airline/list"): ["?limit=3", "?country={airline[country]}"],
+    ("GET", "/api/v1/airport/direct-connections"): ["?airport={airport[faa]}"],
+    ("GET", "/api/v1/airline/to-airport"): ["?airport={airport[faa]}"],
+    ("GET", "/api/v1/hotel/autocomplete"): ["?name={hotel[name]}"],
+    ("GET", "/api/v1/airport/{id}"): ["airport_1000", "airport_invalid"],
+    ("GET", "/api/v1/airline/{id}"): ["airline_10", "airline_invalid"],
+    ("GET", "/api/v1/route/{id}"): ["route_10000", "route_invalid"],
+}
+WRITES = ["POST", "PUT", "DELETE"]
+DOCUMENTS = {
+    "/api/v1/airport/{id}": "airport_1000",
+    "/api/v1/airline/{id}": "airline_10",
+    "/api/v1/route/{id}": "route_10000",
+}
+
+
+def fill(template: str, value: str, data: dict) -> str:
+    if "{id}" in template:
+        return template.replace("{id}", value)
+    return template + value.format(
+        airport=data["airport"]["airport_1000"],
+        airline=data["airline"]["airline_10"],
+        hotel=data["hotel"]["hotel_20000"],
+    )
+
+
+class TestAsgiParity:
+    def test_routes_covered(self, apps):
+        """Test that every ASGI route is served by Flask and has a parity test"""
+        flask_client, _, _ = apps
+        import asgi
+
+        flask_routes = {
+            (method, rule.rule.replace("<id>", "{id}"))
+            for rule in flask_client.application.url_map.iter_rules()
+            for method in rule.methods
+        }
+        covered = set(READS) | {("POST", "/api/v1/hotel/filter")}
+        covered |= {(method, template) for method in WRITES for template in DOCUMENTS}
+        asgi_routes = {
+            (method, template) for method, template, _, _ in asgi.router.routes
+        }
+        assert asgi_routes <= flask_routes
+        assert asgi_routes == covered
+
+    @pytest.mark.parametrize(
+        "route,value",
+        [(route, value) for route, values in READS.items() for value in values],
+    )
+    def test_read(self, apps, route, value):
+        """Test that both apps answer a read alike"""
+        flask_client, asgi_app, data = apps
+        method, template = route
+        path = fill(template, value, data)
+        status, body = asgi_request(asgi_app, method, path)
+        assert (status, body) == flask_request(flask_client, method, path)
+
+    def test_hotel_filter(self, apps):
+        """Test that both apps answer a hotel filter alike"""
+        flask_client, asgi_app, data = apps
+        path = "/api/v1/hotel/filter?limit=3"
+        body = {"country": data["hotel"]["hotel_20000"]["country"]}
+        status, hotels = asgi_request(asgi_app, "POST", path, body)
+        assert status == 200
+        assert hotels
+        assert (status, hotels) == flask_request(flask_client, "POST", path, body)
+
+    @pytest.mark.parametrize("template", list(DOCUMENTS))
+    def test_writes(self, apps, template):
+        """Test that both apps answer the same writes alike"""
+        flask_client, asgi_app, data = apps
+        collection = template.split("/")[3]
+        document = dict(data[collection][DOCUMENTS[template]])
+        responses = []
+        for request, app in [(asgi_request, asgi_app), (flask_request, flask_client)]:
+            path = template.replace("{id}", f"{collection}_parity")
+            responses.append(
+                [
+                    request(app, "POST", path, document),
+                    request(app, "POST", path, document),
+                    request(app, "PUT", path, dict(document, country="Parity")),
+                    request(app, "GET", path),
+                    request(app, "DELETE", path),
+                    request(app, "DELETE", path),
+                ]
+            )
+        assert [status for status, _ in responses[0]] == [201, 409, 200, 200, 204, 404]
+        assert responses[0] == responses[1]
+
+
+def test_lifespan_startup_failed(apps, monkeypatch):
+    """Test that a failed connection fails the ASGI startup instead of exiting"""
+    import asgi
+    from couchbase.exceptions import ScopeNotFoundException
+
+    async def connect():
+        raise ScopeNotFoundException(message="Inventory scope does not exist")
+
+    monkeypatch.setattr(asgi.async_couchbase_db, "connect", connect)
+    monkeypatch.setattr(asgi.async_couchbase_db, "init_app", lambda *args: None)
+    messages = []
+
+    async def receive():
+        return {"type": "lifespan.startup"}
+
+    async def send(message):
+        messages.append(message)
+
+    asyncio.run(asgi.app({"type": "lifespan"}, receive, send))
+    assert [message["type"] for message in messages] == ["lifespan.startup.failed"]
+    assert "Inventory scope" in messages[0]["message"]
@@ -0,0 +1,73 @@
+import time
+import pytest
+from benchmarks import dataset as synthetic
+from benchmarks.backend import InMemoryCouchbaseClient
+
+
+@pytest.fixture
+def cached_client():
+    """A client over an in-memory scope, caching airlines for 60s and routes briefly"""
+    data = synthetic.generate(airlines=5, airports=5, routes=5, hotels=5)
+    client = InMemoryCouchbaseClient(data)
+    client.connect()
+    client.enable_cache(max_size=100, default_ttl=60, ttls={"route": 0.05})
+    return client
+
+
+class TestCache:
+    def test_cache_hit(self, cached_client):
+        """Test that a second get of a document is served from the cache"""
+        first = cached_client.get_document("airline", "airline_10")
+        second = cached_client.get_document("airline", "airline_10")
+        assert first.content_as[dict] == second.content_as[dict]
+        stats = cached_client.cache_stats()
+        assert stats["reads"] == 1
+        assert stats["hits"] == 1
+        assert stats["misses"] == 1
+
+    def test_cache_hit_in_batch_get(self, cached_client):
+        """Test that a batch get reads only the documents not cached yet"""
+        cached_client.get_document("airline", "airline_10")
+        documents = cached_client.get_documents("airline", ["airline_10", "airline_11"])
+        assert set(documents) == {"airline_10", "airline_11"}
+        assert cached_client.cache_stats()["hits"] == 1
+        cached_client.get_documents("airline", ["airline_10", "airline_11"])
+        assert cached_client.cache_stats()["hits"] == 3
+
+    def test_cache_ttl_expiry(self, cached_client):
+        """Test that a document is read again once its collection's TTL expired"""
+        cached_client.get_document("route", "route_10000")
+        time.sleep(0.1)
+        cached_client.get_document("route", "route_10000")
+        stats = cached_client.cache_stats()
+        assert stats["reads"] == 2
+        assert stats["hits"] == 0
+        assert stats["expirations"] == 1
+
+    def test_cache_invalidated_on_write(self, cached_client):
+        """Test that writes through the client drop the cached document"""
+        airline = cached_client.get_document("airline", "airline_10").content_as[dict]
+        cached_client.upsert_document("airline", "airline_10", dict(airline, name="A"))
+        result = cached_client.get_document("airline", "airline_10")
+        assert result.content_as[dict]["name"] == "A"
+        assert cached_client.cache_stats()["invalidations"] == 1
+
+        cached_client.upsert_documents(
+            "airline", {"airline_10": dict(airline, name="B")}
+        )
+        documents = cached_client.get_documents("airline", ["airline_10"])
+        assert documents["airline_10"].content_as[dict]["name"] == "B"
+
+        cached_client.delete_document("airline", "airline_10")
+        documents = cached_client.get_documents("airline", ["airline_10"])
+        assert isinstance(documents["airline_10"], Exception)
+
+    def test_cached_document_not_shared(self, cached_client):
+        """Test that changing a returned document does not change the cached one"""
+        airport = cached_client.get_document("airport", "airport_1000").content_as[dict]
+        airport["geo"]["lat"] = 91
+        airport["city"] = "Changed"
+        cached = cached_client.get_document("airport", "airport_1000")
+        assert cached.content_as[dict]["geo"]["lat"] != 91
+        assert cached.content_as[dict]["city"] != "Changed"
+        assert cached_client.cache_stats()["hits"] == 1
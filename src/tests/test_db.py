@@ -0,0 +1,194 @@
+import copy
+import json
+import pytest
+from couchbase.exceptions import CouchbaseException, SearchIndexNotFoundException
+from couchbase.management.search import SearchIndex
+from benchmarks import dataset as synthetic
+from benchmarks.backend import InMemoryCouchbaseClient
+from api.airline import AIRLINE_LIST_QUERY
+
+
+@pytest.fixture
+def client():
+    """A client over an in-memory scope, recording the options of each query"""
+    data = synthetic.generate(airlines=5, airports=5, routes=5, hotels=5)
+    client = InMemoryCouchbaseClient(data)
+    client.init_app("couchbase://in-memory", "test", "test", None)
+    client.register_statement("airline_list", AIRLINE_LIST_QUERY)
+    client.queries = []
+    query = client.scope.query
+
+    def recorded(sql, *options, **params):
+        client.queries.append(options)
+        return query(sql, *options, **params)
+
+    client.scope.query = recorded
+    return client
+
+
+class SearchIndexManager(object):
+    """The get/upsert calls of a scope search index manager, over a dict"""
+
+    def __init__(self) -> None:
+        self.indexes = {}
+        self.upserts = []
+
+    def get_index(self, name: str) -> SearchIndex:
+        if name not in self.indexes:
+            raise SearchIndexNotFoundException(message=f"Index {name} not found")
+        return self.indexes[name]
+
+    def upsert_index(self, index: SearchIndex) -> None:
+        # Like the search service, only update an index given its current uuid
+        existing = self.indexes.get(index.name)
+        if existing is not None and index.uuid != existing.uuid:
+            raise CouchbaseException(message="Index exists, but the uuid differs")
+        self.upserts.append(index)
+        self.indexes[index.name] = index
+
+
+@pytest.fixture
+def search_indexes(client):
+    """A search index manager for the client's scope"""
+    manager = SearchIndexManager()
+
+    class Bucket(object):
+        def scope(self, name):
+            class Scope(object):
+                def search_indexes(self):
+                    return manager
+
+            return Scope()
+
+    client.bucket = Bucket()
+    return manager
+
+
+def local_index() -> SearchIndex:
+    with open("hotel_search_index.json", "r") as f:
+        return SearchIndex.from_json(json.load(f))
+
+
+class TestStatements:
+    def test_prepared_statement(self, client):
+        """Test that registered statements run with adhoc=False when prepared"""
+        client.enable_prepared_statements()
+        for _ in range(2):
+            rows = list(
+                client.query_statement("airline_list", country="", limit=3, offset=0)
+            )
+            assert len(rows) == 3
+        assert [
+            [option.get("adhoc") for option in options] for options in client.queries
+        ] == [[False], [False]]
+        assert client.statement_stats() == [
+            {"name": "airline_list", "prepared": True, "executions": 2, "errors": 0}
+        ]
+
+    def test_adhoc_statement(self, client):
+        """Test that registered statements run ad hoc by default"""
+        list(client.query_statement("airline_list", country="", limit=3, offset=0))
+        assert client.queries == [()]
+        assert client.statement_stats()[0]["prepared"] is False
+
+    def test_failed_statement_not_retried(self, client):
+        """Test that a failed statement is run once and counted as an error"""
+        client.enable_prepared_statements()
+        query = client.scope.query
+
+        def failing(sql, *options, **params):
+            query(sql, *options, **params)
+            raise CouchbaseException(message="Prepared statement not found")
+
+        client.scope.query = failing
+        with pytest.raises(CouchbaseException):
+            list(client.query_statement("airline_list", country="", limit=3, offset=0))
+        assert len(client.queries) == 1
+        assert client.statement_stats()[0]["executions"] == 1
+        assert client.statement_stats()[0]["errors"] == 1
+
+
+class TestFilter:
+    @pytest.mark.parametrize("cache_size", [0, 10])
+    def test_filter_search_error(self, client, cache_size):
+        """Test that a failed filter search returns no hotels, with or without cache"""
+        if cache_size:
+            client.enable_filter_cache(max_size=cache_size, ttl=60)
+
+        def failing(*args):
+            raise CouchbaseException(message="Search failed")
+
+        client._search_filter = failing
+        assert client.filter({"country": "France"}, limit=5, offset=0) == []
+
+    def test_filter_cached(self, client):
+        """Test that a repeated filter search is answered from the cache"""
+        client.enable_filter_cache(max_size=10, ttl=60)
+        filter = {"country": client.dataset["hotel"]["hotel_20000"]["country"]}
+        hotels = client.filter(filter, limit=5, offset=0)
+        assert hotels
+        assert client.filter(filter, limit=5, offset=0) == hotels
+        stats = client.filter_cache_stats()
+        assert stats["searches"] == 1
+        assert stats["hits"] == 1
+
+
+class TestSearchIndex:
+    def test_search_index_created(self, client, search_indexes):
+        """Test that a missing index is upserted"""
+        client.create_search_index()
+        assert [index.name for index in search_indexes.upserts] == ["hotel_search"]
+
+    def test_search_index_up_to_date(self, client, search_indexes):
+        """Test that an index already on the cluster is not upserted again"""
+        existing = local_index()
+        existing.uuid = "1234"
+        # The search service adds defaults the local definition leaves out
+        existing.params["store"] = {"indexType": "scorch"}
+        search_indexes.indexes["hotel_search"] = existing
+        client.create_search_index()
+        assert search_indexes.upserts == []
+
+        client.create_search_index(force=True)
+        assert len(search_indexes.upserts) == 1
+
+    def test_search_index_changed(self, client, search_indexes):
+        """Test that an index whose definition differs on the cluster is upserted"""
+        existing = local_index()
+        existing.uuid = "1234"
+        existing.params = copy.deepcopy(existing.params)
+        existing.params["mapping"]["types"] = {}
+        search_indexes.indexes["hotel_search"] = existing
+        client.create_search_index()
+        assert len(search_indexes.upserts) == 1
+        assert search_indexes.upserts[0].uuid == "1234"
+        assert search_indexes.upserts[0].params == local_index().params
+
+
+class TestSlowLog:
+    def test_slow_operations(self, client):
+        """Test that queries and searches over the threshold are logged, newest first"""
+        client.enable_slow_log(threshold=0, max_size=10)
+        list(client.query_statement("airline_list", country="", limit=3, offset=0))
+        client.filter({"country": "France"}, limit=5, offset=0)
+        operations = client.slow_operations()
+        assert [operation["operation"] for operation in operations] == [
+            "search",
+            "query",
+        ]
+        assert operations[1]["name"] == "airline_list"
+        assert operations[1]["parameters"]["limit"] == 3
+        assert operations[1]["result_count"] == 3
+        assert all(operation["duration_ms"] >= 0 for operation in operations)
+
+    def test_slow_log_threshold(self, client):
+        """Test that operations faster than the threshold are not logged"""
+        client.enable_slow_log(threshold=60, max_size=10)
+        list(client.query_statement("airline_list", country="", limit=3, offset=0))
+        assert client.slow_operations() == []
+
+    def test_slow_log_disabled(self, client):
+        """Test that nothing is logged while the log is disabled"""
+        list(client.query_statement("airline_list", country="", limit=3, offset=0))
+        assert client.slow_log is None
+        assert client.slow_operations() == []
@@ -14,6 +14,19 @@ class TestHotel:
         assert len(result) > 0
         assert all(search_term.lower() in hotel["name"].lower() for hotel in result)
 
+    def test_hotel_autocomplete_prefix_ranking(self, hotel_api):
+        """Test that names starting with the search term are ranked first."""
+        url = f"{hotel_api}/autocomplete"
+        search_term = "sea"
+
+        response = requests.get(url, params={"name": search_term})
+        assert response.status_code == 200
+
+        starts = [
+            hotel["name"].lower().startswith(search_term) for hotel in response.json()
+        ]
+        assert starts == sorted(starts, reverse=True)
+
     def test_hotel_autocomplete_search_no_results(self, hotel_api):
         """Test searching hotels by name with a term that should yield no results."""
         url = f"{hotel_api}/autocomplete"
@@ -46,6 +59,40 @@ class TestHotel:
         result = response.json()
         assert len(result) == 0
 
+    def test_hotel_filter_repeated(self, hotel_api):
+        """Test that repeated filters with reordered fields return the same hotels."""
+        url = f"{hotel_api}/filter"
+
+        first = requests.post(
+            url, json={"country": "United States", "city": "Santa Margarita"}
+        )
+        second = requests.post(
+            url, json={"city": "Santa Margarita", "country": "United States"}
+        )
+        assert first.status_code == 200
+        assert second.status_code == 200
+        assert first.json() == second.json()
+
+    def test_hotel_filter_traced(self, hotel_api, admin_api):
+        """Test that a sampled traceparent is propagated and the request is traced."""
+        trace_id = "4bf92f3577b34da6a3ce929d0e0e4736"
+        response = requests.post(
+            f"{hotel_api}/filter",
+            json={"city": "Santa Margarita"},
+            headers={"traceparent": f"00-{trace_id}-00f067aa0ba902b7-01"},
+        )
+        assert response.status_code == 200
+        assert response.headers["traceparent"].startswith(f"00-{trace_id}-")
+        assert response.headers["traceparent"].endswith("-01")
+
+        traces = requests.get(f"{admin_api}/traces").json()
+        spans = next(
+            trace["spans"] for trace in traces if trace["trace_id"] == trace_id
+        )
+        assert spans[0]["name"] == "POST /api/v1/hotel/filter"
+        assert spans[0]["parent_id"] == "00f067aa0ba902b7"
+        assert {"validate", "serialize"} <= {span["name"] for span in spans}
+
     def test_hotel_all_filter(self, hotel_api):
         """Test filtering hotels with specific filters."""
         url = f"{hotel_api}/filter"
@@ -120,3 +167,34 @@ class TestHotel:
                 all_hotels.add(hotel["name"])
 
         assert len(all_hotels) >= page_size * iterations
+
+    def test_hotels_near_airport(self, hotel_api):
+        """Test finding hotels near San Francisco International, nearest first"""
+        response = requests.get(
+            url=f"{hotel_api}/near",
+            params={"airport": "airport_3469", "radius": 30, "limit": 5},
+        )
+        assert response.status_code == 200
+        hotels = response.json()
+        assert 0 < len(hotels) <= 5
+        distances = [hotel["distance"] for hotel in hotels]
+        assert distances == sorted(distances)
+        assert all(distance <= 30 for distance in distances)
+
+        # Searching around the airport's coordinates finds the same hotels
+        response = requests.get(
+            url=f"{hotel_api}/near",
+            params={"lat": 37.618972, "lon": -122.374889, "radius": 30, "limit": 5},
+        )
+        assert [hotel["id"] for hotel in response.json()] == [
+            hotel["id"] for hotel in hotels
+        ]
+
+    def test_hotels_near_invalid_parameters(self, hotel_api):
+        """Test the hotel geo search without a point or with an unknown airport"""
+        response = requests.get(url=f"{hotel_api}/near")
+        assert response.status_code == 400
+        response = requests.get(
+            url=f"{hotel_api}/near", params={"airport": "airport_invalid"}
+        )
+        assert response.status_code == 404
@@ -0,0 +1,74 @@
+import pytest
+from couchbase.exceptions import CouchbaseException
+from benchmarks import dataset as synthetic
+from benchmarks.backend import InMemoryCouchbaseClient
+from read_replica import REPLICA_CAS_INDEX, REPLICA_COLLECTIONS, ReadReplica
+
+SOURCE = "couchbase://in-memory/travel-sample.inventory"
+
+
+@pytest.fixture
+def client():
+    data = synthetic.generate(airlines=5, airports=5, routes=5, hotels=5)
+    client = InMemoryCouchbaseClient(data)
+    client.connect()
+    return client
+
+
+@pytest.fixture
+def path(tmp_path, client):
+    """A replica file left by an earlier run"""
+    path = str(tmp_path / "replica.sqlite3")
+    replica = ReadReplica()
+    replica.open(path, source=SOURCE)
+    replica.load(client)
+    return path
+
+
+class TestReadReplica:
+    def test_reopened_replica_ready_after_refresh(self, client, path):
+        """Test that a copy left by an earlier run is used only once it caught up"""
+        client.upsert_document("airline", "airline_10", {"name": "Updated"})
+        replica = ReadReplica()
+        replica.open(path, source=SOURCE)
+        assert not replica.ready
+        assert not replica.serves("airline")
+
+        replica.load(client)
+        assert replica.ready
+        document = replica.get("airline", "airline_10")
+        assert document.content_as[dict] == {"name": "Updated"}
+
+    def test_reopened_replica_not_ready_after_failed_refresh(self, client, path):
+        """Test that a copy stays unused while its refresh fails"""
+
+        def failing(*args, **kwargs):
+            raise CouchbaseException(message="Query failed")
+
+        client.query = failing
+        replica = ReadReplica()
+        replica.open(path, source=SOURCE)
+        with pytest.raises(CouchbaseException):
+            replica.load(client)
+        assert not replica.ready
+
+    def test_first_load_creates_cas_indexes(self, client, tmp_path):
+        """Test that the CAS indexes are created once, before the first refresh"""
+        statements = []
+        query = client.query
+
+        def recording(sql, *args, **kwargs):
+            statements.append(sql)
+            return query(sql, *args, **kwargs)
+
+        client.query = recording
+        replica = ReadReplica()
+        replica.open(
+            str(tmp_path / "replica.sqlite3"), source=SOURCE, create_indexes=True
+        )
+        replica.load(client)
+        replica.load(client)
+        indexes = [REPLICA_CAS_INDEX.format(collection=c) for c in REPLICA_COLLECTIONS]
+        assert statements[: len(indexes)] == indexes
+        assert sum(sql in indexes for sql in statements) == len(indexes)
+        assert replica.ready
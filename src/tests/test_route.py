@@ -1,3 +1,4 @@
+import json
 import requests
 import pytest
 from couchbase.exceptions import DocumentNotFoundException
@@ -226,3 +227,241 @@ class Testroute:
             couchbase_client.get_document(route_collection, key=document_id)
         response = requests.delete(url=f"{route_api}/{document_id}")
         assert response.status_code == 404
+
+    def test_route_writes_update_direct_connections(
+        self,
+        couchbase_client,
+        route_api,
+        route_collection,
+        airport_api,
+        admin_api,
+        helpers,
+    ):
+        """Test that route writes are reflected by the in-memory route index"""
+        indexes = requests.get(url=f"{admin_api}/indexes").json()
+        if not any(index["name"] == "route" and index["ready"] for index in indexes):
+            pytest.skip("Route index is not loaded")
+
+        route_data = {
+            "airline": "SAF",
+            "airlineid": "airline_sample",
+            "sourceairport": "SFO",
+            "destinationairport": "ZZQ",
+            "stops": 0,
+            "equipment": "CRJ",
+            "schedule": [{"day": 0, "flight": "SAF123", "utc": "14:05:00"}],
+            "distance": 1000.79,
+        }
+        document_id = "route_test_index"
+        helpers.delete_existing_document(
+            couchbase_client, route_collection, document_id
+        )
+        url = f"{airport_api}/direct-connections?airport=SFO&limit=1000"
+
+        response = requests.post(url=f"{route_api}/{document_id}", json=route_data)
+        assert response.status_code == 201
+        assert {"destinationairport": "ZZQ"} in requests.get(url=url).json()
+
+        response = requests.delete(url=f"{route_api}/{document_id}")
+        assert response.status_code == 204
+        assert {"destinationairport": "ZZQ"} not in requests.get(url=url).json()
+
+    def test_route_writes_update_route_snapshot(
+        self, couchbase_client, route_api, route_collection, admin_api, helpers
+    ):
+        """Test that route writes are applied to the columnar route snapshot"""
+
+        def snapshot():
+            indexes = requests.get(url=f"{admin_api}/indexes").json()
+            return next(
+                (index for index in indexes if index["name"] == "route_snapshot"),
+                None,
+            )
+
+        if snapshot() is None or not snapshot()["ready"]:
+            pytest.skip("Route snapshot is not loaded")
+
+        route_data = {
+            "airline": "SAF",
+            "airlineid": "airline_sample",
+            "sourceairport": "SFO",
+            "destinationairport": "JFK",
+            "stops": 0,
+            "equipment": "CRJ 320",
+            "schedule": [{"day": 0, "flight": "SAF123", "utc": "14:05:00"}],
+            "distance": 4152.3,
+        }
+        document_id = "route_test_snapshot"
+        helpers.delete_existing_document(
+            couchbase_client, route_collection, document_id
+        )
+        entries = snapshot()["entries"]
+
+        response = requests.post(url=f"{route_api}/{document_id}", json=route_data)
+        assert response.status_code == 201
+        assert snapshot()["entries"] == entries + 1
+
+        response = requests.put(url=f"{route_api}/{document_id}", json=route_data)
+        assert response.status_code == 200
+        assert snapshot()["entries"] == entries + 1
+
+        response = requests.delete(url=f"{route_api}/{document_id}")
+        assert response.status_code == 204
+        assert snapshot()["entries"] == entries
+
+    def test_route_stats(self, route_api):
+        """Test aggregating route distances per airline"""
+        response = requests.get(
+            url=f"{route_api}/stats",
+            params={
+                "group_by": "airline",
+                "metric": "distance",
+                "percentiles": "50,90",
+                "limit": 5,
+            },
+        )
+        if response.status_code == 503:
+            pytest.skip("Route snapshot is not loaded")
+        assert response.status_code == 200
+        result = response.json()
+        assert result["group_by"] == "airline"
+        assert result["metric"] == "distance"
+        assert len(result["stats"]) == 5
+        counts = [group["count"] for group in result["stats"]]
+        assert counts == sorted(counts, reverse=True)
+        assert sum(counts) <= result["routes"]
+        for group in result["stats"]:
+            assert group["min"] <= group["percentiles"]["50"] <= group["max"]
+            assert group["percentiles"]["50"] <= group["percentiles"]["90"]
+            assert group["mean"] == pytest.approx(group["sum"] / group["values"])
+
+    def test_route_stats_invalid_parameters(self, route_api):
+        """Test route statistics with an unknown group or metric"""
+        response = requests.get(url=f"{route_api}/stats", params={"group_by": "x"})
+        assert response.status_code == 400
+        response = requests.get(url=f"{route_api}/stats", params={"metric": "x"})
+        assert response.status_code == 400
+
+    def test_route_path(self, route_api, admin_api):
+        """Test finding itineraries with connections between two airports"""
+        indexes = requests.get(url=f"{admin_api}/indexes").json()
+        if not any(index["name"] == "route" and index["ready"] for index in indexes):
+            pytest.skip("Route index is not loaded")
+
+        response = requests.get(
+            url=f"{route_api}/path?from=SFO&to=LHR&max_stops=1&limit=5"
+        )
+        assert response.status_code == 200
+        itineraries = response.json()
+        assert len(itineraries) > 0
+        distances = [itinerary["distance"] for itinerary in itineraries]
+        assert distances == sorted(distances)
+        for itinerary in itineraries:
+            legs = itinerary["legs"]
+            assert itinerary["stops"] == len(legs) - 1 <= 1
+            assert legs[0]["sourceairport"] == "SFO"
+            assert legs[-1]["destinationairport"] == "LHR"
+            for leg, next_leg in zip(legs, legs[1:]):
+                assert leg["destinationairport"] == next_leg["sourceairport"]
+            assert all(leg["routes"] for leg in legs)
+
+    def test_route_path_without_destination(self, route_api):
+        """Test finding itineraries without a destination airport"""
+        response = requests.get(url=f"{route_api}/path?from=SFO")
+        assert response.status_code == 400
+
+    def test_route_path_invalid_parameters(self, route_api):
+        """Test finding itineraries with non-integer or out of range parameters"""
+        for params in ["max_stops=x", "limit=x", "max_stops=9", "limit=0"]:
+            response = requests.get(url=f"{route_api}/path?from=SFO&to=LHR&{params}")
+            assert response.status_code == 400
+
+    def test_batch_get_routes(
+        self, couchbase_client, route_api, route_collection, helpers
+    ):
+        """Test fetching existing and missing routes in one request"""
+        route_data = {
+            "airline": "SAF",
+            "airlineid": "airline_sample",
+            "sourceairport": "SFO",
+            "destinationairport": "JFK",
+            "stops": 0,
+            "equipment": "CRJ",
+            "schedule": [{"day": 0, "flight": "SAF123", "utc": "14:05:00"}],
+            "distance": 1000.79,
+        }
+        document_id = "route_test_batch_get"
+        missing_id = "route_test_batch_get_missing"
+        helpers.delete_existing_document(
+            couchbase_client, route_collection, document_id
+        )
+        helpers.delete_existing_document(couchbase_client, route_collection, missing_id)
+        couchbase_client.insert_document(
+            route_collection, key=document_id, doc=route_data
+        )
+
+        response = requests.post(
+            url=f"{route_api}/batch-get", json={"ids": [document_id, missing_id]}
+        )
+        assert response.status_code == 200
+        assert response.json() == [
+            {"id": document_id, "found": True, "document": route_data},
+            {"id": missing_id, "found": False},
+        ]
+
+        couchbase_client.delete_document(route_collection, key=document_id)
+
+    def test_batch_get_without_ids(self, route_api):
+        """Test the batch get of routes with an empty list of IDs"""
+        response = requests.post(url=f"{route_api}/batch-get", json={"ids": []})
+        assert response.status_code == 400
+
+    def test_bulk_ingest_routes(self, couchbase_client, route_api, route_collection):
+        """Test loading routes from an NDJSON body with per-record errors"""
+        route_data = {
+            "airline": "SAF",
+            "airlineid": "airline_sample",
+            "sourceairport": "SFO",
+            "destinationairport": "JFK",
+            "stops": 0,
+            "equipment": "CRJ",
+            "schedule": [{"day": 0, "flight": "SAF123", "utc": "14:05:00"}],
+            "distance": 1000.79,
+        }
+        document_ids = [f"route_test_bulk_{i}" for i in range(3)]
+        records = [
+            json.dumps({"id": document_id, "document": route_data})
+            for document_id in document_ids
+        ]
+        records.append(json.dumps({"id": "route_test_bulk_invalid", "document": {}}))
+        records.append("not json")
+
+        response = requests.post(
+            url=f"{route_api}/bulk?mode=upsert&window=2",
+            data="\n".join(records),
+            headers={"Content-Type": "application/x-ndjson"},
+        )
+        assert response.status_code == 200
+        response_data = response.json()
+        assert response_data["received"] == 5
+        assert response_data["written"] == 3
+        assert response_data["failed"] == 2
+        assert [error["line"] for error in response_data["errors"]] == [4, 5]
+        assert response_data["errors"][0]["id"] == "route_test_bulk_invalid"
+
+        for document_id in document_ids:
+            doc_in_db = couchbase_client.get_document(
+                route_collection, key=document_id
+            ).content_as[dict]
+            assert doc_in_db == route_data
+            couchbase_client.delete_document(route_collection, key=document_id)
+
+    def test_bulk_ingest_invalid_parameters(self, route_api):
+        """Test loading routes with an invalid mode or window"""
+        for query in ("mode=replace", "window=0", "window=abc"):
+            response = requests.post(
+                url=f"{route_api}/bulk?{query}",
+                data="",
+                headers={"Content-Type": "application/x-ndjson"},
+            )
+            assert response.status_code == 400
@@ -0,0 +1,76 @@
+import pytest
+from benchmarks import dataset as synthetic
+from benchmarks.backend import InMemoryCouchbaseClient
+from api.airline import AIRLINES_TO_AIRPORT_QUERY
+from route_index import RouteIndex
+
+
+@pytest.fixture
+def client():
+    data = synthetic.generate(airlines=20, airports=10, routes=400, hotels=5)
+    client = InMemoryCouchbaseClient(data)
+    client.connect()
+    client.register_statement("airlines_to_airport", AIRLINES_TO_AIRPORT_QUERY)
+    return client
+
+
+@pytest.fixture
+def index(client):
+    index = RouteIndex()
+    index.load(client)
+    return index
+
+
+def busiest_airport(client) -> str:
+    """The airport most routes fly to"""
+    counts = {}
+    for route in client.dataset["route"].values():
+        airport = route["destinationairport"]
+        counts[airport] = counts.get(airport, 0) + 1
+    return max(counts, key=counts.get)
+
+
+def airline_names(client, ids: list) -> list:
+    return [client.dataset["airline"][id].get("name") for id in ids]
+
+
+class TestAirlinesTo:
+    def test_airlines_to_pages(self, client, index):
+        """Test that pages of airlines to an airport are in the query's name order"""
+        airport = busiest_airport(client)
+        expected = [
+            airline["name"]
+            for airline in client.query_statement(
+                "airlines_to_airport", airport=airport, limit=100, offset=0
+            )
+        ]
+        assert len(expected) > 4
+        pages = [index.airlines_to(airport, 3, offset) for offset in range(0, 100, 3)]
+        assert all(len(page) <= 3 for page in pages)
+        assert airline_names(client, sum(pages, [])) == expected
+
+    def test_airlines_to_follows_airline_writes(self, client, index):
+        """Test that renamed and deleted airlines move in or out of the order"""
+        airport = busiest_airport(client)
+        last = index.airlines_to(airport, 100, 0)[-1]
+        index.put_airline(last, {"name": ""})
+        assert index.airlines_to(airport, 1, 0) == [last]
+
+        index.remove_airline(last)
+        assert last not in index.airlines_to(airport, 100, 0)
+
+    def test_airlines_to_follows_route_writes(self, client, index):
+        """Test that a new route adds its airline to the destination"""
+        index.put_airline("airline_new", {"name": "AAA"})
+        assert index.airlines_to("NEW", 10, 0) == []
+        index.put_route(
+            "route_new",
+            {
+                "sourceairport": "OLD",
+                "destinationairport": "NEW",
+                "stops": 0,
+                "airlineid": "airline_new",
+                "distance": 100.0,
+            },
+        )
+        assert index.airlines_to("NEW", 10, 0) == ["airline_new"]
@@ -0,0 +1,94 @@
+import pytest
+from flask import Flask
+from flask_restx import Api, Namespace, Resource
+from api import serialization
+from api.airport import airport_model
+from api.serialization import serialize_list_with, serialize_with
+from api.streaming import stream_rows
+
+AIRPORTS = [
+    {
+        "airportname": "Zürich",
+        "city": "Zürich",
+        "country": "Switzerland",
+        "faa": "ZRH",
+        "geo": {"alt": 1416, "lat": 47.464722, "lon": 8.549167},
+        "icao": "LSZH",
+        "tz": "Europe/Zurich",
+    },
+    {
+        "airportname": "Sheremetyevo",
+        "city": "Москва",
+        "country": "Russia",
+        "faa": "SVO",
+        "icao": "UUEE",
+        "tz": "Europe/Moscow",
+    },
+    {"airportname": "Kraków – Balice", "city": "Kraków", "country": "Poland"},
+]
+
+
+@pytest.fixture
+def client(request):
+    """An app serving the airports through flask_restx and the compiled path"""
+    app = Flask(__name__)
+    app.debug = getattr(request, "param", False)
+    ns = Namespace("test")
+    ns.models[airport_model.name] = airport_model
+
+    @ns.route("/restx")
+    class Restx(Resource):
+        @ns.marshal_list_with(airport_model)
+        def get(self):
+            return AIRPORTS
+
+    @ns.route("/restx/<int:i>")
+    class RestxItem(Resource):
+        @ns.marshal_with(airport_model, skip_none=True)
+        def get(self, i):
+            return AIRPORTS[i]
+
+    @ns.route("/compiled")
+    class Compiled(Resource):
+        @serialize_list_with(ns, airport_model)
+        def get(self):
+            return AIRPORTS
+
+    @ns.route("/compiled/<int:i>")
+    class CompiledItem(Resource):
+        @serialize_with(ns, airport_model, skip_none=True)
+        def get(self, i):
+            return AIRPORTS[i]
+
+    @ns.route("/streamed")
+    class Streamed(Resource):
+        def get(self):
+            return stream_rows(AIRPORTS, airport_model, "json")
+
+    Api(app).add_namespace(ns, path="/")
+    return app.test_client()
+
+
+class TestSerialization:
+    @pytest.mark.parametrize("client", [False, True], indirect=True)
+    def test_same_bytes_as_restx(self, client):
+        """Test that non-ASCII documents are encoded to flask_restx's exact bytes"""
+        expected = client.get("/restx").data
+        assert b"Z\\u00fcrich" in expected
+        assert client.get("/compiled").data == expected
+        for i in range(len(AIRPORTS)):
+            assert client.get(f"/compiled/{i}").data == client.get(f"/restx/{i}").data
+
+    def test_streamed_same_bytes_as_restx(self, client):
+        """Test that a streamed list has the bytes of the marshalled one"""
+        assert client.get("/streamed").data == client.get("/restx").data
+
+    def test_orjson_opt_in(self, client, monkeypatch):
+        """Test that orjson, once enabled, encodes the same data"""
+        pytest.importorskip("orjson")
+        monkeypatch.setattr(serialization, "use_orjson", False)
+        assert serialization.enable_orjson()
+        body = client.get("/compiled").data
+        assert "Zürich".encode("utf-8") in body
+        assert client.get("/compiled").get_json() == client.get("/restx").get_json()
+        assert client.get("/streamed").data == body
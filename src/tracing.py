@@ -0,0 +1,223 @@
+import json
+import random
+import re
+import threading
+import time
+from collections import deque
+from contextvars import ContextVar
+from flask import Flask, request
+
+# W3C trace context header: version-trace id-parent span id-flags
+TRACEPARENT = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+
+# The innermost open span of the sampled request handled by this thread, if any
+_current_span = ContextVar("current_span", default=None)
+
+
+class Span(object):
+    """A timed operation within a trace, timed with time.perf_counter()"""
+
+    __slots__ = (
+        "name",
+        "trace",
+        "span_id",
+        "parent_id",
+        "start",
+        "end",
+        "attributes",
+    )
+
+    def __init__(self, name: str, trace, parent_id: str, start: float) -> None:
+        self.name = name
+        self.trace = trace
+        self.span_id = "%016x" % random.getrandbits(64)
+        self.parent_id = parent_id
+        self.start = start
+        self.end = None
+        self.attributes = {}
+
+    def to_dict(self, epoch: float) -> dict:
+        return {
+            "trace_id": self.trace.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start_time": epoch + self.start,
+            "duration_ms": (self.end - self.start) * 1000,
+            "attributes": self.attributes,
+        }
+
+
+class Trace(object):
+    """The spans of one sampled request, exported together when the root ends"""
+
+    __slots__ = ("trace_id", "spans")
+
+    def __init__(self, trace_id: str) -> None:
+        self.trace_id = trace_id
+        self.spans = []
+
+
+class InMemoryExporter(object):
+    """Keep the spans of the last max_size traces, for /api/v1/admin/traces"""
+
+    def __init__(self, max_size: int = 100) -> None:
+        self._traces = deque(maxlen=max_size)
+        self._lock = threading.Lock()
+
+    def export(self, spans: list) -> None:
+        with self._lock:
+            self._traces.append(spans)
+
+    def traces(self) -> list:
+        """The kept traces, newest first, each a list of spans"""
+        with self._lock:
+            return list(reversed(self._traces))
+
+
+class FileExporter(object):
+    """Append every span to a file as a line of JSON"""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, spans: list) -> None:
+        lines = "".join(json.dumps(span) + "\n" for span in spans)
+        with self._lock:
+            with open(self.path, "a") as f:
+                f.write(lines)
+
+
+class _NoSpan(object):
+    """Context manager returned for requests that are not sampled"""
+
+    def __enter__(self):
+        return None
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NO_SPAN = _NoSpan()
+
+
+class _OpenSpan(object):
+    """Context manager making a span the current one while it is open"""
+
+    __slots__ = ("span", "token")
+
+    def __init__(self, span: Span) -> None:
+        self.span = span
+
+    def __enter__(self) -> Span:
+        self.token = _current_span.set(self.span)
+        return self.span
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.span.end = time.perf_counter()
+        if exc_type is not None:
+            self.span.attributes["error"] = exc_type.__name__
+        self.span.trace.spans.append(self.span)
+        _current_span.reset(self.token)
+        return False
+
+
+class Tracer(object):
+    """Head-sampled request tracing with W3C traceparent propagation
+
+    A request is traced if its traceparent header says the caller sampled it,
+    or, without a sampled caller, with probability `sample_rate`. Requests that
+    are not traced only cost parsing the header, and their spans are no-ops.
+    The spans of a trace are handed to `exporter.export` as a list of dicts
+    when the request ends; any object with that method can be the exporter.
+    """
+
+    def __init__(self, sample_rate: float = 0.0, exporter=None) -> None:
+        self.sample_rate = sample_rate
+        self.exporter = exporter
+        # Converts time.perf_counter() values to Unix time
+        self.epoch = time.time() - time.perf_counter()
+
+    def span(self, name: str, **attributes):
+        """Context manager timing a child of the current span, if it is traced"""
+        parent = _current_span.get()
+        if parent is None:
+            return _NO_SPAN
+        span = Span(name, parent.trace, parent.span_id, time.perf_counter())
+        span.attributes.update(attributes)
+        return _OpenSpan(span)
+
+    def record(self, name: str, start: float, end: float, attributes: dict) -> None:
+        """Add an already finished child of the current span, if it is traced"""
+        parent = _current_span.get()
+        if parent is None:
+            return
+        span = Span(name, parent.trace, parent.span_id, start)
+        span.end = end
+        span.attributes = attributes
+        parent.trace.spans.append(span)
+
+    def start_request(self, traceparent: str = None):
+        """Start the root span of a request and return it with its response header
+
+        The span is None if the request is not sampled. Its name is left to the
+        caller, so it is only built for sampled requests.
+        """
+        match = TRACEPARENT.match(traceparent) if traceparent else None
+        if match is not None:
+            trace_id, parent_id, flags = match.groups()
+            sampled = int(flags, 16) & 1 == 1
+        else:
+            trace_id = "%032x" % random.getrandbits(128)
+            parent_id = None
+            sampled = self.sample_rate > 0 and random.random() < self.sample_rate
+        if not sampled or self.exporter is None:
+            span_id = "%016x" % random.getrandbits(64)
+            return None, f"00-{trace_id}-{span_id}-{'01' if sampled else '00'}"
+        span = Span(None, Trace(trace_id), parent_id, time.perf_counter())
+        return span, f"00-{trace_id}-{span.span_id}-01"
+
+    def instrument(self, app: Flask) -> None:
+        """Trace requests handled by the app and propagate their trace context"""
+        tracer = self
+
+        @app.before_request
+        def start_trace():
+            current = request._get_current_object()
+            environ = current.environ
+            span, header = tracer.start_request(environ.get("HTTP_TRACEPARENT"))
+            environ["tracing.traceparent"] = header
+            if span is not None:
+                rule = current.url_rule
+                route = rule.rule if rule is not None else "<unmatched>"
+                span.name = f"{current.method} {route}"
+                environ["tracing.span"] = span
+                environ["tracing.token"] = _current_span.set(span)
+
+        @app.after_request
+        def add_trace_header(response):
+            current = request._get_current_object()
+            header = current.environ.get("tracing.traceparent")
+            if header is not None:
+                response.headers["traceparent"] = header
+            span = current.environ.get("tracing.span")
+            if span is not None:
+                span.attributes["status"] = response.status_code
+            return response
+
+        @app.teardown_request
+        def end_trace(exc):
+            token = request.environ.pop("tracing.token", None)
+            if token is None:
+                return
+            span = request.environ.pop("tracing.span")
+            _current_span.reset(token)
+            span.end = time.perf_counter()
+            if exc is not None:
+                span.attributes["error"] = type(exc).__name__
+            spans = [span] + span.trace.spans
+            try:
+                tracer.exporter.export([s.to_dict(tracer.epoch) for s in spans])
+            except Exception as e:
+                print(f"Error exporting trace {span.trace.trace_id}: {e}")
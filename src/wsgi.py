@@ -0,0 +1,12 @@
+"""WSGI entry point for production servers.
+
+The application is created without connecting to the cluster, so it can be
+loaded once in a pre-fork server's master process. Each worker then connects
+with its own `CouchbaseClient` after fork, as done by gunicorn.conf.py:
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+"""
+
+from app import create_app
+
+app = create_app(start=False)